@@ -0,0 +1,233 @@
+"""
+Benchmark of the handling of large sample sheets.
+
+For every number of samples, a sample sheet (in the format written by
+juno_cgmlst.py, with a mix of genera that need one or more cgMLST schemes) is
+generated and the following steps are timed:
+
+* yaml_safe_load: loading the yaml sample sheet with the pure Python loader
+  (as the Snakefile used to do)
+* load_yaml: loading the yaml sample sheet with bin/sample_sheet.py
+* load_compact: loading the compact (json) sample sheet
+* samples_per_scheme: writing the list of samples per scheme
+* dag_build: 'snakemake --dryrun' of the pipeline with the compact sample
+  sheet. Only run if snakemake is installed.
+
+The DAG build time should grow (at most) linearly with the number of
+samples. The benchmark fails if the time of any of the steps that the
+pipeline runs (load_compact, samples_per_scheme and dag_build) grows more than
+(1 + tolerance) times faster than the number of samples between the smallest
+and the largest sample sheet. The yaml loaders are only timed as reference.
+
+Example:
+    python benchmarks/sample_sheet_scaling.py --samples 1000 10000 100000 \\
+        --output sample_sheet_scaling.tsv
+"""
+
+import argparse
+import csv
+from pathlib import Path
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Optional
+
+import yaml
+
+PIPELINE_DIR = Path(__file__).parent.parent.absolute()
+sys.path.insert(0, str(PIPELINE_DIR))
+from bin.sample_sheet import load_sample_sheet
+
+GENERA = ["salmonella", "listeria", "escherichia", "campylobacter", "stec"]
+RESULT_COLUMNS = ["step", "samples", "status", "wall_time_s", "us_per_sample"]
+# Steps that run in the pipeline and should scale linearly
+CHECKED_STEPS = ["load_compact", "samples_per_scheme", "dag_build"]
+
+
+def write_yaml_sample_sheet(sample_sheet: Path, num_samples: int) -> None:
+    with open(
+        PIPELINE_DIR.joinpath("files", "dictionary_correct_cgmlst_scheme.yaml")
+    ) as file_:
+        schemes_per_genus = yaml.safe_load(file_)
+    with open(sample_sheet, "w") as file_:
+        for sample_number in range(1, num_samples + 1):
+            genus = GENERA[sample_number % len(GENERA)]
+            schemes = "".join(f"  - {scheme}\n" for scheme in schemes_per_genus[genus])
+            file_.write(
+                f"sample{sample_number}:\n"
+                f"  assembly: /data/assemblies/sample{sample_number}.fasta\n"
+                f"  genus: {genus}\n"
+                f"  cgmlst_scheme:\n{schemes}"
+            )
+
+
+def timed(function: Callable[[], Any]) -> float:
+    start = time.perf_counter()
+    function()
+    return time.perf_counter() - start
+
+
+def dag_build_time(work_dir: Path, compact_sample_sheet: Path) -> Optional[float]:
+    if shutil.which("snakemake") is None:
+        return None
+    command = [
+        "snakemake",
+        "--snakefile",
+        str(PIPELINE_DIR.joinpath("Snakefile")),
+        "--directory",
+        str(work_dir),
+        "--dryrun",
+        "--quiet",
+        "--cores",
+        "1",
+        "--configfile",
+        str(PIPELINE_DIR.joinpath("config", "pipeline_parameters.yaml")),
+        "--config",
+        f"sample_sheet={compact_sample_sheet}",
+        f"compact_sample_sheet={compact_sample_sheet}",
+        f"out={work_dir.joinpath('output')}",
+        f"cgmlst_db={work_dir.joinpath('db')}",
+    ]
+    start = time.perf_counter()
+    subprocess.run(
+        command,
+        cwd=work_dir,
+        check=True,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    return time.perf_counter() - start
+
+
+def run_size(
+    work_dir: Path, num_samples: int, pure_python: bool
+) -> list[dict[str, Any]]:
+    print(f"Benchmarking a sample sheet with {num_samples} samples...")
+    size_dir = work_dir.joinpath(f"{num_samples}_samples")
+    size_dir.mkdir(parents=True, exist_ok=True)
+    yaml_sample_sheet = size_dir.joinpath("sample_sheet.yaml")
+    compact_sample_sheet = size_dir.joinpath("sample_sheet.json")
+    write_yaml_sample_sheet(yaml_sample_sheet, num_samples)
+    load_sample_sheet(yaml_sample_sheet).write(compact_sample_sheet)
+
+    timings: dict[str, Optional[float]] = {}
+    if pure_python:
+
+        def yaml_safe_load() -> None:
+            with open(yaml_sample_sheet) as file_:
+                yaml.safe_load(file_)
+
+        timings["yaml_safe_load"] = timed(yaml_safe_load)
+    timings["load_yaml"] = timed(lambda: load_sample_sheet(yaml_sample_sheet))
+    timings["load_compact"] = timed(lambda: load_sample_sheet(compact_sample_sheet))
+    sample_sheet = load_sample_sheet(compact_sample_sheet)
+    timings["samples_per_scheme"] = timed(
+        lambda: sample_sheet.write_samples_per_scheme(size_dir)
+    )
+    timings["dag_build"] = dag_build_time(size_dir, compact_sample_sheet)
+
+    results = []
+    for step, wall_time in timings.items():
+        if wall_time is None:
+            results.append(
+                {
+                    "step": step,
+                    "samples": num_samples,
+                    "status": "skipped (snakemake not found)",
+                }
+            )
+            continue
+        results.append(
+            {
+                "step": step,
+                "samples": num_samples,
+                "status": "ok",
+                "wall_time_s": round(wall_time, 4),
+                "us_per_sample": round(wall_time / num_samples * 1e6, 2),
+            }
+        )
+    return results
+
+
+def superlinear_steps(results: list[dict[str, Any]], tolerance: float) -> list[str]:
+    """Steps whose time grew faster than the number of samples between the
+    smallest and the largest sample sheet"""
+    growths = []
+    for step in CHECKED_STEPS:
+        rows = sorted(
+            (row for row in results if row["step"] == step and row["status"] == "ok"),
+            key=lambda row: row["samples"],
+        )
+        if len(rows) < 2 or rows[0]["wall_time_s"] == 0:
+            continue
+        sample_growth = rows[-1]["samples"] / rows[0]["samples"]
+        time_growth = rows[-1]["wall_time_s"] / rows[0]["wall_time_s"]
+        if time_growth > sample_growth * (1 + tolerance):
+            growths.append(
+                f"{step}: {time_growth:.1f}x slower for {sample_growth:.1f}x more samples"
+            )
+    return growths
+
+
+def main() -> None:
+    argument_parser = argparse.ArgumentParser(
+        description="Benchmark of the loading of large sample sheets and of the DAG build time.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    argument_parser.add_argument(
+        "--samples", type=int, nargs="+", default=[1000, 10000, 50000]
+    )
+    argument_parser.add_argument(
+        "--no-pure-python",
+        dest="pure_python",
+        action="store_false",
+        help="Do not time the pure Python yaml loader (slow for large sample sheets).",
+    )
+    argument_parser.add_argument(
+        "-w",
+        "--work-dir",
+        type=Path,
+        default=None,
+        help="Directory for the sample sheets. A temporary directory is used (and removed) if not given.",
+    )
+    argument_parser.add_argument(
+        "-o", "--output", type=Path, default=Path("sample_sheet_scaling.tsv")
+    )
+    argument_parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.5,
+        help="Allowed growth of the time above linear growth (fraction).",
+    )
+    args = argument_parser.parse_args()
+
+    work_dir = args.work_dir or Path(
+        tempfile.mkdtemp(prefix="juno_cgmlst_sample_sheet_benchmark_")
+    )
+    results = []
+    try:
+        for num_samples in sorted(args.samples):
+            results.extend(run_size(work_dir, num_samples, args.pure_python))
+    finally:
+        if args.work_dir is None:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    with open(args.output, "w") as file_:
+        writer = csv.DictWriter(
+            file_, fieldnames=RESULT_COLUMNS, delimiter="\t", restval="NA"
+        )
+        writer.writeheader()
+        writer.writerows(results)
+    for row in results:
+        print("\t".join(str(row.get(column, "NA")) for column in RESULT_COLUMNS))
+    print(f"Results written to {args.output}")
+
+    growths = superlinear_steps(results, args.tolerance)
+    if growths:
+        sys.exit("Steps growing faster than linearly:\n" + "\n".join(growths))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,415 @@
+"""
+End-to-end scaling benchmark of Juno-cgMLST on synthetic data.
+
+For every combination of number of samples and number of loci, a synthetic
+scheme and synthetic assemblies are generated (see synthetic_data.py) and the
+following stages of the pipeline are timed, running the same code as the
+pipeline does:
+
+* sample_listing: writing the lists of samples per batch
+  (chewbbaca_input_files.py)
+* cds_prediction: predicting the CDSs of the assemblies with the CDS cache
+  (bin/cds_cache.py). Only run if pyrodigal is installed.
+* scheme_preparation: chewBBACA PrepExternalSchema, with a Prodigal training
+  file trained on the synthetic assemblies
+* allele_calling: bin/chewbbaca_per_genus.sh (chewBBACA AlleleCall with
+  --hash-profiles and the registration of novel alleles). The hashing of the
+  profiles is done by AlleleCall itself, so it is part of this stage and not
+  measured on its own. The durations of its stages, parsed from the timing markers in its output, are reported as
+  allele_calling:<stage> (wall time only). Only run if chewBBACA.py is
+  installed, otherwise the truth table is used as result of the allele
+  calling for the next stage.
+* result_merging: merging the result tables of the batches of a scheme
+  (priority_batches.merge_tables)
+
+The wall time, peak memory and throughput (samples and sample-loci per
+second) of every stage are written to a tsv file. The peak memory of the
+stages that run as a separate process is the maximum resident set size of
+that process (and its children), measured for every process on its own. If a
+baseline file (from a previous run of this benchmark) is given, the benchmark
+fails when the throughput of any stage dropped more than the given
+tolerance.
+
+Example:
+    python benchmarks/scaling_benchmark.py --samples 10 100 --loci 100 1000 \\
+        --output scaling.tsv --baseline previous_scaling.tsv
+"""
+
+import argparse
+import csv
+import importlib.util
+import os
+from pathlib import Path
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable, Optional
+
+PIPELINE_DIR = Path(__file__).parent.parent.absolute()
+sys.path.insert(0, str(PIPELINE_DIR))
+from benchmarks import synthetic_data
+from bin import chewbbaca_input_files
+from bin.priority_batches import merge_tables
+from bin.run_report import parse_stage_timings
+
+SCHEME_NAME = "synthetic"
+RESULT_COLUMNS = [
+    "stage",
+    "samples",
+    "loci",
+    "status",
+    "wall_time_s",
+    "peak_memory_mb",
+    "samples_per_s",
+    "sample_loci_per_s",
+]
+
+
+def train_prodigal(assemblies: list[Path], training_file: Path) -> None:
+    """Train Prodigal on (the first) synthetic assemblies, as the training
+    files in files/prodigal_training_files are made for real genera"""
+    import pyrodigal
+
+    sequences = []
+    for assembly in assemblies[:10]:
+        with open(assembly) as file_:
+            sequences.append(
+                "".join(line.strip() for line in file_ if not line.startswith(">"))
+            )
+    gene_finder = pyrodigal.GeneFinder()
+    gene_finder.train("".join(sequences).encode())
+    with open(training_file, "wb") as file_:
+        gene_finder.training_info.dump(file_)
+
+
+def split_result_table(
+    results_table: Path, output_dir: Path, num_chunks: int
+) -> list[Path]:
+    with open(results_table) as file_:
+        header = file_.readline()
+        rows = file_.readlines()
+    chunk_size = max(len(rows) // num_chunks, 1)
+    tables = []
+    for chunk_number, start in enumerate(range(0, len(rows), chunk_size)):
+        table = output_dir.joinpath(f"chunk{chunk_number}_results_alleles.tsv")
+        with open(table, "w") as file_:
+            file_.write(header)
+            file_.writelines(rows[start : start + chunk_size])
+        tables.append(table)
+    return tables
+
+
+def measure(
+    stage: str, num_samples: int, num_loci: int, function: Callable[[], Any]
+) -> dict[str, Any]:
+    """Run one stage in this process and measure its wall time and peak
+    (Python) memory"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    function()
+    wall_time = time.perf_counter() - start
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result_row(stage, num_samples, num_loci, wall_time, peak_memory / 1e6)
+
+
+def measure_command(
+    stage: str,
+    num_samples: int,
+    num_loci: int,
+    command: list[str],
+    cwd: Path,
+    log_file: Optional[Path] = None,
+) -> dict[str, Any]:
+    """Run one stage as a subprocess and measure its wall time and peak
+    memory. The peak memory is the maximum resident set size of this child
+    process (and the processes it waited for), not the maximum of all the
+    children of the benchmark so far"""
+    start = time.perf_counter()
+    with open(log_file or os.devnull, "w") as log:
+        process = subprocess.Popen(
+            command, cwd=cwd, stdout=log, stderr=subprocess.STDOUT
+        )
+        _, status, rusage = os.wait4(process.pid, 0)
+    wall_time = time.perf_counter() - start
+    process.returncode = os.waitstatus_to_exitcode(status)
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, command)
+    # ru_maxrss is given in kilobytes in Linux
+    return result_row(stage, num_samples, num_loci, wall_time, rusage.ru_maxrss / 1e3)
+
+
+def skipped_row(
+    stage: str, num_samples: int, num_loci: int, reason: str
+) -> dict[str, Any]:
+    return {
+        "stage": stage,
+        "samples": num_samples,
+        "loci": num_loci,
+        "status": f"skipped ({reason})",
+    }
+
+
+def result_row(
+    stage: str, num_samples: int, num_loci: int, wall_time: float, peak_memory_mb: float
+) -> dict[str, Any]:
+    return {
+        "stage": stage,
+        "samples": num_samples,
+        "loci": num_loci,
+        "status": "ok",
+        "wall_time_s": round(wall_time, 4),
+        "peak_memory_mb": round(peak_memory_mb, 2),
+        "samples_per_s": round(num_samples / wall_time, 2) if wall_time else None,
+        "sample_loci_per_s": round(num_samples * num_loci / wall_time, 2)
+        if wall_time
+        else None,
+    }
+
+
+def run_scale(
+    work_dir: Path,
+    num_samples: int,
+    num_loci: int,
+    num_alleles: int,
+    threads: int,
+    num_chunks: int,
+) -> list[dict[str, Any]]:
+    print(f"Benchmarking {num_samples} samples and {num_loci} loci...")
+    scale_dir = work_dir.joinpath(f"{num_samples}_samples_{num_loci}_loci")
+    db_dir = scale_dir.joinpath("db")
+    scheme_dir = db_dir.joinpath("downloaded_schemes", SCHEME_NAME)
+    prepared_scheme = db_dir.joinpath("prepared_schemes", SCHEME_NAME)
+    assemblies_dir = scale_dir.joinpath("assemblies")
+    cgmlst_dir = scale_dir.joinpath("cgmlst")
+    cgmlst_dir.mkdir(parents=True, exist_ok=True)
+    scheme = synthetic_data.make_scheme(scheme_dir, num_loci, num_alleles)
+    truth_table = synthetic_data.make_assemblies(assemblies_dir, scheme, num_samples)
+    sample_sheet = scale_dir.joinpath("sample_sheet.yaml")
+    synthetic_data.write_sample_sheet(
+        sample_sheet, assemblies_dir, SCHEME_NAME, num_samples
+    )
+    input_files = cgmlst_dir.joinpath(SCHEME_NAME, "normal_1_samples.txt")
+
+    results = [
+        measure(
+            "sample_listing",
+            num_samples,
+            num_loci,
+            lambda: chewbbaca_input_files.inputChewBBACA(
+                sample_sheet=str(sample_sheet), output_dir=str(cgmlst_dir)
+            ).make_files_with_samples_per_batch({"normal": 0}, "normal"),
+        )
+    ]
+
+    cds_files = cgmlst_dir.joinpath(SCHEME_NAME, "normal_1_cds_samples.txt")
+    training_file = scale_dir.joinpath(f"{SCHEME_NAME}.trn")
+    if importlib.util.find_spec("pyrodigal") is None:
+        results.append(
+            skipped_row("cds_prediction", num_samples, num_loci, "pyrodigal not found")
+        )
+    else:
+        train_prodigal(sorted(assemblies_dir.glob("*.fasta")), training_file)
+        results.append(
+            measure_command(
+                "cds_prediction",
+                num_samples,
+                num_loci,
+                [
+                    sys.executable,
+                    str(PIPELINE_DIR.joinpath("bin", "cds_cache.py")),
+                    "--input-files",
+                    str(input_files),
+                    "--training-file",
+                    str(training_file),
+                    "--cache-dir",
+                    str(cgmlst_dir.joinpath("cds_cache")),
+                    "--link-dir",
+                    str(cgmlst_dir.joinpath("cds_input", SCHEME_NAME)),
+                    "--output",
+                    str(cds_files),
+                    "--threads",
+                    str(threads),
+                ],
+                cwd=scale_dir,
+            )
+        )
+
+    results_table = truth_table
+    if shutil.which("chewBBACA.py") is None or not cds_files.is_file():
+        reason = (
+            "chewBBACA.py not found"
+            if shutil.which("chewBBACA.py") is None
+            else "no predicted CDSs"
+        )
+        for stage in ["scheme_preparation", "allele_calling"]:
+            results.append(skipped_row(stage, num_samples, num_loci, reason))
+    else:
+        results.append(
+            measure_command(
+                "scheme_preparation",
+                num_samples,
+                num_loci,
+                [
+                    "chewBBACA.py",
+                    "PrepExternalSchema",
+                    "-i",
+                    str(scheme_dir),
+                    "--output-directory",
+                    str(prepared_scheme),
+                    "--cpu",
+                    str(threads),
+                    "--ptf",
+                    str(training_file),
+                ],
+                cwd=scale_dir,
+            )
+        )
+        # chewbbaca_per_genus.sh only prepares schemes without <scheme>.trn
+        if not prepared_scheme.joinpath(training_file.name).is_file():
+            shutil.copyfile(training_file, prepared_scheme.joinpath(training_file.name))
+        allele_call_dir = scale_dir.joinpath("allele_call")
+        log_file = scale_dir.joinpath("allele_call.log")
+        results.append(
+            measure_command(
+                "allele_calling",
+                num_samples,
+                num_loci,
+                [
+                    "bash",
+                    str(PIPELINE_DIR.joinpath("bin", "chewbbaca_per_genus.sh")),
+                    str(cds_files),
+                    str(threads),
+                    str(allele_call_dir),
+                    str(db_dir),
+                    SCHEME_NAME,
+                ],
+                cwd=scale_dir,
+                log_file=log_file,
+            )
+        )
+        for stage, seconds in parse_stage_timings(log_file).items():
+            row = result_row(
+                f"allele_calling:{stage}", num_samples, num_loci, seconds, 0
+            )
+            row["peak_memory_mb"] = None
+            results.append(row)
+        results_table = allele_call_dir.joinpath("results_alleles.tsv")
+
+    chunk_tables = split_result_table(results_table, scale_dir, num_chunks)
+    results.append(
+        measure(
+            "result_merging",
+            num_samples,
+            num_loci,
+            lambda: merge_tables(
+                chunk_tables, scale_dir.joinpath("merged_results_alleles.tsv")
+            ),
+        )
+    )
+    return results
+
+
+def compare_to_baseline(
+    results: list[dict[str, Any]], baseline_file: Path, tolerance: float
+) -> list[str]:
+    """Return the stages whose throughput dropped more than the tolerance
+    compared to the baseline"""
+    with open(baseline_file) as file_:
+        baseline = {
+            (row["stage"], row["samples"], row["loci"]): row
+            for row in csv.DictReader(file_, delimiter="\t")
+        }
+    regressions = []
+    for row in results:
+        key = (row["stage"], str(row["samples"]), str(row["loci"]))
+        if row["status"] != "ok" or key not in baseline or not row["samples_per_s"]:
+            continue
+        try:
+            baseline_throughput = float(baseline[key]["samples_per_s"])
+        except ValueError:
+            continue
+        if row["samples_per_s"] < baseline_throughput * (1 - tolerance):
+            regressions.append(
+                f"{row['stage']} ({row['samples']} samples, {row['loci']} loci): "
+                f"{row['samples_per_s']} samples/s (baseline {baseline_throughput})"
+            )
+    return regressions
+
+
+def main() -> None:
+    argument_parser = argparse.ArgumentParser(
+        description="Scaling benchmark of Juno-cgMLST on synthetic schemes and assemblies.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    argument_parser.add_argument("--samples", type=int, nargs="+", default=[10, 100])
+    argument_parser.add_argument("--loci", type=int, nargs="+", default=[100, 1000])
+    argument_parser.add_argument("--alleles", type=int, default=10)
+    argument_parser.add_argument(
+        "--chunks", type=int, default=4, help="Number of result tables to merge."
+    )
+    argument_parser.add_argument("-t", "--threads", type=int, default=4)
+    argument_parser.add_argument(
+        "-w",
+        "--work-dir",
+        type=Path,
+        default=None,
+        help="Directory for the synthetic data. A temporary directory is used (and removed) if not given.",
+    )
+    argument_parser.add_argument(
+        "-o", "--output", type=Path, default=Path("scaling_benchmark.tsv")
+    )
+    argument_parser.add_argument(
+        "--baseline",
+        type=Path,
+        default=None,
+        help="Results of a previous run to compare with.",
+    )
+    argument_parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.2,
+        help="Maximum allowed drop in throughput (fraction) compared to the baseline.",
+    )
+    args = argument_parser.parse_args()
+
+    work_dir = args.work_dir or Path(tempfile.mkdtemp(prefix="juno_cgmlst_benchmark_"))
+    results = []
+    try:
+        for num_loci in args.loci:
+            for num_samples in args.samples:
+                results.extend(
+                    run_scale(
+                        work_dir,
+                        num_samples,
+                        num_loci,
+                        args.alleles,
+                        args.threads,
+                        args.chunks,
+                    )
+                )
+    finally:
+        if args.work_dir is None:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    with open(args.output, "w") as file_:
+        writer = csv.DictWriter(
+            file_, fieldnames=RESULT_COLUMNS, delimiter="\t", restval="NA"
+        )
+        writer.writeheader()
+        writer.writerows(results)
+    for row in results:
+        print("\t".join(str(row.get(column, "NA")) for column in RESULT_COLUMNS))
+    print(f"Results written to {args.output}")
+
+    if args.baseline is not None:
+        regressions = compare_to_baseline(results, args.baseline, args.tolerance)
+        if regressions:
+            sys.exit("Throughput regressions found:\n" + "\n".join(regressions))
+
+
+if __name__ == "__main__":
+    main()
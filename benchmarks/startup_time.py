@@ -0,0 +1,114 @@
+"""
+Benchmark of the start-up time of the Juno-cgMLST command line interface.
+
+It measures the wall time of 'python juno_cgmlst.py --help' (or any other
+arguments, e.g. a dry-run) and lists the heavyweight modules that are loaded
+just by importing juno_cgmlst.py. The results can be appended to a tsv file
+to follow the start-up time between versions.
+
+Example:
+    python benchmarks/startup_time.py --repeats 10 --output startup_times.tsv
+"""
+
+import argparse
+from datetime import datetime
+from pathlib import Path
+import statistics
+import subprocess
+import sys
+import time
+
+PIPELINE_DIR = Path(__file__).parent.parent.absolute()
+# Modules that should only be imported when a scheme is actually downloaded
+HEAVY_MODULES = ["dask", "bs4", "requests"]
+
+
+def time_command(command: list[str], repeats: int) -> list[float]:
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        subprocess.run(
+            command,
+            cwd=PIPELINE_DIR,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            check=False,
+        )
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def heavy_modules_loaded_at_import() -> list[str]:
+    """Import juno_cgmlst in a fresh interpreter and return the heavyweight
+    modules that got imported as a side effect"""
+    check = (
+        "import sys; import juno_cgmlst; "
+        f"print(' '.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", check],
+        cwd=PIPELINE_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return result.stdout.split()
+
+
+def main() -> None:
+    argument_parser = argparse.ArgumentParser(
+        description="Measure the start-up time of juno_cgmlst.py.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    argument_parser.add_argument(
+        "-r", "--repeats", type=int, default=5, help="Number of measurements."
+    )
+    argument_parser.add_argument(
+        "-a",
+        "--cli-args",
+        nargs="+",
+        default=["--help"],
+        help="Arguments passed to juno_cgmlst.py (e.g. a full --dryrun command).",
+    )
+    argument_parser.add_argument(
+        "-o",
+        "--output",
+        type=Path,
+        default=None,
+        help="Tsv file where the result is appended.",
+    )
+    argument_parser.add_argument(
+        "--max-seconds",
+        type=float,
+        default=None,
+        help="Exit with an error if the median start-up time is above this value.",
+    )
+    args = argument_parser.parse_args()
+
+    command = [sys.executable, "juno_cgmlst.py", *args.cli_args]
+    timings = time_command(command, args.repeats)
+    median = statistics.median(timings)
+    heavy_modules = heavy_modules_loaded_at_import()
+    print(f"Command: {' '.join(command)}")
+    print(f"Median: {median:.3f}s  Min: {min(timings):.3f}s  Max: {max(timings):.3f}s")
+    print(f"Heavyweight modules loaded at import: {', '.join(heavy_modules) or 'none'}")
+
+    if args.output is not None:
+        write_header = not args.output.is_file()
+        with open(args.output, "a") as file_:
+            if write_header:
+                file_.write("date\tcommand\trepeats\tmedian_s\tmin_s\theavy_modules\n")
+            file_.write(
+                f"{datetime.now().strftime('%d-%m-%Y %H:%M:%S')}\t{' '.join(args.cli_args)}\t"
+                f"{args.repeats}\t{median:.4f}\t{min(timings):.4f}\t{','.join(heavy_modules)}\n"
+            )
+    if heavy_modules:
+        sys.exit(f"Importing juno_cgmlst.py should not load {', '.join(heavy_modules)}")
+    if args.max_seconds is not None and median > args.max_seconds:
+        sys.exit(
+            f"The median start-up time ({median:.3f}s) is above {args.max_seconds}s"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""
+Generator of synthetic cgMLST schemes and assemblies with a known allele
+content, used by the benchmarks of the pipeline.
+
+The schemes have one fasta file per locus in the same style as
+tests/example_input/locusx.fasta (>locusx_1, >locusx_2...). Every allele is
+a valid coding sequence (start codon, no internal stop codons and a stop
+codon at the end) so that chewBBACA can use the scheme. The assemblies are
+made by concatenating one allele per locus with random intergenic regions and
+the alleles that were used are written to a truth table with the same format
+as the results_alleles.tsv made by chewBBACA.
+
+Example:
+    python benchmarks/synthetic_data.py --loci 100 --alleles 10 --samples 20 -o synthetic
+"""
+
+import argparse
+from pathlib import Path
+import random
+from typing import Optional
+
+NUCLEOTIDES = "ACGT"
+STOP_CODONS = ["TAA", "TAG", "TGA"]
+SENSE_CODONS = [
+    a + b + c
+    for a in NUCLEOTIDES
+    for b in NUCLEOTIDES
+    for c in NUCLEOTIDES
+    if a + b + c not in STOP_CODONS
+]
+MISSING_LABEL = "LNF"
+
+
+def random_cds(rng: random.Random, num_codons: int) -> str:
+    return (
+        "ATG"
+        + "".join(rng.choice(SENSE_CODONS) for _ in range(num_codons - 2))
+        + rng.choice(STOP_CODONS)
+    )
+
+
+def mutate_cds(rng: random.Random, cds: str, num_mutations: int) -> str:
+    """Replace some of the internal codons of a CDS by other sense codons"""
+    codons = [cds[i : i + 3] for i in range(0, len(cds), 3)]
+    for _ in range(num_mutations):
+        position = rng.randrange(1, len(codons) - 1)
+        codons[position] = rng.choice(SENSE_CODONS)
+    return "".join(codons)
+
+
+def make_scheme(
+    output_dir: Path,
+    num_loci: int,
+    num_alleles: int,
+    locus_length: int = 900,
+    seed: int = 1,
+) -> dict[str, list[str]]:
+    """Write a scheme with num_loci loci and num_alleles (unique) alleles per
+    locus and return a dictionary with the allele sequences per locus"""
+    rng = random.Random(seed)
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    scheme: dict[str, list[str]] = {}
+    for locus_number in range(1, num_loci + 1):
+        locus = f"locus{locus_number}"
+        reference = random_cds(rng, locus_length // 3)
+        alleles = [reference]
+        while len(alleles) < num_alleles:
+            allele = mutate_cds(rng, reference, num_mutations=rng.randint(1, 5))
+            if allele not in alleles:
+                alleles.append(allele)
+        scheme[locus] = alleles
+        with open(output_dir.joinpath(locus + ".fasta"), "w") as file_:
+            for allele_number, allele in enumerate(alleles, start=1):
+                file_.write(f">{locus}_{allele_number}\n{allele}\n")
+    return scheme
+
+
+def make_assemblies(
+    output_dir: Path,
+    scheme: dict[str, list[str]],
+    num_samples: int,
+    missing_fraction: float = 0.01,
+    num_contigs: int = 5,
+    intergenic_length: int = 150,
+    seed: int = 1,
+) -> Path:
+    """Write one assembly per sample containing one (random) allele of every
+    locus of the scheme, except for a fraction of missing loci. The alleles
+    used per sample are written to truth_alleles.tsv, which is returned"""
+    rng = random.Random(seed)
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    loci = list(scheme)
+    truth_file = output_dir.joinpath("truth_alleles.tsv")
+    with open(truth_file, "w") as truth:
+        truth.write("\t".join(["FILE", *[locus + ".fasta" for locus in loci]]) + "\n")
+        for sample_number in range(1, num_samples + 1):
+            sample = f"sample{sample_number}"
+            profile = []
+            pieces = []
+            for locus in loci:
+                if rng.random() < missing_fraction:
+                    profile.append(MISSING_LABEL)
+                    continue
+                allele_number = rng.randrange(len(scheme[locus]))
+                profile.append(str(allele_number + 1))
+                pieces.append(scheme[locus][allele_number])
+                pieces.append(
+                    "".join(rng.choice(NUCLEOTIDES) for _ in range(intergenic_length))
+                )
+            contig_size = max(len(pieces) // num_contigs, 1)
+            with open(output_dir.joinpath(sample + ".fasta"), "w") as file_:
+                for contig_number, start in enumerate(
+                    range(0, len(pieces), contig_size), start=1
+                ):
+                    contig = "".join(pieces[start : start + contig_size])
+                    file_.write(f">{sample}_contig{contig_number}\n{contig}\n")
+            truth.write("\t".join([sample, *profile]) + "\n")
+    return truth_file
+
+
+def write_sample_sheet(
+    sample_sheet: Path, assemblies_dir: Path, scheme_name: str, num_samples: int
+) -> None:
+    """Write a sample sheet in the format made by juno_cgmlst.py for the
+    synthetic assemblies"""
+    with open(sample_sheet, "w") as file_:
+        for sample_number in range(1, num_samples + 1):
+            sample = f"sample{sample_number}"
+            assembly = Path(assemblies_dir).absolute().joinpath(sample + ".fasta")
+            file_.write(
+                f"{sample}:\n  assembly: {assembly}\n  cgmlst_scheme:\n  - {scheme_name}\n"
+            )
+
+
+def main(args: Optional[list[str]] = None) -> None:
+    argument_parser = argparse.ArgumentParser(
+        description="Make a synthetic cgMLST scheme and assemblies with known alleles.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    argument_parser.add_argument(
+        "-o", "--output-dir", type=Path, default=Path("synthetic_data")
+    )
+    argument_parser.add_argument("--loci", type=int, default=100)
+    argument_parser.add_argument("--alleles", type=int, default=10)
+    argument_parser.add_argument("--samples", type=int, default=10)
+    argument_parser.add_argument("--locus-length", type=int, default=900)
+    argument_parser.add_argument("--missing-fraction", type=float, default=0.01)
+    argument_parser.add_argument("--seed", type=int, default=1)
+    parsed_args = argument_parser.parse_args(args)
+    scheme = make_scheme(
+        parsed_args.output_dir.joinpath("scheme"),
+        num_loci=parsed_args.loci,
+        num_alleles=parsed_args.alleles,
+        locus_length=parsed_args.locus_length,
+        seed=parsed_args.seed,
+    )
+    truth_file = make_assemblies(
+        parsed_args.output_dir.joinpath("assemblies"),
+        scheme,
+        num_samples=parsed_args.samples,
+        missing_fraction=parsed_args.missing_fraction,
+        seed=parsed_args.seed,
+    )
+    print(f"Synthetic scheme and assemblies written. Expected alleles in {truth_file}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+import argparse
+import csv
+from pathlib import Path
+from typing import Generator, TextIO
+
+import numpy as np
+import numpy.typing as npt
+
+# Classifications of chewBBACA (v3) for loci that were not (exactly) called
+CLASSES = ["LNF", "PLOT3", "PLOT5", "LOTSC", "ASM", "ALM", "NIPH", "NIPHEM", "PAMA"]
+COUNT_COLUMNS = ["called", *CLASSES]
+
+
+def read_chunks(
+    table: TextIO, chunk_size: int
+) -> Generator[tuple[list[str], npt.NDArray[np.str_]], None, None]:
+    """Yield the sample names and the allele calls of chunk_size samples at
+    a time so the memory used does not depend on the number of samples"""
+    reader = csv.reader(table, delimiter="\t")
+    samples: list[str] = []
+    rows: list[list[str]] = []
+    for row in reader:
+        if not row:
+            continue
+        samples.append(row[0])
+        rows.append(row[1:])
+        if len(rows) == chunk_size:
+            yield samples, np.array(rows, dtype=str)
+            samples, rows = [], []
+    if rows:
+        yield samples, np.array(rows, dtype=str)
+
+
+def count_classes(
+    calls: npt.NDArray[np.str_], axis: int
+) -> dict[str, npt.NDArray[np.int64]]:
+    """Count the called loci (exact or inferred alleles) and every chewBBACA
+    class along one axis of a chunk of allele calls"""
+    called = np.char.isdigit(calls) | np.char.startswith(calls, "INF-")
+    counts = {"called": called.sum(axis=axis)}
+    for class_ in CLASSES:
+        counts[class_] = (calls == class_).sum(axis=axis)
+    return counts
+
+
+class AlleleCallQC:
+    """
+    Quality control of the allele calling of a scheme. It streams through a
+    chewBBACA results table (results_alleles.tsv) in chunks of samples and
+    counts, per sample and per locus, the called loci and the different
+    classes of missing/problematic loci (LNF, PLOT3, PLOT5, ASM, ALM, NIPH...).
+    Samples with too many missing loci and loci that are missing in too many
+    samples are flagged.
+    """
+
+    def __init__(
+        self,
+        results_table: Path,
+        output_dir: Path,
+        max_missing_fraction_sample: float = 0.05,
+        min_called_fraction_locus: float = 0.95,
+        chunk_size: int = 500,
+    ) -> None:
+        self.results_table = Path(results_table)
+        assert (
+            self.results_table.is_file()
+        ), f"The provided results table {str(self.results_table)} does not exist."
+        self.output_dir = Path(output_dir)
+        self.max_missing_fraction_sample = max_missing_fraction_sample
+        self.min_called_fraction_locus = min_called_fraction_locus
+        self.chunk_size = chunk_size
+
+    def run(self) -> None:
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        num_samples = 0
+        with open(self.results_table) as table, open(
+            self.output_dir.joinpath("qc_per_sample.tsv"), "w"
+        ) as sample_file:
+            loci = table.readline().rstrip("\n").split("\t")[1:]
+            locus_counts = {
+                column: np.zeros(len(loci), dtype=np.int64) for column in COUNT_COLUMNS
+            }
+            sample_writer = csv.writer(sample_file, delimiter="\t", lineterminator="\n")
+            sample_writer.writerow(["sample", *COUNT_COLUMNS, "called_fraction", "qc"])
+            for samples, calls in read_chunks(table, self.chunk_size):
+                num_samples += len(samples)
+                sample_counts = count_classes(calls, axis=1)
+                for column, counts in count_classes(calls, axis=0).items():
+                    locus_counts[column] += counts
+                called_fraction = sample_counts["called"] / len(loci)
+                passed = (1 - called_fraction) <= self.max_missing_fraction_sample
+                for index, sample in enumerate(samples):
+                    sample_writer.writerow(
+                        [
+                            sample,
+                            *[sample_counts[column][index] for column in COUNT_COLUMNS],
+                            f"{called_fraction[index]:.4f}",
+                            "PASS" if passed[index] else "FAIL",
+                        ]
+                    )
+        self.num_samples = num_samples
+        self.__write_locus_qc(loci, locus_counts)
+
+    def __write_locus_qc(
+        self, loci: list[str], locus_counts: dict[str, npt.NDArray[np.int64]]
+    ) -> None:
+        called_fraction = locus_counts["called"] / max(self.num_samples, 1)
+        passed = called_fraction >= self.min_called_fraction_locus
+        with open(self.output_dir.joinpath("qc_per_locus.tsv"), "w") as locus_file:
+            locus_writer = csv.writer(locus_file, delimiter="\t", lineterminator="\n")
+            locus_writer.writerow(["locus", *COUNT_COLUMNS, "called_fraction", "qc"])
+            for index, locus in enumerate(loci):
+                locus_writer.writerow(
+                    [
+                        locus,
+                        *[locus_counts[column][index] for column in COUNT_COLUMNS],
+                        f"{called_fraction[index]:.4f}",
+                        "PASS" if passed[index] else "FAIL",
+                    ]
+                )
+
+
+if __name__ == "__main__":
+    argument_parser = argparse.ArgumentParser(
+        description="Quality control (per sample and per locus) of the chewBBACA allele calling results."
+    )
+    argument_parser.add_argument(
+        "-i",
+        "--input",
+        type=Path,
+        required=True,
+        help="Results table made by chewBBACA (results_alleles.tsv).",
+    )
+    argument_parser.add_argument(
+        "-o",
+        "--output-dir",
+        type=Path,
+        required=True,
+        help="Output directory where qc_per_sample.tsv and qc_per_locus.tsv will be written.",
+    )
+    argument_parser.add_argument(
+        "--max-missing-fraction-sample",
+        type=float,
+        default=0.05,
+        help="Maximum fraction of loci that can be missing (not called) in a sample to pass the QC.",
+    )
+    argument_parser.add_argument(
+        "--min-called-fraction-locus",
+        type=float,
+        default=0.95,
+        help="Minimum fraction of samples in which a locus must be called to pass the QC.",
+    )
+    argument_parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=500,
+        help="Number of samples read at a time.",
+    )
+    args = argument_parser.parse_args()
+    AlleleCallQC(
+        results_table=args.input,
+        output_dir=args.output_dir,
+        max_missing_fraction_sample=args.max_missing_fraction_sample,
+        min_called_fraction_locus=args.min_called_fraction_locus,
+        chunk_size=args.chunk_size,
+    ).run()
@@ -0,0 +1,218 @@
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import fcntl
+import hashlib
+import os
+from pathlib import Path
+from typing import Generator, Iterable, Optional, Tuple
+
+
+def file_sha1(file_path: Path, chunk_size: int = 1024 * 1024) -> str:
+    """Calculate the sha1 hash of the content of a file reading it in chunks"""
+    sha1 = hashlib.sha1()
+    with open(file_path, "rb") as file_:
+        for chunk in iter(lambda: file_.read(chunk_size), b""):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+def read_fasta(fasta_file: Path) -> Generator[Tuple[str, str], None, None]:
+    """Yield (record id, sequence) tuples from a (multi)fasta file"""
+    record_id = None
+    sequence: list[str] = []
+    with open(fasta_file) as file_:
+        for line in file_:
+            line = line.strip()
+            if line.startswith(">"):
+                if record_id is not None:
+                    yield record_id, "".join(sequence)
+                record_id = line[1:].split()[0]
+                sequence = []
+            elif line:
+                sequence.append(line)
+    if record_id is not None:
+        yield record_id, "".join(sequence)
+
+
+def find_training_file(candidates: Iterable[Path]) -> Optional[Path]:
+    """First training file that exists (e.g. the one shipped with the
+    pipeline and then the one in the prepared scheme). None if there is no
+    training file for the scheme"""
+    for candidate in map(Path, candidates):
+        if candidate.is_file():
+            return candidate
+    return None
+
+
+class CDSCache:
+    """
+    Cache of predicted coding sequences (CDSs) per assembly. The entries are
+    keyed by the hash of the assembly and the hash of the Prodigal training
+    file so that an assembly that is typed against several schemes sharing
+    the same training file (e.g. escherichia and shigella) only goes
+    through gene prediction once. Without a training file, the CDSs are
+    predicted in metagenomic mode (and cached under 'meta').
+    """
+
+    META_MODE = "meta"
+
+    def __init__(self, cache_dir: Path, training_file: Optional[Path] = None) -> None:
+        self.cache_dir = Path(cache_dir)
+        self.training_file = None if training_file is None else Path(training_file)
+        if self.training_file is None:
+            self.training_hash = self.META_MODE
+        elif not self.training_file.is_file():
+            raise FileNotFoundError(
+                f"The provided training file {str(self.training_file)} does not exist."
+            )
+        else:
+            self.training_hash = file_sha1(self.training_file)
+        self.cache_dir.joinpath(self.training_hash).mkdir(parents=True, exist_ok=True)
+
+    def entry_path(self, assembly_hash: str) -> Path:
+        return self.cache_dir.joinpath(self.training_hash, assembly_hash + ".fasta")
+
+    def _predict(self, assembly: Path, output_file: Path) -> None:
+        import pyrodigal
+
+        if self.training_file is None:
+            gene_finder = pyrodigal.GeneFinder(meta=True, closed=False, mask=False)
+        else:
+            with open(self.training_file, "rb") as training_file:
+                training_info = pyrodigal.TrainingInfo.load(training_file)
+            gene_finder = pyrodigal.GeneFinder(training_info, closed=False, mask=False)
+        with open(output_file, "w") as output:
+            for record_id, sequence in read_fasta(assembly):
+                genes = gene_finder.find_genes(sequence.encode())
+                genes.write_genes(output, sequence_id=record_id)
+
+    def get(self, assembly: Path) -> Path:
+        """Return the cached CDS file for an assembly, predicting it first if
+        it is not in the cache yet. A lock per entry ensures that jobs of
+        different schemes running in parallel do not predict it twice"""
+        cached_file = self.entry_path(file_sha1(assembly))
+        lock_file = cached_file.with_suffix(".lock")
+        with open(lock_file, "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                if not cached_file.is_file():
+                    print(f"Predicting CDSs for {assembly}...")
+                    tmp_file = cached_file.with_suffix(f".tmp{os.getpid()}")
+                    self._predict(assembly, tmp_file)
+                    os.replace(tmp_file, cached_file)
+                else:
+                    print(f"Reusing cached CDSs for {assembly}.")
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+        return cached_file
+
+    def link_cds_files(
+        self,
+        assemblies: Iterable[Path],
+        link_dir: Path,
+        threads: int = 1,
+        samples: Optional[Iterable[str]] = None,
+    ) -> list[Path]:
+        """Fill the cache for all assemblies and make links to the cached
+        files named after the samples (or, if not given, the assemblies).
+        chewBBACA uses the file names as sample names so the links keep the
+        results tables unchanged. Naming them after the samples prevents
+        assemblies with the same file name in different directories from
+        overwriting each other's link"""
+        link_dir = Path(link_dir)
+        link_dir.mkdir(parents=True, exist_ok=True)
+        assemblies = list(assemblies)
+        link_names = (
+            [assembly.name for assembly in assemblies]
+            if samples is None
+            else [
+                sample + assembly.suffix
+                for sample, assembly in zip(samples, assemblies)
+            ]
+        )
+        with ThreadPoolExecutor(max_workers=max(threads, 1)) as executor:
+            cached_files = list(executor.map(self.get, assemblies))
+        links = []
+        for link_name, cached_file in zip(link_names, cached_files):
+            link = link_dir.joinpath(link_name)
+            if link.is_symlink() or link.exists():
+                link.unlink()
+            link.symlink_to(cached_file.resolve())
+            links.append(link)
+        return links
+
+
+def read_input_files(input_files: Path) -> Tuple[list[Path], list[str]]:
+    """Assemblies and sample names of a list of input files (one assembly
+    and, optionally, its sample name separated by a tab per line, as written
+    by chewbbaca_input_files.py). Without sample name the file name of the
+    assembly is used"""
+    assemblies = []
+    samples = []
+    with open(input_files) as file_:
+        for line in file_:
+            assembly, _, sample = line.rstrip("\n").partition("\t")
+            if not assembly.strip():
+                continue
+            assemblies.append(Path(assembly.strip()))
+            samples.append(sample.strip() or Path(assembly.strip()).stem)
+    return assemblies, samples
+
+
+if __name__ == "__main__":
+    argument_parser = argparse.ArgumentParser(
+        description="Predict the CDSs of the assemblies listed in a file (or reuse them from the cache) for running chewBBACA with --cds-input"
+    )
+    argument_parser.add_argument(
+        "-i",
+        "--input-files",
+        type=Path,
+        required=True,
+        help="File with one path to an assembly and, separated by a tab, its sample name per line (as produced by chewbbaca_input_files.py).",
+    )
+    argument_parser.add_argument(
+        "-p",
+        "--training-file",
+        type=Path,
+        nargs="+",
+        required=True,
+        help="Prodigal training file(s) used for the gene prediction. The first one that exists is used. If none of them exists, the CDSs are predicted in metagenomic mode.",
+    )
+    argument_parser.add_argument(
+        "-c",
+        "--cache-dir",
+        type=Path,
+        required=True,
+        help="Directory where the predicted CDSs are cached (shared by all schemes).",
+    )
+    argument_parser.add_argument(
+        "-l",
+        "--link-dir",
+        type=Path,
+        required=True,
+        help="Directory where the links to the cached CDS files will be made.",
+    )
+    argument_parser.add_argument(
+        "-o",
+        "--output",
+        type=Path,
+        required=True,
+        help="Output file with one path to a CDS file per line.",
+    )
+    argument_parser.add_argument(
+        "-t", "--threads", type=int, default=1, help="Number of threads to be used."
+    )
+    args = argument_parser.parse_args()
+    assemblies, samples = read_input_files(args.input_files)
+    training_file = find_training_file(args.training_file)
+    if training_file is None:
+        print(
+            "None of the training files exists, the CDSs are predicted in metagenomic mode."
+        )
+    cds_cache = CDSCache(cache_dir=args.cache_dir, training_file=training_file)
+    cds_files = cds_cache.link_cds_files(
+        assemblies, link_dir=args.link_dir, threads=args.threads, samples=samples
+    )
+    with open(args.output, "w") as file_:
+        for cds_file in cds_files:
+            file_.write(str(cds_file.absolute()) + "\n")
@@ -2,6 +2,14 @@ import argparse
 from pathlib import Path
 from yaml import safe_load
 
+from bin.priority_batches import (
+    batches_per_scheme,
+    parse_batch_sizes,
+    write_batch_lists,
+    write_sample_order,
+)
+from bin.sample_sheet import SampleSheet, load_sample_sheet
+
 
 class inputChewBBACA:
     """
@@ -16,7 +24,11 @@ class inputChewBBACA:
         output_dir: str = "output/cgmlst/",
     ) -> None:
         """Constructor"""
-        with open("files/dictionary_correct_cgmlst_scheme.yaml") as file_:
+        with open(
+            Path(__file__).parent.parent.joinpath(
+                "files", "dictionary_correct_cgmlst_scheme.yaml"
+            )
+        ) as file_:
             self.supported_genera = safe_load(file_)
         self.sample_sheet = Path(sample_sheet)
         assert (
@@ -26,37 +38,46 @@ class inputChewBBACA:
 
     def __read_sample_sheet(self) -> None:
         print("Reading sample sheet...\n")
-        with open(self.sample_sheet) as sample_sheet_file:
-            self.samples_dict = safe_load(sample_sheet_file)
-
-    def __enlist_samples_per_scheme(self) -> dict[str, list[str]]:
-        print(f"Getting list of samples per scheme found...\n")
-        scheme_dict: dict[str, list[str]] = {}
-        for sample in self.samples_dict:
-            for scheme in self.samples_dict[sample]["cgmlst_scheme"]:
-                if scheme is not None:
-                    try:
-                        scheme_dict[scheme].append(
-                            self.samples_dict[sample]["assembly"]
-                        )
-                    except KeyError:
-                        scheme_dict[scheme] = [self.samples_dict[sample]["assembly"]]
-        return scheme_dict
+        self.sample_sheet_data: SampleSheet = load_sample_sheet(self.sample_sheet)
 
     def make_file_with_samples_per_scheme(self) -> dict[str, list[str]]:
         self.__read_sample_sheet()
-        cgmlst_scheme_dict = self.__enlist_samples_per_scheme()
-        for scheme in cgmlst_scheme_dict:
-            scheme_file = self.output_dir.joinpath(scheme + "_samples.txt")
-            with open(scheme_file, "w") as file_:
-                for assembly_file in cgmlst_scheme_dict[scheme]:
-                    file_.write(assembly_file + "\n")
+        print(f"Getting list of samples per scheme found...\n")
+        self.sample_sheet_data.write_samples_per_scheme(self.output_dir)
         print(
             f"Files with samples per scheme will be written in {self.output_dir} directory!\n"
         )
+        assemblies = self.sample_sheet_data.assemblies
+        cgmlst_scheme_dict = {
+            scheme: [assemblies[row] for row in rows]
+            for scheme, rows in self.sample_sheet_data.rows_per_scheme.items()
+        }
         self.cgmlst_scheme_dict = cgmlst_scheme_dict
         return cgmlst_scheme_dict
 
+    def make_files_with_samples_per_batch(
+        self, batch_sizes: dict[str, int], default_tier: str
+    ) -> dict[str, dict[str, list[str]]]:
+        """Same as make_file_with_samples_per_scheme but with the samples of
+        every scheme split in batches per priority tier, written to
+        <output_dir>/<scheme>/<batch>_samples.txt (assembly and sample name
+        per line). All the samples of every scheme are also written (in
+        sample sheet order) to <output_dir>/<scheme>_samples.txt to merge
+        the batches in that order"""
+        self.__read_sample_sheet()
+        batches = batches_per_scheme(self.sample_sheet_data, batch_sizes, default_tier)
+        write_batch_lists(self.sample_sheet_data, batches, self.output_dir)
+        write_sample_order(self.sample_sheet_data, self.output_dir)
+        assemblies = self.sample_sheet_data.assemblies
+        self.cgmlst_batch_dict = {
+            scheme: {
+                batch: [assemblies[row] for row in rows]
+                for batch, rows in scheme_batches.items()
+            }
+            for scheme, scheme_batches in batches.items()
+        }
+        return self.cgmlst_batch_dict
+
 
 if __name__ == "__main__":
     argument_parser = argparse.ArgumentParser(
@@ -68,7 +89,7 @@ if __name__ == "__main__":
         type=Path,
         default="config/sample_sheet.yaml",
         help="Sample sheet (yaml file) containing a dictionary with the samples and at least one key:value pair assembly:file_path_to_assembly_file.\
-                                    Example {sample1: {assembly: input_dir/sample1.fasta}}",
+                                    Example {sample1: {assembly: input_dir/sample1.fasta}}. A compact sample sheet (json file made by sample_sheet.py) is also accepted.",
     )
     argument_parser.add_argument(
         "-o",
@@ -77,8 +98,26 @@ if __name__ == "__main__":
         default="output/cgmlst",
         help="Output directory for the chewBBACA results. A subfolder per genus/scheme will be created inside the output directory.",
     )
+    argument_parser.add_argument(
+        "--batch-sizes",
+        type=str,
+        nargs="+",
+        default=None,
+        help="Priority tiers from most to least urgent with the maximum number of samples per batch (e.g. high=5 normal=0, where 0 is one batch for the whole tier). If given, the samples of every scheme are split in batches per priority tier.",
+    )
+    argument_parser.add_argument(
+        "--default-tier",
+        type=str,
+        default="normal",
+        help="Priority tier of the samples without priority.",
+    )
     args = argument_parser.parse_args()
     chewbbaca_run = inputChewBBACA(
         sample_sheet=args.sample_sheet, output_dir=args.output_dir
     )
-    chewbbaca_run.make_file_with_samples_per_scheme()
+    if args.batch_sizes is None:
+        chewbbaca_run.make_file_with_samples_per_scheme()
+    else:
+        chewbbaca_run.make_files_with_samples_per_batch(
+            parse_batch_sizes(args.batch_sizes), args.default_tier
+        )
@@ -2,49 +2,127 @@ set -euo pipefail
 set -x
 
 # Input user
+# List of CDS files (predicted and cached per assembly by cds_cache.py)
 input_files=$(realpath "$1")
 threads="$2"
 output_dir="$3"
 db_dir=$(realpath "$4")
 genus="$5"
+# Optional: saved version of the scheme (see scheme_versions.py)
+scheme_version="${6:-}"
+# Optional: file with the loci to call (e.g. the triage panel), one per line
+loci_list="${7:-}"
+if [ -n "${loci_list}" ]; then
+    loci_list=$(realpath "${loci_list}")
+fi
 
 # Make new variables
-downloaded_scheme="${db_dir}/downloaded_schemes/${genus}"
-prepared_scheme="${db_dir}/prepared_schemes/${genus}"
+if [ -n "${scheme_version}" ]; then
+    downloaded_scheme="${db_dir}/scheme_versions/${genus}/${scheme_version}/downloaded"
+    prepared_scheme="${db_dir}/scheme_versions/${genus}/${scheme_version}/prepared"
+else
+    downloaded_scheme="${db_dir}/downloaded_schemes/${genus}"
+    prepared_scheme="${db_dir}/prepared_schemes/${genus}"
+fi
 script_path="$( cd -- "$(dirname "$0")" >/dev/null 2>&1 ; pwd -P )"
+# The scripts of the pipeline run as modules of bin (python -m bin.<script>)
+export PYTHONPATH="${script_path}/..${PYTHONPATH:+:${PYTHONPATH}}"
 prodigal_training_file=$(realpath "$script_path/../files/prodigal_training_files/${genus}.trn")
 
-echo "Deleting any previous results from old ChewBBACA runs if existing in ${output_dir}...\n"
-rm -rf "results_*"  
-
-if [ ! -f "$db_dir/prepared_schemes/$genus/$genus.trn" ]; then
-    echo "Preparing scheme for running it with ChewBBACA..."
-    chewBBACA.py PrepExternalSchema -i "$downloaded_scheme" \
-        --output-directory "$prepared_scheme" \
-        --cpu $threads \
-        --ptf "$prodigal_training_file"
-    echo "Prepared scheme can be found at ${prepared_scheme}.\n"
+# Structured timing markers that are parsed by run_report.py
+log_timing() {
+    echo -e "JUNO_TIMING\t$1\t$2\t$(date +%s)"
+}
+
+if [ ! -s "${input_files}" ]; then
+    echo "No samples to process for the ${genus} scheme."
+    mkdir -p "${output_dir}"
+    echo "FILE" > "${output_dir}/results_alleles.tsv"
+    echo "FILE" > "${output_dir}/results_alleles_hashed.tsv"
+    python -c 'import sys; from bin.novel_allele_registry import write_records; write_records([], sys.argv[1])' \
+        "${output_dir}/novel_alleles.tsv"
+    exit 0
+fi
+
+if [ ! -f "${prepared_scheme}/${genus}.trn" ]; then
+    if [ -n "${scheme_version}" ]; then
+        echo "Version ${scheme_version} of the ${genus} scheme has no prepared scheme and saved versions cannot be modified." >&2
+        exit 1
+    fi
+    # Batches of the same scheme can run at the same time: only one of them
+    # prepares the scheme, the others wait for it
+    (
+        flock 9
+        if [ ! -f "${prepared_scheme}/${genus}.trn" ]; then
+            echo "Preparing scheme for running it with ChewBBACA..."
+            log_timing prepare_scheme start
+            chewBBACA.py PrepExternalSchema -i "$downloaded_scheme" \
+                --output-directory "$prepared_scheme" \
+                --cpu $threads \
+                --ptf "$prodigal_training_file"
+            log_timing prepare_scheme end
+            echo "Prepared scheme can be found at ${prepared_scheme}.\n"
+        fi
+    ) 9> "${db_dir}/.${genus}.prepare.lock"
 fi
 
 echo "Making output directory ${output_dir}...\n"
 mkdir -p ${output_dir}
 cd "${output_dir}"
 
+# Everything chewBBACA writes goes to a work directory (see
+# output_lifecycle.py), only the final tables are copied out of it
+work_dir="allele_call_work"
+echo "Deleting any previous results from old ChewBBACA runs if existing in ${output_dir}...\n"
+rm -rf "${work_dir}"
+
+loci_list_args=""
+if [ -n "${loci_list}" ]; then
+    # chewBBACA accepts the full paths of the locus files of the scheme
+    sed -e "s|^|${prepared_scheme}/|" -e "s|$|.fasta|" "${loci_list}" > loci_list.txt
+    loci_list_args="--gl $(realpath loci_list.txt)"
+fi
+
 echo "Running ChewBBACA for ${genus} scheme...\n"
-chewBBACA.py AlleleCall --cpu ${threads} \
+log_timing allele_call start
+# Unbuffered output so that the stages of chewBBACA get the right timestamps
+PYTHONUNBUFFERED=1 chewBBACA.py AlleleCall --cpu ${threads} \
                 -i "${input_files}" \
-                -o "." \
+                -o "${work_dir}" \
                 -g "${prepared_scheme}" \
+                --cds-input \
                 --no-inferred \
-                --hash-profiles sha1
+                --output-novel \
+                --hash-profiles sha1 \
+                ${loci_list_args} \
+                2>&1 | python "${script_path}/run_report.py" mark-stages --prefix chewbbaca
                 # --ptf "$prodigal_training_file" \
                 # --fr
+log_timing allele_call end
+rm -f loci_list.txt
+
+find "${work_dir}" -type f -name "results_alleles.tsv" -exec cp {} "." \;
+find "${work_dir}" -type f -name "results_alleles_hashed.tsv" -exec cp {} "." \;
 
-find "." -type f -name "results_alleles.tsv" -exec cp {} "." \;
-find "." -type f -name "results_alleles_hashed.tsv" -exec cp {} "." \;
+# The scheme is never modified, neither by AlleleCall (--no-inferred) nor
+# afterwards, because other jobs may be calling alleles with it. The novel
+# alleles get stable ids from the registry of the scheme instead (a separate
+# file next to the prepared scheme). This replaces the 'INF-' ids in the
+# results, which could otherwise be seen as different from the same alleles
+# without the prefix (e.g. when calculating distance matrices)
+log_timing register_novel_alleles start
+novel_alleles=$(find "${work_dir}" -type f -name "novel_alleles.fasta" | head -n 1)
+# Saved versions only look up the alleles in the registry of the scheme
+registry="${db_dir}/prepared_schemes/${genus}.novel_alleles_registry.tsv"
+read_only_flag=""
+if [ -n "${scheme_version}" ]; then
+    read_only_flag="--read-only"
+fi
+python -m bin.novel_allele_registry \
+    --prepared-scheme "${prepared_scheme}" \
+    --registry "${registry}" \
+    --novel-alleles "${novel_alleles:-novel_alleles.fasta}" \
+    --results "results_alleles.tsv" \
+    --records "novel_alleles.tsv" ${read_only_flag}
+log_timing register_novel_alleles end
 
-# The newly identified alleles have the 'INF-' prefix
-# That can cause issues when calculating the distance matrix
-# because they will be seen as diferent from the alleles
-# that do not have the prefix. Therefore it is better to remove them
-# sed -i -r "s/INF-([0-9]+)/\1/g" "results_alleles.tsv"
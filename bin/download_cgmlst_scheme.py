@@ -11,10 +11,25 @@ import os
 import pathlib
 import requests
 import subprocess
+import time
 import warnings
 import yaml
 from pathlib import Path
-from typing import Any, Generator, Tuple, Iterable
+import shutil
+from typing import Any, Callable, Generator, Optional, Tuple, Iterable
+
+from bin.download_telemetry import (
+    RequestMetrics,
+    append_to_stream,
+    failed_requests,
+    summarize_metrics,
+)
+from bin.scheme_mirror import (
+    CatalogCache,
+    local_file_from_url,
+    mirror_path,
+    mirror_url,
+)
 
 cgmlst_schemes = {
     "salmonella": {
@@ -81,9 +96,30 @@ class cgMLSTSchemes:
         output_dir: str = "output",
         threads: int = 2,
         download_loci: bool = True,
+        max_retries: int = 3,
+        metrics_stream: Optional[Path] = None,
+        mirror: Optional[str] = None,
+        mirror_to: Optional[Path] = None,
+        catalog_cache_dir: Optional[Path] = None,
+        catalog_ttl: float = 7 * 24 * 3600,
     ) -> None:
         self.output_dir = pathlib.Path(output_dir)
+        # Local directory, file:// or http(s):// url with a copy of the
+        # sources (made with mirror_to) to read the schemes from
+        self.mirror = str(mirror) if mirror is not None else None
+        self.mirror_to = Path(mirror_to).absolute() if mirror_to is not None else None
+        self.catalog_cache = (
+            CatalogCache(catalog_cache_dir, ttl_seconds=catalog_ttl)
+            if catalog_cache_dir is not None
+            else None
+        )
         self.threads = int(threads)
+        self.max_retries = int(max_retries)
+        self.metrics_stream = (
+            Path(metrics_stream).absolute() if metrics_stream is not None else None
+        )
+        # Metrics of the requests made to download the current scheme
+        self.request_metrics: list[Optional[RequestMetrics]] = []
         self.genus_list = [genus.lower() for genus in genus_list]
         self.download_loci = download_loci
         self.date_and_time = datetime.now().strftime("%d-%m-%Y %H:%M:%S")
@@ -130,68 +166,192 @@ class cgMLSTSchemes:
         }
         print(yaml.dump(self.schemes, default_flow_style=False))
 
-    def __download_wget(
+    def __request(
+        self, url: str, timeout: int, output_file: Optional[Path] = None
+    ) -> Tuple[RequestMetrics, str]:
+        """Get a url (retrying if there are connection problems or server
+        errors) and record the metrics of the request. The content is
+        written to output_file if given or returned as text otherwise. A
+        failed request does not raise: its metrics have ok set to False so
+        that the caller can record them before raising"""
+        if self.mirror is not None:
+            url = mirror_url(url, self.mirror)
+        metrics = RequestMetrics(url=url)
+        start = time.perf_counter()
+        if url.startswith("file://"):
+            text = self.__read_local_file(url, metrics, output_file)
+        else:
+            text = self.__get_remote_file(url, metrics, timeout, output_file)
+        metrics.latency_s = time.perf_counter() - start - metrics.backoff_s
+        if self.metrics_stream is not None:
+            append_to_stream(self.metrics_stream, metrics)
+        return metrics, text
+
+    def raise_for_failed_requests(self) -> None:
+        """Raise an HTTPError if any of the recorded requests failed"""
+        failed = failed_requests(self.request_metrics)
+        if failed:
+            raise requests.HTTPError(
+                f"Could not download {len(failed)} file(s), e.g. {failed[0].url} "
+                f"after {failed[0].retries + 1} attempt(s): {failed[0].error}"
+            )
+
+    def __get_remote_file(
+        self,
+        url: str,
+        metrics: RequestMetrics,
+        timeout: int,
+        output_file: Optional[Path],
+    ) -> str:
+        text = ""
+        for attempt in range(self.max_retries + 1):
+            metrics.retries = attempt
+            try:
+                with requests.get(url, stream=True, timeout=timeout) as response:
+                    metrics.status = response.status_code
+                    if response.status_code >= 500 or response.status_code == 429:
+                        raise requests.ConnectionError(
+                            f"Server error {response.status_code}"
+                        )
+                    response.raise_for_status()
+                    if output_file is None:
+                        text = response.text
+                        metrics.bytes = len(response.content)
+                    else:
+                        metrics.bytes = 0
+                        with open(output_file, "wb") as file_:
+                            for chunk in response.iter_content(chunk_size=1024 * 1024):
+                                file_.write(chunk)
+                                metrics.bytes += len(chunk)
+                metrics.ok = True
+                metrics.error = None
+                break
+            except (requests.ConnectionError, requests.Timeout) as error:
+                metrics.error = str(error)
+                if attempt < self.max_retries:
+                    time.sleep(2**attempt)
+                    metrics.backoff_s += 2**attempt
+            except requests.HTTPError as error:
+                metrics.error = str(error)
+                break
+        return text
+
+    def __read_local_file(
+        self, url: str, metrics: RequestMetrics, output_file: Optional[Path]
+    ) -> str:
+        local_file = local_file_from_url(url)
+        if not local_file.is_file():
+            metrics.error = f"File {local_file} not found in mirror"
+            return ""
+        metrics.bytes = local_file.stat().st_size
+        metrics.ok = True
+        if output_file is not None:
+            shutil.copyfile(local_file, output_file)
+            return ""
+        return local_file.read_text()
+
+    def __download_file(
         self,
         url: str,
         output_file: Path,
         working_dir: Path = Path("."),
         timeout: int = 200,
-    ) -> None:
-        subprocess.run(
-            f"wget --quiet --output-document {output_file} {url}",
-            shell=True,
-            check=True,
-            timeout=timeout,
-            cwd=working_dir,
+    ) -> RequestMetrics:
+        metrics, _ = self.__request(
+            url, timeout=timeout, output_file=Path(working_dir).joinpath(output_file)
         )
+        return metrics
+
+    def __get_text(self, url: str, timeout: int = 200) -> str:
+        metrics, text = self.__request(url, timeout=timeout)
+        self.request_metrics.append(metrics)
+        self.raise_for_failed_requests()
+        return text
+
+    def __get_catalog(self, scheme_url: str, parser: Callable[[str], Any]) -> Any:
+        """Get the catalog of a scheme (list of loci or scheme description)
+        from the catalog cache or otherwise fetch and parse it"""
+        if self.catalog_cache is not None:
+            catalog = self.catalog_cache.get(scheme_url)
+            if catalog is not None:
+                print(message_formatter(f"Using cached catalog of {scheme_url}"))
+                return catalog
+        catalog = parser(self.__get_text(scheme_url))
+        if self.catalog_cache is not None:
+            self.catalog_cache.put(scheme_url, catalog)
+        return catalog
+
+    @staticmethod
+    def parse_directory_listing(
+        scheme_url: str, website_data: str, suffix: str
+    ) -> list[str]:
+        """Get the urls of the loci from the html directory listing of a
+        scheme (Enterobase and SeqSphere+)"""
+        parsed_website_data = bs4.BeautifulSoup(website_data, "html.parser")
+        loci_list = []
+        for line in parsed_website_data.find_all("a"):
+            if line.contents[0] != "../":
+                sp = str(line.contents[0])
+                sp = sp.strip("[]")
+                if sp.endswith(suffix):
+                    locus_url = scheme_url + sp
+                    loci_list.append(locus_url)
+        return loci_list
 
-    def download_pubmlst_locus(self, locus_url: str, output_dir_genus: Path) -> None:
+    def download_pubmlst_locus(
+        self, locus_url: str, output_dir_genus: Path
+    ) -> Optional[RequestMetrics]:
         output_file = Path(locus_url.split("/")[-1] + ".fasta")
         locus_url = locus_url + "/alleles_fasta"
         if self.download_loci:
-            self.__download_wget(locus_url, output_file, working_dir=output_dir_genus)
+            return self.__download_file(
+                locus_url, output_file, working_dir=output_dir_genus
+            )
+        return None
 
-    def download_enterobase_locus(self, locus_url: str, output_dir_genus: Path) -> None:
+    def download_enterobase_locus(
+        self, locus_url: str, output_dir_genus: Path
+    ) -> RequestMetrics:
         output_file = Path(locus_url.split("/")[-1])
-        self.__download_wget(locus_url, output_file, working_dir=output_dir_genus)
-        subprocess.run(
-            ["gunzip", output_file], check=True, timeout=100, cwd=output_dir_genus
+        metrics = self.__download_file(
+            locus_url, output_file, working_dir=output_dir_genus
         )
+        if metrics.ok:
+            subprocess.run(
+                ["gunzip", output_file], check=True, timeout=100, cwd=output_dir_genus
+            )
+        return metrics
 
-    def download_seqsphere_locus(self, locus_url: str, output_dir_genus: Path) -> None:
+    def download_seqsphere_locus(
+        self, locus_url: str, output_dir_genus: Path
+    ) -> Optional[RequestMetrics]:
         output_file = Path(locus_url.split("/")[-1])
         if self.download_loci:
-            self.__download_wget(locus_url, output_file, working_dir=output_dir_genus)
+            return self.__download_file(
+                locus_url, output_file, working_dir=output_dir_genus
+            )
+        return None
 
     def download_pubmlst_scheme(
         self, scheme_url: str, output_dir_per_genus: Path, genus: str
     ) -> dict[str, Any]:
-        output_file = output_dir_per_genus.joinpath("scheme_summary_file")
-        # Need to make it again because it is only made before if download_loci=True
-        os.makedirs(output_dir_per_genus, exist_ok=True)
-        self.__download_wget(scheme_url, output_file, timeout=60)
-        with open(output_file) as scheme_definition:
-            scheme = json.load(scheme_definition)
+        scheme = self.__get_catalog(scheme_url, json.loads)
         if self.download_loci:
+            with open(
+                output_dir_per_genus.joinpath("scheme_summary_file"), "w"
+            ) as scheme_definition:
+                json.dump(scheme, scheme_definition)
             print(
                 message_formatter(
                     f'Downloading {scheme["locus_count"]} loci from PubMLST server...'
                 )
             )
             loci = db.from_sequence(scheme["loci"], npartitions=self.threads)  # type: ignore
-            loci.map(
-                self.download_pubmlst_locus, output_dir_genus=output_dir_per_genus
-            ).compute()
-        else:
-            # Remove created files/directories if loci are not supposed to be downloaded
-            os.unlink(output_file)
-            try:
-                # Do not remove the directories if they were not empty before
-                # os.rmdir will fail if the directory is not empty
-                os.rmdir(output_dir_per_genus)
-                os.rmdir(self.output_dir)
-            except:
-                pass
+            self.request_metrics.extend(
+                loci.map(
+                    self.download_pubmlst_locus, output_dir_genus=output_dir_per_genus
+                ).compute()
+            )
         scheme_info = {
             "scheme_description": scheme["description"],
             "locus_count": scheme["locus_count"],
@@ -202,17 +362,12 @@ class cgMLSTSchemes:
     def download_enterobase_scheme(
         self, scheme_url: str, output_dir_per_genus: Path
     ) -> dict[str, Any]:
-        website_data = requests.get(scheme_url)
-        website_data.raise_for_status()
-        parsed_website_data = bs4.BeautifulSoup(website_data.text, "html.parser")
-        loci_list = []
-        for line in parsed_website_data.find_all("a"):
-            if line.contents[0] != "../":
-                sp = str(line.contents[0])
-                sp = sp.strip("[]")
-                if sp.endswith("fasta.gz"):
-                    locus_url = scheme_url + sp
-                    loci_list.append(locus_url)
+        loci_list = self.__get_catalog(
+            scheme_url,
+            lambda website_data: self.parse_directory_listing(
+                scheme_url, website_data, suffix="fasta.gz"
+            ),
+        )
         if self.download_loci:
             print(
                 message_formatter(
@@ -220,26 +375,24 @@ class cgMLSTSchemes:
                 )
             )
             loci = db.from_sequence(loci_list, npartitions=self.threads)  # type: ignore
-            loci.map(
-                self.download_enterobase_locus, output_dir_genus=output_dir_per_genus
-            ).compute()
+            self.request_metrics.extend(
+                loci.map(
+                    self.download_enterobase_locus,
+                    output_dir_genus=output_dir_per_genus,
+                ).compute()
+            )
         scheme_info = {"scheme_description": None, "locus_count": len(loci_list)}
         return scheme_info
 
     def download_seqsphere_scheme(
         self, scheme_url: str, output_dir_per_genus: Path
     ) -> dict[str, Any]:
-        website_data = requests.get(scheme_url)
-        website_data.raise_for_status()
-        parsed_website_data = bs4.BeautifulSoup(website_data.text, "html.parser")
-        loci_list = []
-        for line in parsed_website_data.find_all("a"):
-            if line.contents[0] != "../":
-                sp = str(line.contents[0])
-                sp = sp.strip("[]")
-                if sp.endswith(".fasta"):
-                    locus_url = scheme_url + sp
-                    loci_list.append(locus_url)
+        loci_list = self.__get_catalog(
+            scheme_url,
+            lambda website_data: self.parse_directory_listing(
+                scheme_url, website_data, suffix=".fasta"
+            ),
+        )
         if self.download_loci:
             print(
                 message_formatter(
@@ -247,9 +400,11 @@ class cgMLSTSchemes:
                 )
             )
             loci = db.from_sequence(loci_list, npartitions=self.threads)  # type: ignore
-            loci.map(
-                self.download_seqsphere_locus, output_dir_genus=output_dir_per_genus
-            ).compute()
+            self.request_metrics.extend(
+                loci.map(
+                    self.download_seqsphere_locus, output_dir_genus=output_dir_per_genus
+                ).compute()
+            )
         scheme_info = {"scheme_description": None, "locus_count": len(loci_list)}
         return scheme_info
 
@@ -263,33 +418,47 @@ class cgMLSTSchemes:
                     f"Collecting cgMLST scheme for {genus.title()} from {source.title()}..."
                 )
             )
+            self.request_metrics = []
+            if self.mirror_to is not None:
+                yield genus, self.mirror_scheme(
+                    genus, source, self.schemes[genus]["url"]
+                )
+                continue
             output_dir_per_genus = self.output_dir.joinpath(genus)
             if self.download_loci:
                 os.makedirs(output_dir_per_genus, exist_ok=True)
             scheme_url = self.schemes[genus]["url"]
-            if source == "pubmlst":
-                genus_scheme_info = self.download_pubmlst_scheme(
-                    scheme_url, output_dir_per_genus, genus
-                )
-            elif source == "bigsdb_pasteur":
-                # The BIGSDB Pasteur database works exactly the same than PubMLST
-                genus_scheme_info = self.download_pubmlst_scheme(
-                    scheme_url, output_dir_per_genus, genus
-                )
-            elif source == "enterobase":
-                genus_scheme_info = self.download_enterobase_scheme(
-                    scheme_url, output_dir_per_genus
-                )
-            elif source == "seqsphere":
-                genus_scheme_info = self.download_seqsphere_scheme(
-                    scheme_url, output_dir_per_genus
-                )
-            else:
-                genus_scheme_info = {}
+            try:
+                if source == "pubmlst":
+                    genus_scheme_info = self.download_pubmlst_scheme(
+                        scheme_url, output_dir_per_genus, genus
+                    )
+                elif source == "bigsdb_pasteur":
+                    # The BIGSDB Pasteur database works exactly the same than PubMLST
+                    genus_scheme_info = self.download_pubmlst_scheme(
+                        scheme_url, output_dir_per_genus, genus
+                    )
+                elif source == "enterobase":
+                    genus_scheme_info = self.download_enterobase_scheme(
+                        scheme_url, output_dir_per_genus
+                    )
+                elif source == "seqsphere":
+                    genus_scheme_info = self.download_seqsphere_scheme(
+                        scheme_url, output_dir_per_genus
+                    )
+                else:
+                    genus_scheme_info = {}
+            except requests.HTTPError:
+                # The summary also includes the request that failed
+                if self.download_loci:
+                    self.write_download_metrics(output_dir_per_genus)
+                raise
             if self.download_loci:
                 genus_scheme_info["timestamp"] = self.date_and_time
                 genus_scheme_info["url"] = self.schemes[genus]["url"]
                 genus_scheme_info["genus"] = genus
+                self.write_download_metrics(output_dir_per_genus)
+                self.raise_for_failed_requests()
                 with open(
                     output_dir_per_genus.joinpath("downloaded_scheme.yaml"), "w"
                 ) as file_handle:
@@ -298,6 +467,76 @@ class cgMLSTSchemes:
                     )
             yield genus, genus_scheme_info
 
+    def mirror_file(self, url: str) -> RequestMetrics:
+        assert self.mirror_to is not None
+        output_file = mirror_path(url, self.mirror_to)
+        output_file.parent.mkdir(parents=True, exist_ok=True)
+        return self.__download_file(url, output_file)
+
+    def mirror_scheme(self, genus: str, source: str, scheme_url: str) -> dict[str, Any]:
+        """Copy the catalog and the (unprocessed) loci of a scheme to the
+        mirror directory keeping the layout of the urls of the source. The
+        mirror can then be used with the mirror argument (as local directory,
+        file:// url or served over http) from machines without internet"""
+        assert self.mirror_to is not None
+        catalog_file = mirror_path(scheme_url, self.mirror_to)
+        catalog_file.parent.mkdir(parents=True, exist_ok=True)
+        website_data = self.__get_text(scheme_url)
+        catalog_file.write_text(website_data)
+        if source in ["pubmlst", "bigsdb_pasteur"]:
+            loci_list = [
+                locus_url + "/alleles_fasta"
+                for locus_url in json.loads(website_data)["loci"]
+            ]
+        elif source == "enterobase":
+            loci_list = self.parse_directory_listing(
+                scheme_url, website_data, suffix="fasta.gz"
+            )
+        else:
+            loci_list = self.parse_directory_listing(
+                scheme_url, website_data, suffix=".fasta"
+            )
+        print(
+            message_formatter(
+                f"Mirroring {len(loci_list)} loci from {source.title()} to {self.mirror_to}..."
+            )
+        )
+        loci = db.from_sequence(loci_list, npartitions=self.threads)  # type: ignore
+        self.request_metrics.extend(loci.map(self.mirror_file).compute())
+        scheme_info = {
+            "scheme_description": None,
+            "locus_count": len(loci_list),
+            "timestamp": self.date_and_time,
+            "url": scheme_url,
+            "genus": genus,
+        }
+        mirror_info_dir = self.mirror_to.joinpath("mirrored_schemes", genus)
+        mirror_info_dir.mkdir(parents=True, exist_ok=True)
+        self.write_download_metrics(mirror_info_dir)
+        self.raise_for_failed_requests()
+        with open(mirror_info_dir.joinpath("mirrored_scheme.yaml"), "w") as file_handle:
+            file_handle.write(yaml.dump(scheme_info, default_flow_style=False))
+        return scheme_info
+
+    def write_download_metrics(self, output_dir_per_genus: Path) -> None:
+        """Write a summary of the requests made to download a scheme next to
+        the downloaded_scheme.yaml file"""
+        metrics = [request for request in self.request_metrics if request is not None]
+        summary = summarize_metrics(metrics)
+        with open(
+            output_dir_per_genus.joinpath("download_metrics.yaml"), "w"
+        ) as file_handle:
+            file_handle.write(yaml.dump(summary, default_flow_style=False))
+        for host, host_summary in summary["hosts"].items():
+            print(
+                message_formatter(
+                    f"{host}: {host_summary['requests']} requests, "
+                    f"{host_summary['bytes'] / 1e6:.1f} MB, "
+                    f"{host_summary['throughput_mb_per_s']} MB/s, "
+                    f"{host_summary['retries']} retries"
+                )
+            )
+
 
 def main() -> None:
     argument_parser = argparse.ArgumentParser(
@@ -330,12 +569,54 @@ def main() -> None:
     argument_parser.add_argument(
         "--no_download", dest="download_loci", action="store_false"
     )
+    argument_parser.add_argument(
+        "--max_retries",
+        type=int,
+        default=3,
+        help="Number of times a failed request is retried.",
+    )
+    argument_parser.add_argument(
+        "--metrics_stream",
+        type=pathlib.Path,
+        default=None,
+        help="File where the metrics of every request are appended as json lines (e.g. for monitoring).",
+    )
+    argument_parser.add_argument(
+        "--mirror",
+        type=str,
+        default=None,
+        help="Read the schemes from a mirror made with --mirror_to instead of the original sources. It can be a local directory, a file:// url or an http(s):// url (e.g. the mirror directory served with 'python -m http.server').",
+    )
+    argument_parser.add_argument(
+        "--mirror_to",
+        type=pathlib.Path,
+        default=None,
+        help="Instead of downloading the schemes for chewBBACA, make a copy of the catalogs and loci of the sources in this directory.",
+    )
+    argument_parser.add_argument(
+        "--catalog_cache",
+        type=pathlib.Path,
+        default=None,
+        help="Directory to cache the catalogs (list of loci) of the schemes.",
+    )
+    argument_parser.add_argument(
+        "--catalog_ttl",
+        type=float,
+        default=7 * 24 * 3600,
+        help="Time (in seconds) that a cached catalog is used before fetching it again.",
+    )
     args = argument_parser.parse_args()
     cgMLSTSchemes(
         threads=args.threads,
         genus_list=args.genus,
         download_loci=args.download_loci,
         output_dir=args.output_dir,
+        max_retries=args.max_retries,
+        metrics_stream=args.metrics_stream,
+        mirror=args.mirror,
+        mirror_to=args.mirror_to,
+        catalog_cache_dir=args.catalog_cache,
+        catalog_ttl=args.catalog_ttl,
     )
 
 
@@ -0,0 +1,115 @@
+from dataclasses import asdict, dataclass
+import json
+from pathlib import Path
+from typing import Any, Iterable, Optional
+from urllib.parse import urlparse
+
+# Upper limits (in seconds) of the bins of the latency histogram
+LATENCY_BINS = [0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0]
+
+
+@dataclass
+class RequestMetrics:
+    """Metrics of one request made while downloading a scheme"""
+
+    url: str
+    status: Optional[int] = None
+    bytes: int = 0
+    # Time spent on the request(s), without the backoff between retries
+    latency_s: float = 0.0
+    retries: int = 0
+    backoff_s: float = 0.0
+    ok: bool = False
+    error: Optional[str] = None
+
+    @property
+    def host(self) -> str:
+        return urlparse(self.url).netloc or urlparse(self.url).scheme or "local"
+
+    def to_dict(self) -> dict[str, Any]:
+        return {**asdict(self), "host": self.host}
+
+
+def append_to_stream(stream_file: Path, metrics: RequestMetrics) -> None:
+    """Append one json line per request to the metrics stream. The lines are
+    small enough to be written atomically by parallel workers"""
+    with open(stream_file, "a") as file_:
+        file_.write(json.dumps(metrics.to_dict()) + "\n")
+
+
+def failed_requests(
+    metrics: Iterable[Optional[RequestMetrics]],
+) -> list[RequestMetrics]:
+    return [request for request in metrics if request is not None and not request.ok]
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    sorted_values = sorted(values)
+    index = min(int(round(fraction * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+def latency_histogram(latencies: Iterable[float]) -> dict[str, int]:
+    labels = [f"<={upper_limit}s" for upper_limit in LATENCY_BINS] + [
+        f">{LATENCY_BINS[-1]}s"
+    ]
+    histogram = {label: 0 for label in labels}
+    for latency in latencies:
+        for upper_limit, label in zip(LATENCY_BINS, labels):
+            if latency <= upper_limit:
+                histogram[label] += 1
+                break
+        else:
+            histogram[labels[-1]] += 1
+    return histogram
+
+
+def summarize_metrics(
+    metrics: Iterable[RequestMetrics], num_slowest: int = 10
+) -> dict[str, Any]:
+    """Summary per host of the requests made to download a scheme, together
+    with the slowest requests (usually loci with many alleles)"""
+    metrics = list(metrics)
+    per_host: dict[str, list[RequestMetrics]] = {}
+    for request in metrics:
+        per_host.setdefault(request.host, []).append(request)
+    hosts_summary = {}
+    for host, requests_host in per_host.items():
+        latencies = [request.latency_s for request in requests_host]
+        total_bytes = sum(request.bytes for request in requests_host)
+        total_latency = sum(latencies)
+        status_counts: dict[str, int] = {}
+        for request in requests_host:
+            status = str(request.status) if request.status is not None else "none"
+            status_counts[status] = status_counts.get(status, 0) + 1
+        hosts_summary[host] = {
+            "requests": len(requests_host),
+            "failed": sum(1 for request in requests_host if not request.ok),
+            "retries": sum(request.retries for request in requests_host),
+            "backoff_s": round(sum(request.backoff_s for request in requests_host), 3),
+            "bytes": total_bytes,
+            "total_latency_s": round(total_latency, 3),
+            "throughput_mb_per_s": round(total_bytes / 1e6 / total_latency, 3)
+            if total_latency > 0
+            else None,
+            "latency_s": {
+                "mean": round(total_latency / len(requests_host), 4),
+                "p50": round(percentile(latencies, 0.5), 4),
+                "p95": round(percentile(latencies, 0.95), 4),
+                "max": round(max(latencies), 4),
+            },
+            "latency_histogram": latency_histogram(latencies),
+            "http_status": status_counts,
+        }
+    slowest = sorted(metrics, key=lambda request: request.latency_s, reverse=True)
+    return {
+        "requests": len(metrics),
+        "bytes": sum(request.bytes for request in metrics),
+        "hosts": hosts_summary,
+        "slowest_requests": [
+            {"url": request.url, "latency_s": round(request.latency_s, 4)}
+            for request in slowest[:num_slowest]
+        ],
+    }
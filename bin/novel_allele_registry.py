@@ -0,0 +1,273 @@
+import argparse
+import csv
+from datetime import datetime
+import fcntl
+import hashlib
+import os
+from pathlib import Path
+from typing import Generator, Optional, Tuple
+
+from bin.cds_cache import read_fasta
+
+REGISTRY_FILE = "novel_alleles_registry.tsv"
+REGISTRY_COLUMNS = ["locus", "allele_id", "sha1", "added"]
+RECORD_COLUMNS = ["locus", "allele_id", "provisional_id", "sha1", "sequence"]
+
+
+def sequence_sha1(sequence: str) -> str:
+    return hashlib.sha1(sequence.upper().encode()).hexdigest()
+
+
+def locus_name(name: str) -> str:
+    """Name of a locus without the .fasta suffix used in the result tables"""
+    return name[: -len(".fasta")] if name.endswith(".fasta") else name
+
+
+def parse_allele_id(allele: str) -> str:
+    """Allele id without the prefix of inferred alleles (INF-) and the '*'
+    that chewBBACA uses for alleles that were added locally"""
+    return allele.replace("INF-", "").lstrip("*")
+
+
+def read_novel_alleles(
+    novel_alleles_fasta: Path,
+) -> Generator[Tuple[str, str, str], None, None]:
+    """Yield (locus, provisional allele id, sequence) of the novel alleles
+    written by chewBBACA AlleleCall --output-novel (headers are
+    >{locus}_{allele id})"""
+    for record_id, sequence in read_fasta(novel_alleles_fasta):
+        locus, _, allele_id = record_id.rpartition("_")
+        yield locus_name(locus), parse_allele_id(allele_id), sequence
+
+
+def write_atomically(file_path: Path, lines: list[str]) -> None:
+    tmp_file = file_path.with_name(f".{file_path.name}.tmp-{os.getpid()}")
+    with open(tmp_file, "w") as file_:
+        file_.writelines(lines)
+    os.replace(tmp_file, file_path)
+
+
+class NovelAlleleRegistry:
+    """
+    Registry of the novel alleles found for a prepared scheme. The allele
+    calling jobs run with --no-inferred, so they never modify the scheme, and
+    their novel alleles get provisional ids (INF-x) that only mean something
+    within one job. Every job then registers its novel alleles at once: the
+    alleles are deduplicated by the sha1 of their sequence, new alleles get
+    the next free (stable) id of their locus and the provisional ids in the
+    results of the job are replaced by the registered ids. The registry is a
+    separate file next to the prepared scheme, which is never modified: it
+    is read by other allele calling jobs at the same time, and chewBBACA
+    keeps structures of its own (short representatives, pre-computed hash
+    tables) that plain appends to the locus files would not update. A
+    registered allele is therefore called as novel again by later jobs and
+    gets its registered id from the registry. The registry is locked while
+    it is updated so any number of jobs can use the same scheme at the same
+    time.
+    """
+
+    def __init__(
+        self,
+        prepared_scheme: Path,
+        read_only: bool = False,
+        registry_file: Optional[Path] = None,
+    ) -> None:
+        self.prepared_scheme = Path(prepared_scheme)
+        # Saved scheme versions cannot be modified. Only the alleles that were
+        # already registered get a stable id
+        self.read_only = read_only
+        # Outside of the scheme so it is not part of the saved scheme versions
+        self.registry_file = Path(
+            registry_file
+            or self.prepared_scheme.with_name(
+                f"{self.prepared_scheme.name}.{REGISTRY_FILE}"
+            )
+        )
+        self.lock_file = self.registry_file.with_name(
+            f".{self.registry_file.name}.lock"
+        )
+        self.registered: dict[Tuple[str, str], str] = {}
+
+    def __load(self) -> list[dict[str, str]]:
+        if not self.registry_file.is_file():
+            return []
+        with open(self.registry_file) as file_:
+            rows = list(csv.DictReader(file_, delimiter="\t"))
+        self.registered = {
+            (row["locus"], row["sha1"]): row["allele_id"] for row in rows
+        }
+        return rows
+
+    def __last_allele_id(self, locus: str, rows: list[dict[str, str]]) -> int:
+        """Highest allele id of a locus in the scheme or in the registry"""
+        last_id = 0
+        locus_file = self.prepared_scheme.joinpath(locus + ".fasta")
+        if locus_file.is_file():
+            for record_id, _ in read_fasta(locus_file):
+                allele_id = parse_allele_id(record_id.rpartition("_")[2])
+                if allele_id.isdigit():
+                    last_id = max(last_id, int(allele_id))
+        for row in rows:
+            if row["locus"] == locus:
+                last_id = max(last_id, int(row["allele_id"]))
+        return last_id
+
+    def register(self, novel_alleles: list[Tuple[str, str, str]]) -> dict[str, int]:
+        """Register the (locus, provisional id, sequence) of the novel alleles
+        of one job. Returns the number of alleles that were already known
+        and that were added"""
+        hashed_alleles = {
+            (locus, sequence_sha1(sequence)): sequence
+            for locus, _, sequence in novel_alleles
+        }
+        if self.read_only:
+            self.__load()
+            known = sum(key in self.registered for key in hashed_alleles)
+            return {"known": known, "added": 0}
+        self.lock_file.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.lock_file, "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                rows = self.__load()
+                new_alleles: dict[str, list[Tuple[str, str]]] = {}
+                for locus, sha1 in sorted(hashed_alleles):
+                    if (locus, sha1) not in self.registered:
+                        new_alleles.setdefault(locus, []).append(
+                            (sha1, hashed_alleles[(locus, sha1)])
+                        )
+                added = datetime.now().strftime("%d-%m-%Y %H:%M:%S")
+                new_rows = []
+                for locus, alleles in new_alleles.items():
+                    last_id = self.__last_allele_id(locus, rows)
+                    for number, (sha1, _) in enumerate(alleles, start=1):
+                        allele_id = str(last_id + number)
+                        self.registered[(locus, sha1)] = allele_id
+                        new_rows.append([locus, allele_id, sha1, added])
+                if new_rows:
+                    self.__write(rows, new_rows)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+        return {
+            "known": len(hashed_alleles) - len(new_rows),
+            "added": len(new_rows),
+        }
+
+    def __write(self, rows: list[dict[str, str]], new_rows: list[list[str]]) -> None:
+        lines = ["\t".join(REGISTRY_COLUMNS) + "\n"]
+        lines.extend(
+            "\t".join(row[column] for column in REGISTRY_COLUMNS) + "\n" for row in rows
+        )
+        lines.extend("\t".join(row) + "\n" for row in new_rows)
+        write_atomically(self.registry_file, lines)
+
+    def translate_results(
+        self,
+        results_table: Path,
+        novel_alleles: list[Tuple[str, str, str]],
+        output_table: Optional[Path] = None,
+    ) -> None:
+        """Replace the provisional ids (INF-x) in a results table by the
+        registered allele ids. Alleles that could not be registered keep
+        their provisional id"""
+        stable_ids = {}
+        for locus, provisional_id, sequence in novel_alleles:
+            allele_id = self.registered.get((locus, sequence_sha1(sequence)))
+            if allele_id is not None:
+                stable_ids[(locus, provisional_id)] = allele_id
+        with open(results_table) as file_:
+            header = file_.readline()
+            loci = [locus_name(column) for column in header.rstrip("\n").split("\t")]
+            lines = [header]
+            for line in file_:
+                row = line.rstrip("\n").split("\t")
+                for index in range(1, len(row)):
+                    if row[index].startswith("INF-"):
+                        key = (loci[index], parse_allele_id(row[index]))
+                        row[index] = stable_ids.get(key, row[index])
+                lines.append("\t".join(row) + "\n")
+        write_atomically(Path(output_table or results_table), lines)
+
+
+def write_records(
+    novel_alleles: list[Tuple[str, str, str]],
+    output_file: Path,
+    registered: Optional[dict[Tuple[str, str], str]] = None,
+) -> None:
+    """Write the novel alleles of a job as records keyed by sequence hash,
+    with their registered allele id (or their provisional id, INF-x, if they
+    could not be registered)"""
+    registered = registered or {}
+    with open(output_file, "w") as file_:
+        writer = csv.writer(file_, delimiter="\t", lineterminator="\n")
+        writer.writerow(RECORD_COLUMNS)
+        for locus, provisional_id, sequence in novel_alleles:
+            sha1 = sequence_sha1(sequence)
+            allele_id = registered.get((locus, sha1), f"INF-{provisional_id}")
+            writer.writerow([locus, allele_id, provisional_id, sha1, sequence])
+
+
+def main() -> None:
+    argument_parser = argparse.ArgumentParser(
+        description="Register the novel alleles found by one chewBBACA AlleleCall job and give them stable allele ids."
+    )
+    argument_parser.add_argument(
+        "-s",
+        "--prepared-scheme",
+        type=Path,
+        required=True,
+        help="Prepared scheme used for the allele calling. It is only read to find the last allele id of every locus.",
+    )
+    argument_parser.add_argument(
+        "--registry",
+        type=Path,
+        default=None,
+        help=f"Registry file. Default: <prepared-scheme>.{REGISTRY_FILE} next to the prepared scheme.",
+    )
+    argument_parser.add_argument(
+        "-n",
+        "--novel-alleles",
+        type=Path,
+        required=True,
+        help="Fasta file with the novel alleles (made by chewBBACA AlleleCall --output-novel).",
+    )
+    argument_parser.add_argument(
+        "-r",
+        "--results",
+        type=Path,
+        required=True,
+        help="Results table of the allele calling (results_alleles.tsv). The provisional allele ids are replaced in place.",
+    )
+    argument_parser.add_argument(
+        "--read-only",
+        action="store_true",
+        help="Do not register new alleles (e.g. for saved scheme versions). Only the alleles already in the registry get their registered id.",
+    )
+    argument_parser.add_argument(
+        "-o",
+        "--records",
+        type=Path,
+        default=None,
+        help="Tsv file to write the novel alleles to as records keyed by sequence hash, with their registered allele id.",
+    )
+    args = argument_parser.parse_args()
+
+    novel_alleles = (
+        list(read_novel_alleles(args.novel_alleles))
+        if args.novel_alleles.is_file()
+        else []
+    )
+    registry = NovelAlleleRegistry(
+        args.prepared_scheme, read_only=args.read_only, registry_file=args.registry
+    )
+    counts = registry.register(novel_alleles)
+    registry.translate_results(args.results, novel_alleles)
+    if args.records is not None:
+        write_records(novel_alleles, args.records, registry.registered)
+    print(
+        f"{len(novel_alleles)} novel alleles found: {counts['known']} already "
+        f"registered and {counts['added']} added to {registry.registry_file}."
+    )
+
+
+if __name__ == "__main__":
+    main()
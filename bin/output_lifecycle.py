@@ -0,0 +1,132 @@
+import argparse
+import os
+from pathlib import Path
+import shutil
+import tarfile
+from typing import Iterable, Optional
+
+RETENTION_POLICIES = ["delete", "archive", "keep"]
+# Directory (inside the output directory of a job) with everything that
+# chewBBACA writes and the archive it is packed into with the 'archive' policy
+WORK_DIR = "allele_call_work"
+ARCHIVE_FILE = "allele_call_intermediates.tar.gz"
+DECLARED_OUTPUTS_FILE = "declared_outputs.txt"
+
+
+def retain_intermediates(
+    work_dir: Path, policy: str, archive_file: Optional[Path] = None
+) -> int:
+    """Apply the retention policy to the work directory of one job: delete
+    it, pack it in one (gzipped) archive or keep it. Returns the number of
+    files that were removed from the output directory"""
+    if policy not in RETENTION_POLICIES:
+        raise ValueError(
+            f"Unknown retention policy {policy}, choose from {RETENTION_POLICIES}."
+        )
+    work_dir = Path(work_dir)
+    if policy == "keep" or not work_dir.is_dir():
+        return 0
+    # Only the work directory of the job is listed, never the whole output
+    num_files = sum(len(files) for _, _, files in os.walk(work_dir))
+    if policy == "archive":
+        archive_file = Path(archive_file or work_dir.with_name(ARCHIVE_FILE))
+        tmp_file = archive_file.with_name(f".{archive_file.name}.tmp-{os.getpid()}")
+        with tarfile.open(tmp_file, "w:gz") as archive:
+            archive.add(work_dir, arcname=work_dir.name)
+        os.replace(tmp_file, archive_file)
+    shutil.rmtree(work_dir)
+    return num_files
+
+
+def remove_scratch(paths: Iterable[Path]) -> None:
+    """Remove files or directories that are not needed once a job finished
+    (e.g. the links to the cached CDS files)"""
+    for path in map(Path, paths):
+        if path.is_dir() and not path.is_symlink():
+            shutil.rmtree(path)
+        elif path.is_symlink() or path.exists():
+            path.unlink()
+
+
+def write_declared_outputs(manifest_file: Path, files: Iterable[str]) -> None:
+    """Write the (absolute) paths of the outputs, logs and benchmarks that
+    the rules of the pipeline declare"""
+    manifest_file = Path(manifest_file)
+    manifest_file.parent.mkdir(parents=True, exist_ok=True)
+    tmp_file = manifest_file.with_name(f".{manifest_file.name}.tmp-{os.getpid()}")
+    with open(tmp_file, "w") as file_:
+        file_.writelines(
+            path + "\n" for path in sorted({os.path.abspath(path) for path in files})
+        )
+    os.replace(tmp_file, manifest_file)
+
+
+def finalize_outputs(output_dir: Path, manifest_file: Path) -> list[Path]:
+    """Remove the declared files that are empty (e.g. logs of steps without
+    any message) and their directories if nothing else is left in them. Only
+    the files in the manifest are looked at. Returns the removed files"""
+    output_dir = Path(output_dir).absolute()
+    if not Path(manifest_file).is_file():
+        return []
+    with open(manifest_file) as file_:
+        declared = [Path(line.rstrip("\n")) for line in file_ if line.strip()]
+    removed = []
+    parent_dirs = set()
+    for path in declared:
+        if path.is_file() and not path.is_symlink() and path.stat().st_size == 0:
+            path.unlink()
+            removed.append(path)
+            parent_dirs.add(path.parent)
+    # Deepest directories first so that parents can become empty
+    for directory in sorted(
+        parent_dirs, key=lambda dir_: len(dir_.parts), reverse=True
+    ):
+        while directory != output_dir and output_dir in directory.parents:
+            try:
+                directory.rmdir()
+            except OSError:
+                # Not empty (or already removed)
+                break
+            directory = directory.parent
+    return removed
+
+
+def main() -> None:
+    argument_parser = argparse.ArgumentParser(
+        description="Apply the retention policy to the intermediate files of a job."
+    )
+    argument_parser.add_argument(
+        "-w",
+        "--work-dir",
+        type=Path,
+        required=True,
+        help="Work directory of the job with the intermediate files.",
+    )
+    argument_parser.add_argument(
+        "-p", "--policy", choices=RETENTION_POLICIES, required=True
+    )
+    argument_parser.add_argument(
+        "-a",
+        "--archive",
+        type=Path,
+        default=None,
+        help=f"Archive for the 'archive' policy. Default: {ARCHIVE_FILE} next to the work directory.",
+    )
+    argument_parser.add_argument(
+        "--scratch",
+        type=Path,
+        nargs="*",
+        default=[],
+        help="Files or directories to remove regardless of the policy.",
+    )
+    args = argument_parser.parse_args()
+    num_files = retain_intermediates(args.work_dir, args.policy, args.archive)
+    remove_scratch(args.scratch)
+    print(
+        f"Retention policy '{args.policy}' applied to {args.work_dir}: "
+        f"{num_files} intermediate files removed."
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,280 @@
+import argparse
+from contextlib import ExitStack
+import heapq
+from itertools import chain
+from pathlib import Path
+import tempfile
+from typing import Callable, Iterable, Optional, Tuple
+
+from bin.novel_allele_registry import RECORD_COLUMNS
+from bin.sample_sheet import SampleSheet
+from bin.triage import sample_name
+
+
+def batch_name(tier: str, number: int) -> str:
+    return f"{tier}_{number}"
+
+
+def parse_priority(
+    priority: Optional[str], tiers: Iterable[str], default_tier: str
+) -> str:
+    """Priority tier of a sample from the (optional) priority column of the
+    metadata. Empty values get the default tier"""
+    if priority is None or str(priority).strip().lower() in ["", "nan", "none"]:
+        return default_tier
+    tier = str(priority).strip().lower()
+    if tier not in tiers:
+        raise ValueError(
+            f"Unknown priority {priority}. The priority must be one of {list(tiers)}."
+        )
+    return tier
+
+
+def batches_per_scheme(
+    sample_sheet: SampleSheet, batch_sizes: dict[str, int], default_tier: str
+) -> dict[str, dict[str, list[int]]]:
+    """Split the samples (rows) of every scheme in batches per priority tier,
+    in the order of the tiers (from most to least urgent). A tier is split in
+    batches of at most its batch size (0 for a single batch)"""
+    tiers = list(batch_sizes)
+    sample_tiers = [
+        parse_priority(priority, tiers, default_tier)
+        for priority in (sample_sheet.priorities or [None] * len(sample_sheet.samples))
+    ]
+    batches: dict[str, dict[str, list[int]]] = {}
+    for scheme, rows in sample_sheet.rows_per_scheme.items():
+        batches[scheme] = {}
+        for tier in tiers:
+            tier_rows = [row for row in rows if sample_tiers[row] == tier]
+            if not tier_rows:
+                continue
+            batch_size = batch_sizes[tier] or len(tier_rows)
+            for number, start in enumerate(
+                range(0, len(tier_rows), batch_size), start=1
+            ):
+                batches[scheme][batch_name(tier, number)] = tier_rows[
+                    start : start + batch_size
+                ]
+    return batches
+
+
+def write_batch_lists(
+    sample_sheet: SampleSheet,
+    batches: dict[str, dict[str, list[int]]],
+    output_dir: Path,
+) -> None:
+    """Write the assemblies (and, separated by a tab, the sample names) of
+    every batch to <output_dir>/<scheme>/<batch>_samples.txt"""
+    for scheme, scheme_batches in batches.items():
+        scheme_dir = Path(output_dir).joinpath(scheme)
+        scheme_dir.mkdir(parents=True, exist_ok=True)
+        for batch, rows in scheme_batches.items():
+            with open(scheme_dir.joinpath(f"{batch}_samples.txt"), "w") as file_:
+                file_.write(
+                    "".join(
+                        f"{sample_sheet.assemblies[row]}\t{sample_sheet.samples[row]}\n"
+                        for row in rows
+                    )
+                )
+
+
+def write_sample_order(sample_sheet: SampleSheet, output_dir: Path) -> None:
+    """Write all the samples of every scheme, in the order of the sample
+    sheet, to <output_dir>/<scheme>_samples.txt (same format as the lists
+    of the batches) to merge the batches in that order"""
+    for scheme, rows in sample_sheet.rows_per_scheme.items():
+        with open(Path(output_dir).joinpath(f"{scheme}_samples.txt"), "w") as file_:
+            file_.write(
+                "".join(
+                    f"{sample_sheet.assemblies[row]}\t{sample_sheet.samples[row]}\n"
+                    for row in rows
+                )
+            )
+
+
+def read_sample_order(sample_list: Path) -> list[str]:
+    """Sample names (as in the FILE column of chewBBACA) of a list written
+    by write_sample_order. Lists with only assemblies are also accepted"""
+    samples = []
+    with open(sample_list) as file_:
+        for line in file_:
+            assembly, _, sample = line.rstrip("\n").partition("\t")
+            if assembly.strip():
+                samples.append(sample.strip() or sample_name(assembly.strip()))
+    return samples
+
+
+def read_header(table: Path) -> Optional[str]:
+    """Header of a table, or None for missing tables and tables without rows
+    (e.g. batches in which no sample needed the allele calling after the
+    triage)"""
+    if not table.is_file():
+        return None
+    with open(table) as file_:
+        header = file_.readline()
+        return header if file_.readline() else None
+
+
+def batch_tables(tables: Iterable[Path]) -> Tuple[Optional[str], list[Path]]:
+    """Header and tables of the batches that have rows. All the tables must
+    have the same columns"""
+    header = None
+    tables_with_rows = []
+    for table in map(Path, tables):
+        table_header = read_header(table)
+        if table_header is None:
+            continue
+        if header is None:
+            header = table_header
+        elif table_header != header:
+            raise ValueError(
+                f"The columns of {table} are not the same as the columns of the other batches."
+            )
+        tables_with_rows.append(table)
+    return header, tables_with_rows
+
+
+def is_sorted(table: Path, position: Callable[[str], int]) -> bool:
+    with open(table) as file_:
+        file_.readline()
+        last_position = -1
+        for line in file_:
+            if position(line) < last_position:
+                return False
+            last_position = position(line)
+    return True
+
+
+def sort_table(table: Path, position: Callable[[str], int], output_table: Path) -> None:
+    """Copy of a table with the rows sorted by position. Only one batch is
+    kept in memory at a time"""
+    with open(table) as file_:
+        header = file_.readline()
+        rows = sorted(file_, key=position)
+    with open(output_table, "w") as output:
+        output.write(header)
+        output.writelines(rows)
+
+
+def merge_tables(
+    tables: Iterable[Path],
+    output_table: Path,
+    sample_order: Optional[list[str]] = None,
+) -> int:
+    """Concatenate the tables (with the same header) of the batches of a
+    scheme. Missing tables and tables without rows are skipped. With
+    sample_order (the samples of the scheme in the order of the sample
+    sheet) the rows are merged by their sample (first column) in that order
+    instead of being in batch order. The batches already follow that order,
+    so they are streamed and merged row by row; a batch that does not (e.g.
+    if chewBBACA reordered its samples) is sorted into a temporary file
+    first. Returns the number of rows"""
+    positions = {sample: position for position, sample in enumerate(sample_order or [])}
+
+    def position(row: str) -> int:
+        # Rows of unknown samples (if any) are kept at the end
+        return positions.get(row.split("\t", 1)[0].strip(), len(positions))
+
+    header, tables_to_merge = batch_tables(tables)
+    num_rows = 0
+    with tempfile.TemporaryDirectory() as tmp_dir, ExitStack() as open_tables:
+        batches = []
+        for number, table in enumerate(tables_to_merge):
+            if sample_order is not None and not is_sorted(table, position):
+                sorted_table = Path(tmp_dir).joinpath(f"{number}.tsv")
+                sort_table(table, position, sorted_table)
+                table = sorted_table
+            file_ = open_tables.enter_context(open(table))
+            file_.readline()
+            batches.append(file_)
+        rows = (
+            chain.from_iterable(batches)
+            if sample_order is None
+            else heapq.merge(*batches, key=position)
+        )
+        with open(output_table, "w") as output:
+            # Same as the tables written for schemes without samples
+            output.write(header or "FILE\n")
+            for row in rows:
+                num_rows += 1
+                output.write(row)
+    return num_rows
+
+
+def merge_novel_alleles(tables: Iterable[Path], output_table: Path) -> int:
+    """Merge the novel alleles (records written by novel_allele_registry.py)
+    of the batches of a scheme on their registered allele id: an allele found
+    in several batches is kept once (the record of the most urgent batch),
+    so the provisional ids that every batch gives to its own novel alleles
+    do not end up in the merged table. Returns the number of alleles"""
+    header, tables_to_merge = batch_tables(tables)
+    header = header or "\t".join(RECORD_COLUMNS) + "\n"
+    columns = header.rstrip("\n").split("\t")
+    locus_column, sha1_column = columns.index("locus"), columns.index("sha1")
+    seen_alleles = set()
+    with open(output_table, "w") as output:
+        output.write(header)
+        for table in tables_to_merge:
+            with open(table) as file_:
+                file_.readline()
+                for line in file_:
+                    row = line.rstrip("\n").split("\t")
+                    allele = (row[locus_column], row[sha1_column])
+                    if allele not in seen_alleles:
+                        seen_alleles.add(allele)
+                        output.write(line)
+    return len(seen_alleles)
+
+
+def parse_batch_sizes(batch_sizes: list[str]) -> dict[str, int]:
+    """Batch size per tier from tier=size arguments (in tier order)"""
+    sizes = {}
+    for batch_size in batch_sizes:
+        tier, _, size = batch_size.partition("=")
+        sizes[tier.strip().lower()] = int(size)
+    return sizes
+
+
+def main() -> None:
+    argument_parser = argparse.ArgumentParser(
+        description="Merge the result tables of the priority batches of a scheme."
+    )
+    argument_parser.add_argument(
+        "-t",
+        "--tables",
+        type=Path,
+        nargs="+",
+        required=True,
+        help="Tables of the batches, from the most to the least urgent batch.",
+    )
+    argument_parser.add_argument(
+        "-o", "--output", type=Path, required=True, help="Merged table."
+    )
+    argument_parser.add_argument(
+        "-s",
+        "--sample-order",
+        type=Path,
+        default=None,
+        help="File with the assemblies and sample names of the scheme (as written by chewbbaca_input_files.py) in the order of the sample sheet. If given, the rows of the merged table are in this order instead of batch order.",
+    )
+    argument_parser.add_argument(
+        "--novel-alleles",
+        action="store_true",
+        help="The tables are the novel alleles of the batches (as written by novel_allele_registry.py). Every allele is kept once, with its registered allele id.",
+    )
+    args = argument_parser.parse_args()
+    if args.novel_alleles:
+        num_rows = merge_novel_alleles(args.tables, args.output)
+        print(
+            f"{num_rows} novel alleles of {len(args.tables)} batches written to {args.output}."
+        )
+        return
+    sample_order = None
+    if args.sample_order is not None:
+        sample_order = read_sample_order(args.sample_order)
+    num_rows = merge_tables(args.tables, args.output, sample_order)
+    print(f"{num_rows} rows of {len(args.tables)} batches written to {args.output}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,557 @@
+import argparse
+from collections import Counter
+from datetime import datetime
+import gzip
+import hashlib
+import json
+import os
+from pathlib import Path
+import shutil
+import sqlite3
+import struct
+from typing import IO, Any, Generator, Optional, Protocol, Tuple
+import zlib
+
+import yaml
+
+MAGIC = b"JCGMLSTP"
+EXCHANGE_FORMAT = "juno_cgmlst_profiles"
+EXCHANGE_VERSION = 1
+DIGEST_SIZE = 20  # sha1
+# Record types
+REFERENCE_RECORD = 1
+PROFILE_RECORD = 2
+# Value tags: a digest or a class (LNF, PLOT3...) that was not seen before in
+# the locus, or the index of one that was
+NEW_DIGEST, KNOWN_DIGEST, NEW_CLASS, KNOWN_CLASS = range(4)
+DELTA_MODES = ["reference", "chain"]
+
+
+def encode_varint(value: int) -> bytes:
+    encoded = bytearray()
+    while value >= 0x80:
+        encoded.append((value & 0x7F) | 0x80)
+        value >>= 7
+    encoded.append(value)
+    return bytes(encoded)
+
+
+def decode_varint(data: bytes, position: int) -> Tuple[int, int]:
+    value = 0
+    shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, position
+        shift += 7
+
+
+class ByteStream(Protocol):
+    """Anything to read bytes from (files, gzip streams...)"""
+
+    def read(self, size: int, /) -> bytes:
+        ...
+
+
+def read_varint(stream: ByteStream) -> int:
+    value = 0
+    shift = 0
+    while True:
+        byte = stream.read(1)
+        if not byte:
+            raise ValueError("Unexpected end of the profile exchange file.")
+        value |= (byte[0] & 0x7F) << shift
+        if byte[0] < 0x80:
+            return value
+        shift += 7
+
+
+def is_digest(value: str) -> bool:
+    if len(value) != 2 * DIGEST_SIZE:
+        return False
+    try:
+        bytes.fromhex(value)
+    except ValueError:
+        return False
+    return True
+
+
+def loci_sha1(loci: list[str]) -> str:
+    """Fingerprint of the loci (and their order) of a scheme"""
+    return hashlib.sha1("\n".join(loci).encode()).hexdigest()
+
+
+def profile_sha256(values: list[str]) -> str:
+    return hashlib.sha256("\t".join(values).encode()).hexdigest()
+
+
+def read_hashed_table(
+    hashed_table: Path,
+) -> Tuple[list[str], Generator[Tuple[str, list[str]], None, None]]:
+    """Loci and a generator of (sample, values) of a hashed results table
+    (results_alleles_hashed.tsv)"""
+    file_ = open(hashed_table)
+    header = file_.readline().rstrip("\n").split("\t")
+
+    def rows() -> Generator[Tuple[str, list[str]], None, None]:
+        with file_:
+            for line in file_:
+                row = line.rstrip("\n").split("\t")
+                yield row[0], row[1:]
+
+    return header[1:], rows()
+
+
+def read_reference_profile(reference_file: Path, loci: list[str]) -> list[str]:
+    """Shared reference profile: the first profile of a hashed results table
+    with the same loci"""
+    reference_loci, rows = read_hashed_table(reference_file)
+    if reference_loci != loci:
+        raise ValueError(
+            f"The loci of the reference profile {reference_file} do not match the loci of the profiles."
+        )
+    for _, values in rows:
+        return values
+    raise ValueError(f"The reference profile file {reference_file} has no profile.")
+
+
+def consensus_profile(hashed_table: Path) -> list[str]:
+    """Most frequent value of every locus, used as embedded reference"""
+    loci, rows = read_hashed_table(hashed_table)
+    counts: list[Counter[str]] = [Counter() for _ in loci]
+    for _, values in rows:
+        for counter, value in zip(counts, values):
+            counter[value] += 1
+    return [counter.most_common(1)[0][0] if counter else "LNF" for counter in counts]
+
+
+class ProfileCodec:
+    """
+    Encodes a profile as the loci that differ from a base profile (the
+    reference or the previous profile). Every digest and class gets an index
+    the first time it is seen in a locus so that later occurrences (the same
+    allele in another profile) only take one or two bytes instead of the 20
+    bytes of the digest. Encoder and decoder build the same tables as long
+    as the profiles are processed in the same order.
+    """
+
+    def __init__(self, num_loci: int) -> None:
+        self.num_loci = num_loci
+        self.digest_index: list[dict[str, int]] = [{} for _ in range(num_loci)]
+        self.digests: list[list[str]] = [[] for _ in range(num_loci)]
+        self.class_index: dict[str, int] = {}
+        self.classes: list[str] = []
+
+    def __add(self, locus: int, value: str) -> None:
+        if is_digest(value):
+            self.digest_index[locus][value] = len(self.digests[locus])
+            self.digests[locus].append(value)
+        else:
+            self.class_index[value] = len(self.classes)
+            self.classes.append(value)
+
+    def register(self, values: list[str]) -> None:
+        """Add the values of a profile that is known by both sides (the
+        external reference profile) to the tables without encoding it"""
+        for locus, value in enumerate(values):
+            if value not in self.digest_index[locus] and value not in self.class_index:
+                self.__add(locus, value)
+
+    def encode(self, values: list[str], base: Optional[list[str]]) -> bytes:
+        if len(values) != self.num_loci:
+            raise ValueError(
+                f"Profile with {len(values)} loci instead of {self.num_loci}."
+            )
+        changed = [
+            locus
+            for locus in range(self.num_loci)
+            if base is None or values[locus] != base[locus]
+        ]
+        encoded = bytearray(encode_varint(len(changed)))
+        previous = -1
+        for locus in changed:
+            value = values[locus]
+            encoded += encode_varint(locus - previous - 1)
+            previous = locus
+            if value in self.digest_index[locus]:
+                encoded.append(KNOWN_DIGEST)
+                encoded += encode_varint(self.digest_index[locus][value])
+            elif value in self.class_index:
+                encoded.append(KNOWN_CLASS)
+                encoded += encode_varint(self.class_index[value])
+            elif is_digest(value):
+                encoded.append(NEW_DIGEST)
+                encoded += bytes.fromhex(value)
+                self.__add(locus, value)
+            else:
+                encoded_class = value.encode()
+                encoded.append(NEW_CLASS)
+                encoded += encode_varint(len(encoded_class)) + encoded_class
+                self.__add(locus, value)
+        return bytes(encoded)
+
+    def decode(
+        self, data: bytes, position: int, base: Optional[list[str]]
+    ) -> Tuple[list[str], int]:
+        values = list(base) if base is not None else [""] * self.num_loci
+        num_changed, position = decode_varint(data, position)
+        locus = -1
+        for _ in range(num_changed):
+            gap, position = decode_varint(data, position)
+            locus += gap + 1
+            tag = data[position]
+            position += 1
+            if tag == KNOWN_DIGEST:
+                index, position = decode_varint(data, position)
+                values[locus] = self.digests[locus][index]
+            elif tag == KNOWN_CLASS:
+                index, position = decode_varint(data, position)
+                values[locus] = self.classes[index]
+            elif tag == NEW_DIGEST:
+                values[locus] = data[position : position + DIGEST_SIZE].hex()
+                position += DIGEST_SIZE
+                self.__add(locus, values[locus])
+            elif tag == NEW_CLASS:
+                length, position = decode_varint(data, position)
+                values[locus] = data[position : position + length].decode()
+                position += length
+                self.__add(locus, values[locus])
+            else:
+                raise ValueError(f"Unknown value tag {tag} in profile exchange file.")
+        return values, position
+
+
+def scheme_version_of(hashed_table: Path) -> Optional[str]:
+    """Version of the scheme written by the pipeline next to the results"""
+    manifest_file = Path(hashed_table).with_name("scheme_version.yaml")
+    if not manifest_file.is_file():
+        return None
+    with open(manifest_file) as file_:
+        return (yaml.safe_load(file_) or {}).get("version")
+
+
+def export_profiles(
+    hashed_table: Path,
+    output_file: Path,
+    scheme: str,
+    reference_file: Optional[Path] = None,
+    delta: str = "reference",
+    scheme_version: Optional[str] = None,
+) -> int:
+    """Write the profiles of a hashed results table to a (gzipped, delta
+    encoded) profile exchange file. Returns the number of profiles"""
+    if delta not in DELTA_MODES:
+        raise ValueError(f"Unknown delta mode {delta}, choose from {DELTA_MODES}.")
+    loci, rows = read_hashed_table(hashed_table)
+    if reference_file is not None:
+        reference = read_reference_profile(reference_file, loci)
+        reference_info: Any = {"sha256": profile_sha256(reference)}
+    else:
+        reference = consensus_profile(hashed_table)
+        reference_info = "embedded"
+    header = json.dumps(
+        {
+            "format": EXCHANGE_FORMAT,
+            "version": EXCHANGE_VERSION,
+            "scheme": scheme,
+            "scheme_version": scheme_version or scheme_version_of(hashed_table),
+            "hash_algorithm": "sha1",
+            "loci": loci,
+            "loci_sha1": loci_sha1(loci),
+            "delta": delta,
+            "reference": reference_info,
+            "created": datetime.now().strftime("%d-%m-%Y %H:%M:%S"),
+        }
+    ).encode()
+    checksum = hashlib.sha256(header)
+    codec = ProfileCodec(len(loci))
+    output_file = Path(output_file)
+    tmp_file = output_file.with_name(f".{output_file.name}.tmp-{os.getpid()}")
+    num_profiles = 0
+    with open(tmp_file, "wb") as file_:
+        file_.write(MAGIC + struct.pack(">I", len(header)) + header)
+        with gzip.GzipFile(fileobj=file_, mode="wb", mtime=0) as stream:
+
+            def write_record(record: bytes) -> None:
+                checksum.update(record)
+                stream.write(encode_varint(len(record)) + record)
+
+            if reference_file is not None:
+                codec.register(reference)
+            else:
+                write_record(bytes([REFERENCE_RECORD]) + codec.encode(reference, None))
+            base = reference
+            for sample, values in rows:
+                name = sample.encode()
+                write_record(
+                    bytes([PROFILE_RECORD])
+                    + encode_varint(len(name))
+                    + name
+                    + codec.encode(values, base)
+                )
+                num_profiles += 1
+                if delta == "chain":
+                    base = values
+            stream.write(
+                encode_varint(0) + encode_varint(num_profiles) + checksum.digest()
+            )
+    os.replace(tmp_file, output_file)
+    return num_profiles
+
+
+def read_exchange_header(exchange_file: Path) -> dict[str, Any]:
+    with open(exchange_file, "rb") as file_:
+        return _read_header(file_)[0]
+
+
+def _read_header(file_: IO[bytes]) -> Tuple[dict[str, Any], bytes]:
+    if file_.read(len(MAGIC)) != MAGIC:
+        raise ValueError(f"{file_.name} is not a profile exchange file of Juno-cgMLST.")
+    (header_length,) = struct.unpack(">I", file_.read(4))
+    header_bytes = file_.read(header_length)
+    header = json.loads(header_bytes)
+    if header.get("version") != EXCHANGE_VERSION:
+        raise ValueError(
+            f"Version {header.get('version')} of the profile exchange format is not supported."
+        )
+    return header, header_bytes
+
+
+def read_profiles(
+    exchange_file: Path, reference_file: Optional[Path] = None
+) -> Tuple[dict[str, Any], Generator[Tuple[str, list[str]], None, None]]:
+    """Header and a generator of (sample, values) of a profile exchange
+    file. The checksum is verified once all the profiles were read: a
+    ValueError is raised at the end of the generator if the file is
+    corrupted, so writers should only keep their output after that"""
+    file_ = open(exchange_file, "rb")
+    try:
+        header, header_bytes = _read_header(file_)
+    except Exception:
+        file_.close()
+        raise
+    codec = ProfileCodec(len(header["loci"]))
+    reference = None
+    if header["reference"] != "embedded":
+        if reference_file is None:
+            file_.close()
+            raise ValueError(
+                f"{exchange_file} was encoded against a shared reference profile that must be given to read it."
+            )
+        reference = read_reference_profile(reference_file, header["loci"])
+        if profile_sha256(reference) != header["reference"]["sha256"]:
+            file_.close()
+            raise ValueError(
+                f"The reference profile {reference_file} is not the one used to encode {exchange_file}."
+            )
+        codec.register(reference)
+
+    def profiles() -> Generator[Tuple[str, list[str]], None, None]:
+        try:
+            yield from decode_records()
+        except (EOFError, OSError, zlib.error) as error:
+            raise ValueError(f"{exchange_file} is corrupted or truncated.") from error
+
+    def decode_records() -> Generator[Tuple[str, list[str]], None, None]:
+        nonlocal reference
+        checksum = hashlib.sha256(header_bytes)
+        num_profiles = 0
+        with file_, gzip.GzipFile(fileobj=file_, mode="rb") as stream:
+            base = reference
+            while True:
+                record_length = read_varint(stream)
+                if record_length == 0:
+                    break
+                record = stream.read(record_length)
+                if len(record) != record_length:
+                    raise ValueError(f"{exchange_file} is truncated.")
+                checksum.update(record)
+                if record[0] == REFERENCE_RECORD:
+                    reference, _ = codec.decode(record, 1, None)
+                    base = reference
+                    continue
+                name_length, position = decode_varint(record, 1)
+                sample = record[position : position + name_length].decode()
+                values, _ = codec.decode(record, position + name_length, base)
+                num_profiles += 1
+                if header["delta"] == "chain":
+                    base = values
+                yield sample, values
+            expected_profiles = read_varint(stream)
+            if (
+                stream.read(checksum.digest_size) != checksum.digest()
+                or expected_profiles != num_profiles
+            ):
+                raise ValueError(f"The checksum of {exchange_file} does not match.")
+
+    return header, profiles()
+
+
+def import_to_table(
+    exchange_file: Path,
+    output_table: Path,
+    reference_file: Optional[Path] = None,
+    append: bool = False,
+) -> int:
+    """Write the profiles to a hashed results table (or append them to an
+    existing table of the same scheme). Returns the number of profiles"""
+    header, profiles = read_profiles(exchange_file, reference_file)
+    output_table = Path(output_table)
+    header_line = "\t".join(["FILE"] + header["loci"]) + "\n"
+    existing_table = None
+    if append and output_table.is_file():
+        existing_table = open(output_table)
+        existing_header = existing_table.readline()
+        if existing_header and existing_header != header_line:
+            existing_table.close()
+            raise ValueError(
+                f"The loci of {output_table} do not match the loci of the {header['scheme']} scheme in {exchange_file}."
+            )
+    tmp_file = output_table.with_name(f".{output_table.name}.tmp-{os.getpid()}")
+    num_profiles = 0
+    try:
+        with open(tmp_file, "w") as file_:
+            file_.write(header_line)
+            if existing_table is not None:
+                # The existing profiles are copied in chunks, not loaded
+                shutil.copyfileobj(existing_table, file_)
+            for sample, values in profiles:
+                file_.write("\t".join([sample] + values) + "\n")
+                num_profiles += 1
+        os.replace(tmp_file, output_table)
+    finally:
+        if existing_table is not None:
+            existing_table.close()
+        if tmp_file.exists():
+            tmp_file.unlink()
+    return num_profiles
+
+
+def import_to_database(
+    exchange_file: Path, database: Path, reference_file: Optional[Path] = None
+) -> int:
+    """Add the profiles to a sqlite profile database (one row per scheme and
+    sample). Profiles of samples that are already in the database are
+    replaced. Nothing is added if the file is corrupted"""
+    header, profiles = read_profiles(exchange_file, reference_file)
+    connection = sqlite3.connect(database)
+    num_profiles = 0
+    try:
+        with connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS schemes "
+                "(scheme TEXT PRIMARY KEY, loci_sha1 TEXT, loci TEXT)"
+            )
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS profiles (scheme TEXT, sample TEXT, "
+                "scheme_version TEXT, profile TEXT, PRIMARY KEY (scheme, sample))"
+            )
+            known = connection.execute(
+                "SELECT loci_sha1 FROM schemes WHERE scheme = ?", (header["scheme"],)
+            ).fetchone()
+            if known is None:
+                connection.execute(
+                    "INSERT INTO schemes VALUES (?, ?, ?)",
+                    (header["scheme"], header["loci_sha1"], "\t".join(header["loci"])),
+                )
+            elif known[0] != header["loci_sha1"]:
+                raise ValueError(
+                    f"The loci of the {header['scheme']} scheme in {exchange_file} do not match the loci in {database}."
+                )
+            for sample, values in profiles:
+                connection.execute(
+                    "INSERT OR REPLACE INTO profiles VALUES (?, ?, ?, ?)",
+                    (
+                        header["scheme"],
+                        sample,
+                        header["scheme_version"],
+                        "\t".join(values),
+                    ),
+                )
+                num_profiles += 1
+    finally:
+        connection.close()
+    return num_profiles
+
+
+def main() -> None:
+    argument_parser = argparse.ArgumentParser(
+        description="Export hashed cgMLST profiles to a compact exchange file or import them back."
+    )
+    subparsers = argument_parser.add_subparsers(dest="command", required=True)
+    export_parser = subparsers.add_parser(
+        "export",
+        help="Encode the profiles of a hashed results table (results_alleles_hashed.tsv).",
+    )
+    export_parser.add_argument(
+        "-r",
+        "--results",
+        type=Path,
+        required=True,
+        help="Hashed results table (results_alleles_hashed.tsv) of one scheme.",
+    )
+    export_parser.add_argument("-g", "--genus", type=str, required=True, help="Scheme.")
+    export_parser.add_argument(
+        "-o", "--output", type=Path, required=True, help="Output exchange file."
+    )
+    export_parser.add_argument(
+        "--reference",
+        type=Path,
+        default=None,
+        help="Hashed results table whose first profile is a reference profile shared with the receiving lab. If not given, the most frequent allele of every locus is used as reference and included in the file.",
+    )
+    export_parser.add_argument(
+        "--delta",
+        choices=DELTA_MODES,
+        default="reference",
+        help="Encode every profile against the reference or against the previous profile (smaller for tables sorted by similarity).",
+    )
+    import_parser = subparsers.add_parser(
+        "import",
+        help="Write the profiles of an exchange file to a hashed results table or a profile database.",
+    )
+    import_parser.add_argument(
+        "-i", "--input", type=Path, required=True, help="Exchange file."
+    )
+    output_group = import_parser.add_mutually_exclusive_group(required=True)
+    output_group.add_argument(
+        "-o", "--output", type=Path, help="Output hashed results table."
+    )
+    output_group.add_argument(
+        "--database", type=Path, help="Sqlite profile database to add the profiles to."
+    )
+    import_parser.add_argument(
+        "--append",
+        action="store_true",
+        help="Append the profiles to the output table if it exists.",
+    )
+    import_parser.add_argument(
+        "--reference",
+        type=Path,
+        default=None,
+        help="Shared reference profile, only needed if the file was exported with one.",
+    )
+    args = argument_parser.parse_args()
+
+    if args.command == "export":
+        num_profiles = export_profiles(
+            args.results, args.output, args.genus.lower(), args.reference, args.delta
+        )
+        print(
+            f"{num_profiles} profiles exported to {args.output} "
+            f"({args.output.stat().st_size} bytes, {args.results.stat().st_size} bytes as table)."
+        )
+    elif args.output is not None:
+        num_profiles = import_to_table(
+            args.input, args.output, args.reference, args.append
+        )
+        print(f"{num_profiles} profiles written to {args.output}.")
+    else:
+        num_profiles = import_to_database(args.input, args.database, args.reference)
+        print(f"{num_profiles} profiles added to {args.database}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,312 @@
+import argparse
+from datetime import datetime
+from pathlib import Path
+import sys
+import time
+from typing import Any, Optional, TextIO
+import yaml
+
+# Prefix of the structured timing lines written to the logs by
+# chewbbaca_per_genus.sh: JUNO_TIMING<tab>stage<tab>start|end<tab>epoch
+TIMING_MARKER = "JUNO_TIMING"
+# Columns of the benchmark files written by Snakemake that are reported
+BENCHMARK_COLUMNS = {
+    "s": "wall_time_s",
+    "cpu_time": "cpu_time_s",
+    "max_rss": "max_rss_mb",
+    "io_in": "io_in_mb",
+    "io_out": "io_out_mb",
+}
+
+
+def mark_stages(
+    input_stream: TextIO, output_stream: TextIO, prefix: str = "chewbbaca"
+) -> None:
+    """Copy the (chewBBACA) output line by line, adding a timing marker at
+    every section header ('== CDS prediction ==') so the duration of each
+    of the chewBBACA stages can be calculated afterwards"""
+    current_stage = None
+    for line in input_stream:
+        stripped_line = line.strip()
+        if stripped_line.startswith("==") and stripped_line.endswith("=="):
+            now = int(time.time())
+            if current_stage is not None:
+                output_stream.write(f"{TIMING_MARKER}\t{current_stage}\tend\t{now}\n")
+            current_stage = prefix + ":" + stripped_line.strip("= ")
+            output_stream.write(f"{TIMING_MARKER}\t{current_stage}\tstart\t{now}\n")
+        output_stream.write(line)
+        output_stream.flush()
+    if current_stage is not None:
+        output_stream.write(
+            f"{TIMING_MARKER}\t{current_stage}\tend\t{int(time.time())}\n"
+        )
+
+
+def parse_stage_timings(log_file: Path) -> dict[str, int]:
+    """Get the duration (seconds) of every stage marked in a log file"""
+    starts: dict[str, int] = {}
+    durations: dict[str, int] = {}
+    with open(log_file, errors="replace") as file_:
+        for line in file_:
+            if not line.startswith(TIMING_MARKER):
+                continue
+            try:
+                _, stage, event, epoch = line.rstrip("\n").split("\t")
+                timestamp = int(float(epoch))
+            except ValueError:
+                continue
+            if event == "start":
+                starts[stage] = timestamp
+            elif event == "end" and stage in starts:
+                durations[stage] = (
+                    durations.get(stage, 0) + timestamp - starts.pop(stage)
+                )
+    return durations
+
+
+def parse_benchmark_file(benchmark_file: Path) -> dict[str, Optional[float]]:
+    """Read the (last) measurement of a Snakemake benchmark file"""
+    with open(benchmark_file) as file_:
+        lines = [line.rstrip("\n").split("\t") for line in file_ if line.strip()]
+    header, values = lines[0], lines[-1]
+    measurement: dict[str, Optional[float]] = {}
+    for column, name in BENCHMARK_COLUMNS.items():
+        try:
+            measurement[name] = round(float(values[header.index(column)]), 2)
+        except (ValueError, IndexError):
+            measurement[name] = None
+    return measurement
+
+
+def count_samples_and_loci(result_table: Path) -> tuple[int, int]:
+    """Number of samples (rows) and loci (columns) in a chewBBACA result"""
+    with open(result_table) as file_:
+        header = file_.readline().rstrip("\n").split("\t")
+        num_samples = sum(1 for line in file_ if line.strip())
+    return num_samples, len(header) - 1
+
+
+# Rules that type the samples in priority batches (benchmark files named
+# <scheme>.<tier>_<number>): directory of their logs and results, and the
+# name of their rollup per scheme in the report
+BATCH_RULES = {
+    "cgmlst_per_batch": ("cgmlst", "cgmlst_per_scheme"),
+    "triage_per_batch": ("triage", "triage_per_scheme"),
+}
+# Measurements that are summed or maximized over the batches of a scheme
+SUMMED_COLUMNS = ["wall_time_s", "cpu_time_s", "io_in_mb", "io_out_mb"]
+MAX_COLUMNS = ["max_rss_mb"]
+
+
+def add_throughput(job_report: dict[str, Any]) -> None:
+    wall_time = job_report.get("wall_time_s")
+    if wall_time and "samples" in job_report:
+        job_report["samples_per_s"] = round(job_report["samples"] / wall_time, 4)
+        job_report["loci_per_s"] = round(
+            job_report["samples"] * job_report["loci"] / wall_time, 2
+        )
+
+
+def rollup_batches(batch_reports: dict[str, dict[str, Any]]) -> dict[str, Any]:
+    """Report per scheme from the reports of its batches: the samples, the
+    wall time, CPU time, I/O and stage durations are summed over the batches
+    (so the throughput is per second of job time, also when batches ran at
+    the same time) and the peak memory is the highest of the batches"""
+    schemes: dict[str, dict[str, Any]] = {}
+    for key, batch_report in batch_reports.items():
+        scheme = key.rpartition(".")[0]
+        scheme_report = schemes.setdefault(scheme, {"batches": 0})
+        scheme_report["batches"] += 1
+        for column in SUMMED_COLUMNS:
+            if batch_report.get(column) is not None:
+                scheme_report[column] = round(
+                    scheme_report.get(column, 0) + batch_report[column], 2
+                )
+        for column in MAX_COLUMNS:
+            if batch_report.get(column) is not None:
+                scheme_report[column] = max(
+                    scheme_report.get(column, 0), batch_report[column]
+                )
+        if "samples" in batch_report:
+            scheme_report["samples"] = (
+                scheme_report.get("samples", 0) + batch_report["samples"]
+            )
+            scheme_report["loci"] = max(
+                scheme_report.get("loci", 0), batch_report["loci"]
+            )
+        for stage, seconds in batch_report.get("stages_s", {}).items():
+            stages = scheme_report.setdefault("stages_s", {})
+            stages[stage] = stages.get(stage, 0) + seconds
+    for scheme_report in schemes.values():
+        add_throughput(scheme_report)
+    return schemes
+
+
+class RunReport:
+    """
+    Structured report of the resources used by one run of the pipeline. It
+    combines the benchmark files that Snakemake writes per rule (and per
+    batch), the timing markers in the logs of the chewBBACA runs and the
+    size of the results
+    """
+
+    def __init__(
+        self,
+        output_dir: Path,
+        extra_timings: Optional[dict[str, float]] = None,
+        succeeded: Optional[bool] = None,
+    ) -> None:
+        self.output_dir = Path(output_dir)
+        # None if it is not known whether the run succeeded (e.g. 'collect')
+        self.succeeded = succeeded
+        self.benchmark_dir = self.output_dir.joinpath("log", "benchmark")
+        self.extra_timings = extra_timings or {}
+
+    def __collect_rule(self, rule_dir: Path) -> dict[str, Any]:
+        rule_report = {}
+        for benchmark_file in sorted(rule_dir.glob("*.tsv")):
+            rule_report[benchmark_file.stem] = parse_benchmark_file(benchmark_file)
+        return rule_report
+
+    def __add_batch_stats(
+        self, step: str, scheme: str, batch: str, batch_report: dict[str, Any]
+    ) -> None:
+        log_file = self.output_dir.joinpath(
+            "log", step, f"chewbbaca_{scheme}.{batch}.log"
+        )
+        if log_file.is_file():
+            batch_report["stages_s"] = parse_stage_timings(log_file)
+        result_table = self.output_dir.joinpath(
+            step, scheme, "batches", batch, "results_alleles.tsv"
+        )
+        if result_table.is_file():
+            num_samples, num_loci = count_samples_and_loci(result_table)
+            batch_report["samples"] = num_samples
+            batch_report["loci"] = num_loci
+            add_throughput(batch_report)
+
+    def collect(self) -> dict[str, Any]:
+        rules: dict[str, Any] = {}
+        if self.benchmark_dir.is_dir():
+            for rule_dir in sorted(self.benchmark_dir.iterdir()):
+                if rule_dir.is_dir():
+                    rules[rule_dir.name] = self.__collect_rule(rule_dir)
+        # Allele calling and triage in priority batches, also summed per
+        # scheme
+        for rule, (step, rollup_rule) in BATCH_RULES.items():
+            if rule not in rules:
+                continue
+            for key, batch_report in rules[rule].items():
+                scheme, _, batch = key.rpartition(".")
+                self.__add_batch_stats(step, scheme, batch, batch_report)
+            rules[rollup_rule] = rollup_batches(rules[rule])
+        self.report = {
+            "date": datetime.now().strftime("%d-%m-%Y %H:%M:%S"),
+            "output_dir": str(self.output_dir.absolute()),
+            "timings_s": {
+                name: round(seconds, 2) for name, seconds in self.extra_timings.items()
+            },
+            "rules": rules,
+        }
+        if self.succeeded is not None:
+            self.report["status"] = "succeeded" if self.succeeded else "failed"
+        return self.report
+
+    def write(self, report_file: Path) -> None:
+        report = self.collect()
+        report_file.parent.mkdir(parents=True, exist_ok=True)
+        with open(report_file, "w") as file_:
+            yaml.dump(report, file_, default_flow_style=False, sort_keys=False)
+
+
+def compare_reports(
+    report_files: list[Path], metric: str = "wall_time_s"
+) -> list[list[str]]:
+    """Make a table with one row per rule/scheme and one column per report
+    with the chosen metric. The last column is the change of the last report
+    relative to the first one"""
+    reports = []
+    for report_file in report_files:
+        with open(report_file) as file_:
+            reports.append(yaml.safe_load(file_))
+    keys: list[tuple[str, str]] = []
+    for report in reports:
+        for rule, jobs in report.get("rules", {}).items():
+            for job in jobs:
+                if (rule, job) not in keys:
+                    keys.append((rule, job))
+    table = [["rule", "job", *[str(file_) for file_ in report_files], "change"]]
+    for rule, job in keys:
+        values = [
+            report.get("rules", {}).get(rule, {}).get(job, {}).get(metric)
+            for report in reports
+        ]
+        change = "NA"
+        if values[0] and values[-1] is not None:
+            change = f"{(values[-1] - values[0]) / values[0] * 100:+.1f}%"
+        table.append(
+            [
+                rule,
+                job,
+                *["NA" if value is None else str(value) for value in values],
+                change,
+            ]
+        )
+    return table
+
+
+def main() -> None:
+    argument_parser = argparse.ArgumentParser(
+        description="Make or compare reports of the resources used by Juno-cgMLST runs."
+    )
+    subparsers = argument_parser.add_subparsers(dest="command", required=True)
+    collect_parser = subparsers.add_parser(
+        "collect", help="Write the report of a finished (or failed) run."
+    )
+    collect_parser.add_argument(
+        "-o",
+        "--output-dir",
+        type=Path,
+        required=True,
+        help="Output directory of the run.",
+    )
+    collect_parser.add_argument(
+        "-r",
+        "--report",
+        type=Path,
+        default=None,
+        help="Report file. Default is <output-dir>/audit_trail/run_report.yaml",
+    )
+    compare_parser = subparsers.add_parser(
+        "compare", help="Compare the reports of two or more runs."
+    )
+    compare_parser.add_argument("reports", type=Path, nargs="+")
+    compare_parser.add_argument(
+        "-m",
+        "--metric",
+        default="wall_time_s",
+        choices=[*BENCHMARK_COLUMNS.values(), "samples_per_s", "loci_per_s"],
+        help="Metric to compare.",
+    )
+    mark_parser = subparsers.add_parser(
+        "mark-stages",
+        help="Copy stdin to stdout adding timing markers at the chewBBACA section headers.",
+    )
+    mark_parser.add_argument("--prefix", default="chewbbaca")
+    args = argument_parser.parse_args()
+
+    if args.command == "collect":
+        report_file = args.report or args.output_dir.joinpath(
+            "audit_trail", "run_report.yaml"
+        )
+        RunReport(output_dir=args.output_dir).write(report_file)
+        print(f"Run report written to {report_file}")
+    elif args.command == "compare":
+        for row in compare_reports(args.reports, metric=args.metric):
+            print("\t".join(row))
+    elif args.command == "mark-stages":
+        mark_stages(sys.stdin, sys.stdout, prefix=args.prefix)
+
+
+if __name__ == "__main__":
+    main()
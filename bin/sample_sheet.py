@@ -0,0 +1,129 @@
+import argparse
+from dataclasses import dataclass, field
+import gc
+import json
+from pathlib import Path
+from typing import Any, Optional
+
+import yaml
+
+try:
+    # libyaml based loader, much faster than the pure Python one
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader  # type: ignore[assignment]
+
+COMPACT_FORMAT = "juno_cgmlst_sample_sheet"
+COMPACT_VERSION = 1
+
+
+@dataclass
+class SampleSheet:
+    """
+    Columnar representation of a sample sheet: one list per field instead of
+    one dictionary per sample, and the rows (samples) per cgMLST scheme. It
+    is saved as json, which loads much faster than the yaml sample sheet
+    for large numbers of samples.
+    """
+
+    samples: list[str] = field(default_factory=list)
+    assemblies: list[str] = field(default_factory=list)
+    genera: list[Optional[str]] = field(default_factory=list)
+    # Priority tier of every sample (None if not given in the metadata)
+    priorities: list[Optional[str]] = field(default_factory=list)
+    rows_per_scheme: dict[str, list[int]] = field(default_factory=dict)
+
+    @property
+    def schemes(self) -> list[str]:
+        return list(self.rows_per_scheme)
+
+    @classmethod
+    def from_sample_dict(cls, sample_dict: dict[str, dict[str, Any]]) -> "SampleSheet":
+        sample_sheet = cls(
+            samples=list(sample_dict),
+            assemblies=[str(info["assembly"]) for info in sample_dict.values()],
+            genera=[info.get("genus") for info in sample_dict.values()],
+            priorities=[info.get("priority") for info in sample_dict.values()],
+        )
+        for row, info in enumerate(sample_dict.values()):
+            for scheme in info.get("cgmlst_scheme") or []:
+                if scheme:
+                    sample_sheet.rows_per_scheme.setdefault(scheme, []).append(row)
+        return sample_sheet
+
+    def write(self, output_file: Path) -> None:
+        """Write the compact (json) sample sheet"""
+        output_file = Path(output_file)
+        output_file.parent.mkdir(parents=True, exist_ok=True)
+        with open(output_file, "w") as file_:
+            json.dump(
+                {
+                    "format": COMPACT_FORMAT,
+                    "version": COMPACT_VERSION,
+                    "samples": self.samples,
+                    "assemblies": self.assemblies,
+                    "genera": self.genera,
+                    "priorities": self.priorities,
+                    "rows_per_scheme": self.rows_per_scheme,
+                },
+                file_,
+                separators=(",", ":"),
+            )
+
+    def write_samples_per_scheme(self, output_dir: Path) -> dict[str, int]:
+        """Write the assemblies of every scheme to <scheme>_samples.txt (one
+        write per scheme) and return the number of samples per scheme"""
+        output_dir = Path(output_dir)
+        for scheme, rows in self.rows_per_scheme.items():
+            with open(output_dir.joinpath(scheme + "_samples.txt"), "w") as file_:
+                file_.write("".join(self.assemblies[row] + "\n" for row in rows))
+        return {scheme: len(rows) for scheme, rows in self.rows_per_scheme.items()}
+
+
+def load_sample_sheet(sample_sheet_file: Path) -> SampleSheet:
+    """Load a compact (json) sample sheet or a yaml sample sheet as written
+    by juno_cgmlst.py ({sample: {assembly: ..., cgmlst_scheme: [...]}})"""
+    with open(sample_sheet_file) as file_:
+        if Path(sample_sheet_file).suffix == ".json":
+            content = json.load(file_)
+            if content.get("format") != COMPACT_FORMAT:
+                raise ValueError(
+                    f"{sample_sheet_file} is not a compact sample sheet of Juno-cgMLST."
+                )
+            return SampleSheet(
+                samples=content["samples"],
+                assemblies=content["assemblies"],
+                genera=content["genera"],
+                priorities=content.get("priorities") or [],
+                rows_per_scheme=content["rows_per_scheme"],
+            )
+        # The garbage collector only slows down building the (many) small
+        # dictionaries of a large sample sheet, they are never cyclic
+        gc.disable()
+        try:
+            sample_dict = yaml.load(file_, Loader=SafeLoader) or {}
+        finally:
+            gc.enable()
+    return SampleSheet.from_sample_dict(sample_dict)
+
+
+def main() -> None:
+    argument_parser = argparse.ArgumentParser(
+        description="Convert a yaml sample sheet to the compact (json) sample sheet."
+    )
+    argument_parser.add_argument(
+        "-s",
+        "--sample-sheet",
+        type=Path,
+        required=True,
+        help="Sample sheet (yaml file) made by juno_cgmlst.py.",
+    )
+    argument_parser.add_argument(
+        "-o", "--output", type=Path, required=True, help="Output json file."
+    )
+    args = argument_parser.parse_args()
+    load_sample_sheet(args.sample_sheet).write(args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,328 @@
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import csv
+import hashlib
+from pathlib import Path
+from typing import Any, Iterable, Optional
+
+import numpy as np
+import numpy.typing as npt
+
+from bin.cds_cache import read_fasta
+
+SIGNATURES_DIR = "scheme_signatures"
+DETECTION_COLUMNS = ["sample", "status", "cgmlst_scheme", "containment"]
+
+# 2-bit code of every nucleotide, 4 for anything else (N, IUPAC codes...)
+NUCLEOTIDE_CODES = np.full(256, 4, dtype=np.uint64)
+for code, nucleotides in enumerate(["Aa", "Cc", "Gg", "Tt"]):
+    for nucleotide in nucleotides:
+        NUCLEOTIDE_CODES[ord(nucleotide)] = code
+
+
+def mix64(values: npt.NDArray[np.uint64]) -> npt.NDArray[np.uint64]:
+    """Finalizer of splitmix64 to spread the k-mer codes over 64 bits"""
+    values = values ^ (values >> np.uint64(30))
+    values = values * np.uint64(0xBF58476D1CE4E5B9)
+    values = values ^ (values >> np.uint64(27))
+    values = values * np.uint64(0x94D049BB133111EB)
+    return values ^ (values >> np.uint64(31))
+
+
+def sketch_sequences(
+    sequences: Iterable[str], kmer_size: int = 21, scaled: int = 200
+) -> npt.NDArray[np.uint64]:
+    """FracMinHash sketch of a set of sequences: the (sorted, unique) hashes
+    of the canonical k-mers that fall in the lowest 1/scaled of the hash
+    space. Every k-mer is hashed at once with numpy per sequence"""
+    assert kmer_size <= 32, "k-mers longer than 32 nucleotides do not fit in 64 bits"
+    max_hash = np.uint64((2**64 - 1) // scaled)
+    shift = np.uint64(2)
+    sketches = [np.array([], dtype=np.uint64)]
+    for sequence in sequences:
+        codes = NUCLEOTIDE_CODES[np.frombuffer(sequence.encode(), dtype=np.uint8)]
+        num_kmers = len(codes) - kmer_size + 1
+        if num_kmers <= 0:
+            continue
+        invalid = np.concatenate([[0], np.cumsum(codes == 4)])
+        valid = invalid[kmer_size:] - invalid[:num_kmers] == 0
+        codes = codes & np.uint64(3)
+        forward = np.zeros(num_kmers, dtype=np.uint64)
+        reverse = np.zeros(num_kmers, dtype=np.uint64)
+        for position in range(kmer_size):
+            window = codes[position : position + num_kmers]
+            forward = (forward << shift) | window
+            reverse = reverse | ((np.uint64(3) - window) << np.uint64(2 * position))
+        hashes = mix64(np.minimum(forward, reverse)[valid])
+        sketches.append(hashes[hashes <= max_hash])
+    return np.unique(np.concatenate(sketches))
+
+
+def sketch_assembly(
+    assembly: Path, kmer_size: int = 21, scaled: int = 200
+) -> npt.NDArray[np.uint64]:
+    return sketch_sequences(
+        (sequence for _, sequence in read_fasta(assembly)), kmer_size, scaled
+    )
+
+
+def representative_alleles(scheme_dir: Path) -> list[str]:
+    """First allele of every locus of a (prepared or downloaded) scheme. An
+    isolate carries one allele per locus so using all the alleles would
+    underestimate how much of the scheme is found in an isolate"""
+    alleles = []
+    for locus_file in sorted(Path(scheme_dir).glob("*.fasta")):
+        for _, sequence in read_fasta(locus_file):
+            alleles.append(sequence)
+            break
+    return alleles
+
+
+def containment(
+    signature: npt.NDArray[np.uint64], sketch: npt.NDArray[np.uint64]
+) -> float:
+    """Fraction of the hashes of the scheme signature found in a sketch"""
+    if len(signature) == 0:
+        return 0.0
+    return len(np.intersect1d(signature, sketch, assume_unique=True)) / len(signature)
+
+
+def scheme_fingerprint(scheme_dir: Path) -> str:
+    """Hash of the name, size and modification time of the locus files of
+    a scheme, which changes when the scheme is downloaded or prepared again"""
+    sha1 = hashlib.sha1()
+    for locus_file in sorted(Path(scheme_dir).glob("*.fasta")):
+        stat = locus_file.stat()
+        sha1.update(f"{locus_file.name}\t{stat.st_size}\t{stat.st_mtime_ns}\n".encode())
+    return sha1.hexdigest()
+
+
+class SchemeSignatures:
+    """
+    Compact signatures (FracMinHash sketches of one allele per locus) of the
+    cgMLST schemes, saved in <db_dir>/scheme_signatures/<scheme>.npz. They
+    are made from the prepared scheme, or the downloaded scheme if it was not
+    prepared yet, the first time they are needed. A saved signature is made
+    again when the scheme it was made from changed (e.g. it was downloaded
+    again).
+    """
+
+    def __init__(self, db_dir: Path, kmer_size: int = 21, scaled: int = 200) -> None:
+        self.db_dir = Path(db_dir)
+        self.signatures_dir = self.db_dir.joinpath(SIGNATURES_DIR)
+        self.kmer_size = kmer_size
+        self.scaled = scaled
+        self.signatures: dict[str, Optional[npt.NDArray[np.uint64]]] = {}
+
+    def source(self, scheme: str) -> Optional[Path]:
+        """Directory of the scheme the signature is made from"""
+        for scheme_dir in [
+            self.db_dir.joinpath("prepared_schemes", scheme),
+            self.db_dir.joinpath("downloaded_schemes", scheme),
+        ]:
+            if any(scheme_dir.glob("*.fasta")):
+                return scheme_dir
+        return None
+
+    def build(self, scheme: str) -> Optional[npt.NDArray[np.uint64]]:
+        scheme_dir = self.source(scheme)
+        if scheme_dir is None:
+            return None
+        alleles = representative_alleles(scheme_dir)
+        signature = sketch_sequences(alleles, self.kmer_size, self.scaled)
+        self.signatures_dir.mkdir(parents=True, exist_ok=True)
+        tmp_file = self.signatures_dir.joinpath(f".{scheme}.tmp.npz")
+        np.savez(
+            tmp_file,
+            hashes=signature,
+            kmer_size=self.kmer_size,
+            scaled=self.scaled,
+            num_loci=len(alleles),
+            fingerprint=scheme_fingerprint(scheme_dir),
+        )
+        tmp_file.replace(self.signatures_dir.joinpath(f"{scheme}.npz"))
+        return signature
+
+    def get(self, scheme: str) -> Optional[npt.NDArray[np.uint64]]:
+        """Signature of a scheme or None if the scheme is not available"""
+        if scheme not in self.signatures:
+            scheme_dir = self.source(scheme)
+            signature_file = self.signatures_dir.joinpath(f"{scheme}.npz")
+            signature = None
+            if scheme_dir is not None and signature_file.is_file():
+                with np.load(signature_file) as saved:
+                    if (
+                        int(saved["kmer_size"]) == self.kmer_size
+                        and int(saved["scaled"]) == self.scaled
+                        and "fingerprint" in saved
+                        and str(saved["fingerprint"]) == scheme_fingerprint(scheme_dir)
+                    ):
+                        signature = saved["hashes"]
+            if signature is None:
+                signature = self.build(scheme)
+            self.signatures[scheme] = signature
+        return self.signatures[scheme]
+
+
+def read_overrides(override_file: Path) -> dict[str, list[str]]:
+    """Schemes per sample given by the user (tsv file without header with
+    the sample and a comma separated list of schemes, which can be empty)"""
+    with open(override_file) as file_:
+        reader = csv.reader(file_, delimiter="\t")
+        return {
+            row[0].strip(): [
+                scheme.strip().lower()
+                for scheme in (row[1] if len(row) > 1 else "").split(",")
+                if scheme.strip()
+            ]
+            for row in reader
+            if row and not row[0].startswith("#")
+        }
+
+
+def _sketch_sample(arguments: tuple[str, Path, int, int]) -> tuple[str, Any]:
+    sample, assembly, kmer_size, scaled = arguments
+    return sample, sketch_assembly(assembly, kmer_size, scaled)
+
+
+class SchemeDetection:
+    """
+    Choose the cgMLST schemes of every sample based on its content. Every
+    assembly is sketched and compared to the signature of each candidate
+    scheme (the schemes of the genus of the sample or, if the genus has no
+    scheme, all the schemes with a signature). A sample is typed against
+    the schemes whose signature is found well enough in the assembly. If the
+    containment is in between the two thresholds the detection is unsure
+    and the scheme is kept. Overrides given by the user always win.
+    """
+
+    def __init__(
+        self,
+        signatures: SchemeSignatures,
+        min_containment: float = 0.3,
+        unsure_containment: float = 0.1,
+        overrides: Optional[dict[str, list[str]]] = None,
+        threads: int = 1,
+    ) -> None:
+        self.signatures = signatures
+        self.min_containment = min_containment
+        self.unsure_containment = unsure_containment
+        self.overrides = overrides or {}
+        self.threads = threads
+
+    def detect(
+        self, assemblies: dict[str, Path], candidates: dict[str, list[str]]
+    ) -> list[dict[str, Any]]:
+        """Detection result (status, schemes and containment per candidate
+        scheme) of every sample"""
+        to_sketch = [
+            (sample, Path(assembly), self.signatures.kmer_size, self.signatures.scaled)
+            for sample, assembly in assemblies.items()
+            if sample not in self.overrides
+        ]
+        with ProcessPoolExecutor(max_workers=max(self.threads, 1)) as executor:
+            sketches = dict(executor.map(_sketch_sample, to_sketch, chunksize=4))
+        results = []
+        for sample in assemblies:
+            if sample in self.overrides:
+                results.append(
+                    {
+                        "sample": sample,
+                        "status": "override",
+                        "cgmlst_scheme": self.overrides[sample],
+                        "containment": {},
+                    }
+                )
+                continue
+            results.append(
+                self.__choose_schemes(sample, sketches[sample], candidates[sample])
+            )
+        return results
+
+    def __choose_schemes(
+        self, sample: str, sketch: npt.NDArray[np.uint64], candidates: list[str]
+    ) -> dict[str, Any]:
+        schemes = []
+        scores = {}
+        unsure = False
+        for scheme in candidates:
+            signature = self.signatures.get(scheme)
+            if signature is None:
+                # Schemes that are not available yet cannot be ruled out
+                schemes.append(scheme)
+                unsure = True
+                continue
+            score = containment(signature, sketch)
+            scores[scheme] = round(score, 3)
+            if score >= self.min_containment:
+                schemes.append(scheme)
+            elif score >= self.unsure_containment:
+                schemes.append(scheme)
+                unsure = True
+        if unsure:
+            status = "unsure"
+        elif schemes:
+            status = "detected"
+        else:
+            status = "not_detected"
+        return {
+            "sample": sample,
+            "status": status,
+            "cgmlst_scheme": schemes,
+            "containment": scores,
+        }
+
+
+def write_detection_report(results: list[dict[str, Any]], report_file: Path) -> None:
+    report_file = Path(report_file)
+    report_file.parent.mkdir(parents=True, exist_ok=True)
+    with open(report_file, "w") as file_:
+        writer = csv.writer(file_, delimiter="\t", lineterminator="\n")
+        writer.writerow(DETECTION_COLUMNS)
+        for result in results:
+            writer.writerow(
+                [
+                    result["sample"],
+                    result["status"],
+                    ",".join(result["cgmlst_scheme"]),
+                    ",".join(
+                        f"{scheme}:{score}"
+                        for scheme, score in result["containment"].items()
+                    ),
+                ]
+            )
+
+
+def main() -> None:
+    argument_parser = argparse.ArgumentParser(
+        description="Build the signatures of the cgMLST schemes used to detect the schemes of every sample."
+    )
+    argument_parser.add_argument(
+        "-d",
+        "--db-dir",
+        type=Path,
+        required=True,
+        help="Directory with the downloaded and prepared schemes.",
+    )
+    argument_parser.add_argument(
+        "-g",
+        "--genus",
+        type=str,
+        nargs="+",
+        required=True,
+        help="Scheme(s) to build the signature of.",
+    )
+    argument_parser.add_argument("-k", "--kmer-size", type=int, default=21)
+    argument_parser.add_argument("--scaled", type=int, default=200)
+    args = argument_parser.parse_args()
+    signatures = SchemeSignatures(args.db_dir, args.kmer_size, args.scaled)
+    for scheme in args.genus:
+        signature = signatures.build(scheme.lower())
+        if signature is None:
+            print(f"The {scheme} scheme was not found in {args.db_dir}.")
+        else:
+            print(f"Signature of the {scheme} scheme: {len(signature)} hashes.")
+
+
+if __name__ == "__main__":
+    main()
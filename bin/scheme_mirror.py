@@ -0,0 +1,84 @@
+import hashlib
+import json
+from pathlib import Path
+import time
+from typing import Any, Optional
+from urllib.parse import urlparse
+from urllib.request import url2pathname
+
+
+def mirror_base_url(mirror: str) -> str:
+    """Accept a local directory, a file:// url or an http(s):// url as mirror
+    and return it as url without trailing slash"""
+    if "://" not in mirror:
+        mirror = Path(mirror).absolute().as_uri()
+    return mirror.rstrip("/")
+
+
+def mirror_url(url: str, mirror: str) -> str:
+    """Url of the copy of a remote url in a mirror. The host and path of the
+    original url are kept so a mirror can contain several sources, e.g.
+    https://rest.pubmlst.org/db/x/schemes/4 -> <mirror>/rest.pubmlst.org/db/x/schemes/4
+    """
+    parsed_url = urlparse(url)
+    return f"{mirror_base_url(mirror)}/{parsed_url.netloc}{parsed_url.path}"
+
+
+def mirror_path(url: str, mirror_dir: Path) -> Path:
+    """File in a mirror directory where the content of a remote url is kept.
+    Directory listings (urls ending with '/') are saved as index.html so that
+    they are also served by a simple http server ('python -m http.server')"""
+    parsed_url = urlparse(url)
+    path = Path(mirror_dir).joinpath(parsed_url.netloc, parsed_url.path.lstrip("/"))
+    if parsed_url.path.endswith("/") or parsed_url.path == "":
+        path = path.joinpath("index.html")
+    return path
+
+
+def local_file_from_url(url: str) -> Path:
+    """Local file pointed by a file:// url (index.html for directories)"""
+    path = Path(url2pathname(urlparse(url).path))
+    if url.endswith("/") or path.is_dir():
+        path = path.joinpath("index.html")
+    return path
+
+
+class CatalogCache:
+    """
+    Cache of the (parsed) catalogs of the cgMLST schemes, i.e. the list of
+    loci in a scheme as found in the directory listing of Enterobase or
+    SeqSphere+ or the scheme description of PubMLST. Entries expire after
+    ttl_seconds so that new versions of a scheme are eventually noticed
+    """
+
+    def __init__(self, cache_dir: Path, ttl_seconds: float = 7 * 24 * 3600) -> None:
+        self.cache_dir = Path(cache_dir)
+        self.ttl_seconds = ttl_seconds
+
+    def __entry(self, url: str) -> Path:
+        return self.cache_dir.joinpath(hashlib.sha1(url.encode()).hexdigest() + ".json")
+
+    def get(self, url: str) -> Optional[Any]:
+        entry = self.__entry(url)
+        if not entry.is_file():
+            return None
+        try:
+            with open(entry) as file_:
+                cached = json.load(file_)
+        except json.JSONDecodeError:
+            return None
+        if cached.get("url") != url:
+            return None
+        if time.time() - cached.get("fetched_at", 0) > self.ttl_seconds:
+            return None
+        return cached["catalog"]
+
+    def put(self, url: str, catalog: Any) -> None:
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        entry = self.__entry(url)
+        tmp_entry = entry.with_suffix(".tmp")
+        with open(tmp_entry, "w") as file_:
+            json.dump(
+                {"url": url, "fetched_at": time.time(), "catalog": catalog}, file_
+            )
+        tmp_entry.replace(entry)
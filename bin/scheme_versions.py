@@ -0,0 +1,271 @@
+import argparse
+from datetime import datetime
+from itertools import count
+import os
+from pathlib import Path
+import shutil
+import stat
+from typing import Any, Generator, Optional
+
+import yaml
+
+from bin.cds_cache import file_sha1
+
+# Parts of a scheme that are kept in every version (name in the version
+# directory: directory in db_dir where the working copy lives)
+SCHEME_PARTS = {
+    "downloaded": "downloaded_schemes",
+    "prepared": "prepared_schemes",
+}
+MANIFEST_FILE = "scheme_version.yaml"
+
+
+def parse_version_selector(selectors: Optional[list[str]]) -> dict[str, str]:
+    """Parse the values of --scheme_version. Every value is either a version
+    name, which is used for all schemes, or scheme=version. The version for
+    all schemes is stored under the key '*'"""
+    versions: dict[str, str] = {}
+    for selector in selectors or []:
+        scheme, _, version = selector.rpartition("=")
+        versions[scheme.strip().lower() or "*"] = version.strip()
+    return versions
+
+
+class SchemeVersions:
+    """
+    Named and immutable versions of the cgMLST schemes (both the downloaded
+    and the prepared scheme) under db_dir/scheme_versions/<scheme>/<version>.
+    Every distinct file is saved once in a content store (db_dir/scheme_store),
+    named by the sha1 of its content. The files of every version are hard
+    links to the store, so a new version only takes the space of the files
+    that changed. The prepared scheme is never written to (the allele
+    calling runs with --no-inferred and novel alleles are kept in a registry
+    outside of the scheme). The files in the store are read-only and a
+    version is never modified once it is written.
+    """
+
+    def __init__(self, db_dir: Path) -> None:
+        self.db_dir = Path(db_dir)
+        self.store_dir = self.db_dir.joinpath("scheme_store")
+        self.versions_dir = self.db_dir.joinpath("scheme_versions")
+
+    def version_dir(self, scheme: str, version: str) -> Path:
+        return self.versions_dir.joinpath(scheme, version)
+
+    def list_versions(self, scheme: str) -> list[str]:
+        scheme_dir = self.versions_dir.joinpath(scheme)
+        if not scheme_dir.is_dir():
+            return []
+        return sorted(
+            version_dir.name
+            for version_dir in scheme_dir.iterdir()
+            if version_dir.joinpath(MANIFEST_FILE).is_file()
+        )
+
+    def read_manifest(self, scheme: str, version: str) -> dict[str, Any]:
+        manifest_file = self.version_dir(scheme, version).joinpath(MANIFEST_FILE)
+        if not manifest_file.is_file():
+            available = ", ".join(self.list_versions(scheme)) or "none"
+            raise ValueError(
+                f"Version {version} of the {scheme} scheme does not exist in "
+                f"{self.versions_dir}. Available versions: {available}."
+            )
+        with open(manifest_file) as file_:
+            manifest: dict[str, Any] = yaml.safe_load(file_)
+        return manifest
+
+    def default_version_name(self, scheme: str) -> str:
+        """Name a version after the time the scheme was downloaded (as found
+        in downloaded_scheme.yaml), e.g. 20220506-101500. Databases with only
+        a prepared scheme (e.g. copied from another machine) have no
+        download information: their versions are named after the oldest
+        file of the scheme, which does not change when files are added"""
+        download_info_file = self.db_dir.joinpath(
+            SCHEME_PARTS["downloaded"], scheme, "downloaded_scheme.yaml"
+        )
+        try:
+            with open(download_info_file) as file_:
+                download_info = yaml.safe_load(file_)
+            timestamp = datetime.strptime(
+                download_info["timestamp"], "%d-%m-%Y %H:%M:%S"
+            )
+        except (FileNotFoundError, KeyError, TypeError, ValueError):
+            working_files = self.__working_files(scheme)
+            if not working_files:
+                raise FileNotFoundError(
+                    f"There is no downloaded or prepared {scheme} scheme in {self.db_dir}."
+                )
+            timestamp = datetime.fromtimestamp(
+                min(file_path.stat().st_mtime for file_path, _ in working_files)
+            )
+        return timestamp.strftime("%Y%m%d-%H%M%S")
+
+    def __store_file(self, file_path: Path) -> tuple[Path, str, bool]:
+        """Add a file to the content store (if it is not there yet) and
+        return the stored object, its sha1 and whether it is new"""
+        sha1 = file_sha1(file_path)
+        stored_file = self.store_dir.joinpath(sha1[:2], sha1)
+        if stored_file.is_file():
+            return stored_file, sha1, False
+        stored_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = stored_file.with_name(f"{sha1}.tmp-{os.getpid()}")
+        shutil.copyfile(file_path, tmp_file)
+        tmp_file.chmod(stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+        os.replace(tmp_file, stored_file)
+        return stored_file, sha1, True
+
+    @staticmethod
+    def __link(stored_file: Path, destination: Path) -> None:
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            os.link(stored_file, destination)
+        except OSError:
+            # Hard links are not possible across file systems
+            shutil.copy2(stored_file, destination)
+
+    def __working_files(self, scheme: str) -> list[tuple[Path, Path]]:
+        """(file, path in a version) of all files of the current downloaded
+        and prepared scheme"""
+        working_files = []
+        for part, working_dir_name in SCHEME_PARTS.items():
+            working_dir = self.db_dir.joinpath(working_dir_name, scheme)
+            if not working_dir.is_dir():
+                continue
+            for file_path in sorted(working_dir.rglob("*")):
+                if file_path.is_file():
+                    working_files.append(
+                        (file_path, Path(part, file_path.relative_to(working_dir)))
+                    )
+        return working_files
+
+    def __candidate_names(self, scheme: str) -> Generator[str, None, None]:
+        """Default version name and, if the scheme was prepared or changed
+        after a version was saved, numbered variations of it"""
+        default_name = self.default_version_name(scheme)
+        yield default_name
+        for number in count(2):
+            yield f"{default_name}.{number}"
+
+    def snapshot(self, scheme: str, version: Optional[str] = None) -> dict[str, Any]:
+        """Save the current downloaded and prepared scheme as a new version
+        and return its manifest. If the version already exists with the same
+        content, the existing version is returned"""
+        working_files = self.__working_files(scheme)
+        if not working_files:
+            raise ValueError(
+                f"There is no downloaded or prepared {scheme} scheme in {self.db_dir}."
+            )
+        tmp_dir = self.versions_dir.joinpath(scheme, f".snapshot.tmp-{os.getpid()}")
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        files: dict[str, str] = {}
+        new_bytes = 0
+        shared_bytes = 0
+        for file_path, relative_path in working_files:
+            stored_file, sha1, is_new = self.__store_file(file_path)
+            self.__link(stored_file, tmp_dir.joinpath(relative_path))
+            files[str(relative_path)] = sha1
+            if is_new:
+                new_bytes += stored_file.stat().st_size
+            else:
+                shared_bytes += stored_file.stat().st_size
+
+        names = [version] if version is not None else self.__candidate_names(scheme)
+        for name in names:
+            if not self.version_dir(scheme, name).is_dir():
+                version = name
+                break
+            manifest = self.read_manifest(scheme, name)
+            if manifest["files"] == files:
+                shutil.rmtree(tmp_dir)
+                return manifest
+        else:
+            shutil.rmtree(tmp_dir)
+            raise ValueError(
+                f"Version {version} of the {scheme} scheme already exists "
+                "with a different content. Scheme versions cannot be "
+                "modified, please choose another version name."
+            )
+        manifest = {
+            "scheme": scheme,
+            "version": version,
+            "created": datetime.now().strftime("%d-%m-%Y %H:%M:%S"),
+            "prepared": any(path.startswith("prepared/") for path in files),
+            "new_mb": round(new_bytes / 1e6, 2),
+            "shared_mb": round(shared_bytes / 1e6, 2),
+            "files": files,
+        }
+        download_info_file = tmp_dir.joinpath("downloaded", "downloaded_scheme.yaml")
+        if download_info_file.is_file():
+            with open(download_info_file) as file_:
+                manifest["download"] = yaml.safe_load(file_)
+        with open(tmp_dir.joinpath(MANIFEST_FILE), "w") as file_:
+            yaml.dump(manifest, file_, default_flow_style=False)
+        tmp_dir.rename(self.version_dir(scheme, version))
+        return manifest
+
+    def current_version(self, scheme: str) -> Optional[str]:
+        """Saved version with the same files as the current downloaded and
+        prepared scheme. Only the names and sizes of the files are compared
+        (not their content) so this is cheap to check at every run. The
+        registry of novel alleles is kept outside of the prepared scheme, so
+        registering alleles does not make a new version"""
+        try:
+            default_name = self.default_version_name(scheme)
+        except (FileNotFoundError, KeyError, TypeError, ValueError):
+            return None
+        working_files = {
+            str(relative_path): file_path.stat().st_size
+            for file_path, relative_path in self.__working_files(scheme)
+        }
+        for version in self.list_versions(scheme):
+            if version != default_name and not version.startswith(default_name + "."):
+                continue
+            version_files = {
+                relative_path: self.store_dir.joinpath(sha1[:2], sha1).stat().st_size
+                for relative_path, sha1 in self.read_manifest(scheme, version)[
+                    "files"
+                ].items()
+            }
+            if version_files == working_files:
+                return version
+        return None
+
+
+def main() -> None:
+    argument_parser = argparse.ArgumentParser(
+        description="Save and list immutable versions of the cgMLST schemes."
+    )
+    subparsers = argument_parser.add_subparsers(dest="command", required=True)
+    snapshot_parser = subparsers.add_parser(
+        "snapshot",
+        help="Save the current downloaded and prepared scheme as a new version.",
+    )
+    snapshot_parser.add_argument("-d", "--db-dir", type=Path, required=True)
+    snapshot_parser.add_argument("-g", "--genus", type=str, required=True)
+    snapshot_parser.add_argument(
+        "-v",
+        "--version",
+        type=str,
+        default=None,
+        help="Name of the version. Default is the time the scheme was downloaded.",
+    )
+    list_parser = subparsers.add_parser("list", help="List the versions of a scheme.")
+    list_parser.add_argument("-d", "--db-dir", type=Path, required=True)
+    list_parser.add_argument("-g", "--genus", type=str, required=True)
+    args = argument_parser.parse_args()
+
+    scheme_versions = SchemeVersions(args.db_dir)
+    if args.command == "snapshot":
+        manifest = scheme_versions.snapshot(args.genus.lower(), args.version)
+        print(
+            f"Version {manifest['version']} of the {manifest['scheme']} scheme saved "
+            f"({manifest['new_mb']} MB new, {manifest['shared_mb']} MB shared with "
+            "other versions)."
+        )
+    else:
+        for version in scheme_versions.list_versions(args.genus.lower()):
+            print(version)
+
+
+if __name__ == "__main__":
+    main()
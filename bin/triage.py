@@ -0,0 +1,374 @@
+import argparse
+from collections import Counter
+import csv
+from pathlib import Path
+from typing import Any, Generator, Optional
+
+import numpy as np
+import numpy.typing as npt
+
+PANEL_FILE = "panel.txt"
+REFERENCES_FILE = "reference_profiles.tsv"
+REPORT_COLUMNS = [
+    "sample",
+    "nearest_cluster",
+    "nearest_reference",
+    "distance",
+    "second_cluster",
+    "second_distance",
+    "called_panel_loci",
+    "status",
+    "full_call",
+]
+FASTA_SUFFIXES = [".fasta", ".fna", ".ffn", ".fas", ".fsa", ".fa"]
+# Triage results for which the full cgMLST allele calling is still needed
+FULL_CALL_STATUSES = ["close", "ambiguous", "incomplete", "no_reference"]
+
+
+def allele_number(allele: str) -> int:
+    """Allele id as integer (also for inferred alleles, INF-x) and 0 for the
+    loci that were not called (LNF, PLOT3, ASM, NIPH...)"""
+    allele = allele.replace("INF-", "").lstrip("*")
+    return int(allele) if allele.isdigit() else 0
+
+
+def locus_name(name: str) -> str:
+    return name[: -len(".fasta")] if name.endswith(".fasta") else name
+
+
+def sample_name(name: str) -> str:
+    """Sample name as used in the panel and reports: file name without the
+    fasta extension (as in the FILE column of chewBBACA). Other dots are part
+    of the name (e.g. 2023.001.fasta is sample 2023.001)"""
+    name = Path(name).name
+    for suffix in FASTA_SUFFIXES:
+        if name.lower().endswith(suffix):
+            return name[: -len(suffix)]
+    return name
+
+
+def read_profiles(
+    profile_table: Path,
+) -> Generator[tuple[list[str], str, list[str]], None, None]:
+    """Yield (loci, sample, alleles) for every row of a chewBBACA profile
+    table (results_alleles.tsv)"""
+    with open(profile_table) as file_:
+        reader = csv.reader(file_, delimiter="\t")
+        loci = [locus_name(locus) for locus in next(reader)[1:]]
+        for row in reader:
+            if row:
+                yield loci, sample_name(row[0]), row[1:]
+
+
+def simpson_diversity(allele_counts: Counter[str]) -> float:
+    """Simpson's index of diversity of the alleles of a locus: probability
+    that two isolates taken at random have a different allele"""
+    total = sum(allele_counts.values())
+    if total < 2:
+        return 0.0
+    same = sum(count * (count - 1) for count in allele_counts.values())
+    return 1 - same / (total * (total - 1))
+
+
+def build_panel(
+    profile_tables: list[Path],
+    panel_size: int = 200,
+    min_called_fraction: float = 0.95,
+) -> list[str]:
+    """Choose the most discriminatory loci (highest Simpson's diversity) of
+    the historical profiles, among the loci called in enough isolates"""
+    allele_counts: dict[str, Counter[str]] = {}
+    num_profiles = 0
+    for profile_table in profile_tables:
+        for loci, _, alleles in read_profiles(profile_table):
+            num_profiles += 1
+            for locus, allele in zip(loci, alleles):
+                number = allele_number(allele)
+                counts = allele_counts.setdefault(locus, Counter())
+                if number:
+                    counts[str(number)] += 1
+    candidates = [
+        locus
+        for locus, counts in allele_counts.items()
+        if sum(counts.values()) >= min_called_fraction * num_profiles
+    ]
+    candidates.sort(key=lambda locus: -simpson_diversity(allele_counts[locus]))
+    return candidates[:panel_size]
+
+
+def write_panel(
+    panel_dir: Path,
+    panel: list[str],
+    profile_tables: list[Path],
+    clusters: Optional[dict[str, str]] = None,
+) -> int:
+    """Write the panel loci and the panel alleles of the historical profiles
+    (with their cluster) to panel_dir. Returns the number of references"""
+    panel_dir = Path(panel_dir)
+    panel_dir.mkdir(parents=True, exist_ok=True)
+    with open(panel_dir.joinpath(PANEL_FILE), "w") as file_:
+        file_.write("".join(locus + "\n" for locus in panel))
+    num_references = 0
+    with open(panel_dir.joinpath(REFERENCES_FILE), "w") as file_:
+        writer = csv.writer(file_, delimiter="\t", lineterminator="\n")
+        writer.writerow(["sample", "cluster", *panel])
+        for profile_table in profile_tables:
+            columns: Optional[list[int]] = None
+            for loci, sample, alleles in read_profiles(profile_table):
+                if columns is None:
+                    index = {locus: column for column, locus in enumerate(loci)}
+                    columns = [index.get(locus, -1) for locus in panel]
+                panel_alleles = [
+                    str(allele_number(alleles[column])) if column >= 0 else "0"
+                    for column in columns
+                ]
+                cluster = (clusters or {}).get(sample, sample)
+                writer.writerow([sample, cluster, *panel_alleles])
+                num_references += 1
+    return num_references
+
+
+class TriagePanel:
+    """
+    Panel of the most discriminatory loci of a scheme together with the
+    panel alleles of historical isolates and their clusters. Isolates typed
+    only for the panel loci are compared to all the historical isolates at
+    once (distances are calculated with numpy over the whole reference
+    matrix) to find their provisional nearest cluster.
+    """
+
+    def __init__(self, panel_dir: Path) -> None:
+        self.panel_dir = Path(panel_dir)
+        with open(self.panel_dir.joinpath(PANEL_FILE)) as file_:
+            self.loci = [line.strip() for line in file_ if line.strip()]
+        references: list[list[int]] = []
+        self.reference_samples: list[str] = []
+        self.reference_clusters: list[str] = []
+        with open(self.panel_dir.joinpath(REFERENCES_FILE)) as file_:
+            reader = csv.reader(file_, delimiter="\t")
+            columns = next(reader)[2:]
+            if columns != self.loci:
+                raise ValueError(
+                    f"The reference profiles in {self.panel_dir} do not match the panel loci."
+                )
+            for row in reader:
+                self.reference_samples.append(row[0])
+                self.reference_clusters.append(row[1])
+                references.append([int(allele) for allele in row[2:]])
+        self.references: npt.NDArray[np.int64] = np.array(
+            references, dtype=np.int64
+        ).reshape(len(references), len(self.loci))
+
+    def distances(
+        self, profile: npt.NDArray[np.int64]
+    ) -> tuple[npt.NDArray[np.float64], int]:
+        """Number of different panel alleles to every reference, counting
+        only the loci called in both and scaled to the size of the panel"""
+        called = (self.references > 0) & (profile > 0)
+        different = (self.references != profile) & called
+        compared = called.sum(axis=1)
+        distances = np.full(len(self.references), np.inf)
+        has_loci = compared > 0
+        distances[has_loci] = (
+            different.sum(axis=1)[has_loci] * len(self.loci) / compared[has_loci]
+        )
+        return distances, int((profile > 0).sum())
+
+    def classify(
+        self,
+        results_table: Path,
+        close_distance: float = 5,
+        ambiguity_margin: float = 2,
+        max_missing_fraction: float = 0.1,
+    ) -> list[dict[str, Any]]:
+        """Provisional nearest cluster of every isolate in a results table of
+        the panel loci. The full allele calling is needed for isolates that
+        are close to a cluster (also if they are at a similar distance of
+        another cluster) or for which too many panel loci were not called"""
+        report = []
+        for loci, sample, alleles in read_profiles(results_table):
+            index = {locus: column for column, locus in enumerate(loci)}
+            profile = np.array(
+                [
+                    allele_number(alleles[index[locus]]) if locus in index else 0
+                    for locus in self.loci
+                ],
+                dtype=np.int64,
+            )
+            row: dict[str, Any] = {"sample": sample}
+            if len(self.references) == 0:
+                row.update(status="no_reference", called_panel_loci=0)
+            else:
+                distances, called_loci = self.distances(profile)
+                row["called_panel_loci"] = called_loci
+                order = np.argsort(distances, kind="stable")
+                nearest = int(order[0])
+                nearest_cluster = self.reference_clusters[nearest]
+                row.update(
+                    nearest_cluster=nearest_cluster,
+                    nearest_reference=self.reference_samples[nearest],
+                    distance=round(float(distances[nearest]), 2),
+                )
+                other_clusters = [
+                    int(reference)
+                    for reference in order
+                    if self.reference_clusters[reference] != nearest_cluster
+                ]
+                if other_clusters:
+                    second = other_clusters[0]
+                    row.update(
+                        second_cluster=self.reference_clusters[second],
+                        second_distance=round(float(distances[second]), 2),
+                    )
+                if called_loci < (1 - max_missing_fraction) * len(self.loci):
+                    row["status"] = "incomplete"
+                elif distances[nearest] > close_distance:
+                    # Far from every cluster, even if two of them are at a
+                    # similar distance
+                    row["status"] = "distant"
+                elif (
+                    other_clusters
+                    and distances[other_clusters[0]] - distances[nearest]
+                    <= ambiguity_margin
+                ):
+                    row["status"] = "ambiguous"
+                else:
+                    row["status"] = "close"
+            row["full_call"] = "yes" if row["status"] in FULL_CALL_STATUSES else "no"
+            report.append(row)
+        return report
+
+
+def write_report(report: list[dict[str, Any]], report_file: Path) -> None:
+    with open(report_file, "w") as file_:
+        writer = csv.DictWriter(
+            file_,
+            fieldnames=REPORT_COLUMNS,
+            delimiter="\t",
+            lineterminator="\n",
+            restval="NA",
+        )
+        writer.writeheader()
+        writer.writerows(report)
+
+
+def write_full_call_list(
+    report: list[dict[str, Any]], input_files: Path, output_file: Path
+) -> int:
+    """Write the input files of the isolates that need the full allele
+    calling (also isolates missing in the report). Returns their number"""
+    no_full_call = {row["sample"] for row in report if row["full_call"] == "no"}
+    with open(input_files) as file_:
+        selected = [
+            line
+            for line in file_
+            if line.strip() and sample_name(line.strip()) not in no_full_call
+        ]
+    with open(output_file, "w") as file_:
+        file_.writelines(selected)
+    return len(selected)
+
+
+def read_clusters(clusters_file: Path) -> dict[str, str]:
+    with open(clusters_file) as file_:
+        reader = csv.reader(file_, delimiter="\t")
+        return {sample_name(row[0]): row[1] for row in reader if len(row) >= 2}
+
+
+def main() -> None:
+    argument_parser = argparse.ArgumentParser(
+        description="Rapid triage of isolates on a panel of highly discriminatory loci."
+    )
+    subparsers = argument_parser.add_subparsers(dest="command", required=True)
+    build_parser = subparsers.add_parser(
+        "build-panel",
+        help="Choose the panel loci and the reference profiles from historical profile tables.",
+    )
+    build_parser.add_argument(
+        "-p",
+        "--profiles",
+        type=Path,
+        nargs="+",
+        required=True,
+        help="Historical profile tables (results_alleles.tsv) of the scheme.",
+    )
+    build_parser.add_argument(
+        "-c",
+        "--clusters",
+        type=Path,
+        default=None,
+        help="Tsv file with the sample and its cluster (no header). If not given, every historical isolate is its own cluster.",
+    )
+    build_parser.add_argument(
+        "-o",
+        "--panel-dir",
+        type=Path,
+        required=True,
+        help="Output directory, normally <db_dir>/triage_panels/<scheme>.",
+    )
+    build_parser.add_argument("--panel-size", type=int, default=200)
+    build_parser.add_argument(
+        "--min-called-fraction",
+        type=float,
+        default=0.95,
+        help="Minimum fraction of historical isolates in which a panel locus must be called.",
+    )
+    classify_parser = subparsers.add_parser(
+        "classify",
+        help="Find the nearest cluster of isolates typed on the panel loci.",
+    )
+    classify_parser.add_argument(
+        "-r",
+        "--results",
+        type=Path,
+        required=True,
+        help="Results table of the allele calling of the panel loci.",
+    )
+    classify_parser.add_argument("-p", "--panel-dir", type=Path, required=True)
+    classify_parser.add_argument(
+        "-i",
+        "--input-files",
+        type=Path,
+        required=True,
+        help="List of input files of the allele calling.",
+    )
+    classify_parser.add_argument(
+        "--report", type=Path, required=True, help="Output triage report."
+    )
+    classify_parser.add_argument(
+        "--full-call-list",
+        type=Path,
+        required=True,
+        help="Output list with the input files that need the full allele calling.",
+    )
+    classify_parser.add_argument("--close-distance", type=float, default=5)
+    classify_parser.add_argument("--ambiguity-margin", type=float, default=2)
+    classify_parser.add_argument("--max-missing-fraction", type=float, default=0.1)
+    args = argument_parser.parse_args()
+
+    if args.command == "build-panel":
+        panel = build_panel(args.profiles, args.panel_size, args.min_called_fraction)
+        clusters = read_clusters(args.clusters) if args.clusters else None
+        num_references = write_panel(args.panel_dir, panel, args.profiles, clusters)
+        print(
+            f"Panel of {len(panel)} loci and {num_references} reference profiles "
+            f"written to {args.panel_dir}."
+        )
+    else:
+        report = TriagePanel(args.panel_dir).classify(
+            args.results,
+            close_distance=args.close_distance,
+            ambiguity_margin=args.ambiguity_margin,
+            max_missing_fraction=args.max_missing_fraction,
+        )
+        write_report(report, args.report)
+        num_full_call = write_full_call_list(
+            report, args.input_files, args.full_call_list
+        )
+        print(
+            f"{len(report)} isolates triaged, {num_full_call} queued for the full allele calling."
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -13,12 +13,23 @@ from juno_library import Pipeline
 from version import __version__, __package_name__
 import argparse
 from pathlib import Path
-import subprocess
+import time
+from typing import Any, Optional
 import yaml
 from dataclasses import dataclass
 
-# Own scripts
-from bin import download_cgmlst_scheme
+# Own scripts are imported only when needed (e.g. bin.download_cgmlst_scheme
+# loads dask, bs4 and requests) to keep the start of the pipeline fast.
+
+PIPELINE_DIR = Path(__file__).parent.absolute()
+
+
+def load_pipeline_yaml(relative_path: str) -> Any:
+    """Load a yaml file that is shipped with the pipeline. The path is
+    resolved relative to the pipeline directory so it does not depend on the
+    current working directory."""
+    with open(PIPELINE_DIR.joinpath(relative_path)) as yaml_file:
+        return yaml.safe_load(yaml_file)
 
 
 def main() -> None:
@@ -61,6 +72,41 @@ class JunoCgmlst(Pipeline):
             default="/mnt/db/juno/cgmlst",
             help="Relative or absolute path to the directory that contains the databases for all the tools used in this pipeline or where they should be downloaded. Default is: /mnt/db/juno/cgmlst",
         )
+        self.add_argument(
+            "--scheme_mirror",
+            type=str,
+            required=False,
+            metavar="DIR/URL",
+            default=None,
+            help="Local directory, file:// or http(s):// url of a mirror of the cgMLST scheme sources (made with 'python -m bin.download_cgmlst_scheme --mirror_to DIR'). If given, missing schemes are downloaded from the mirror instead of the original sources.",
+        )
+        self.add_argument(
+            "--scheme_version",
+            type=str,
+            nargs="+",
+            required=False,
+            metavar="VERSION",
+            default=None,
+            help="Version(s) of the cgMLST schemes to use, as saved under <db_dir>/scheme_versions (see 'python -m bin.scheme_versions list'). Give one version name to use it for all schemes or scheme=version (e.g. listeria=20220506-101500) per scheme. If not given, the current scheme is used and saved as a new version if it was not saved yet.",
+        )
+        self.add_argument(
+            "--triage",
+            action="store_true",
+            help="Rapid triage: type the samples first on a panel of highly discriminatory loci of every scheme (made with 'python bin/triage.py build-panel' in <db_dir>/triage_panels/<scheme>) to find their provisional nearest cluster. Only samples that are close to a cluster or whose triage is ambiguous get the full allele calling. Schemes without a panel are always fully typed.",
+        )
+        self.add_argument(
+            "--detect_scheme",
+            action="store_true",
+            help="Detect the cgMLST scheme(s) of every sample from its assembly: the assembly is sketched and compared to a signature of the loci of every candidate scheme (the schemes of its genus or, for genera without a scheme, all the schemes in the database). Samples are only typed against the schemes found in their assembly. The escherichia, stec and shigella schemes are made for the same organism and cannot be told apart. Not done on a dry run. See <output_dir>/cgmlst/scheme_detection.tsv for the result per sample.",
+        )
+        self.add_argument(
+            "--scheme_override",
+            type=Path,
+            required=False,
+            metavar="FILE",
+            default=None,
+            help="Tab separated file (without header) with a sample name and a comma separated list of cgMLST schemes per line. The schemes of these samples are not detected nor taken from their genus. Useful for samples whose scheme detection was unsure.",
+        )
         self.add_argument(
             "-m",
             "--metadata",
@@ -75,7 +121,9 @@ class JunoCgmlst(Pipeline):
             "'genus' and a column called 'species'. The genus and species "
             "provided will be used to choose the serotyper and the MLST schema(s)."
             "If a metadata file is provided, it will overwrite the --species "
-            "argument for the samples present in the metadata file.",
+            "argument for the samples present in the metadata file. An optional "
+            "column called 'priority' sets the priority tier of every sample "
+            "(e.g. high, normal or low, see config/pipeline_parameters.yaml).",
         )
 
     def _parse_args(self) -> argparse.Namespace:
@@ -88,32 +136,136 @@ class JunoCgmlst(Pipeline):
         self.db_dir: Path = args.db_dir
         self.downloaded_schemes_dir = self.db_dir.joinpath("downloaded_schemes")
         self.prepared_schemes_dir = self.db_dir.joinpath("prepared_schemes")
+        self.scheme_mirror: Optional[str] = args.scheme_mirror
+        self.scheme_version_selector: Optional[list[str]] = args.scheme_version
+        self.triage: bool = args.triage
+        self.detect_scheme: bool = args.detect_scheme
+        self.scheme_override_file: Optional[Path] = args.scheme_override
         self.metadata_file: Path = args.metadata
         return args
 
     def set_scheme_in_sample_dict(self) -> None:
-        with open("files/dictionary_correct_cgmlst_scheme.yaml") as translation_yaml:
-            self.cgmlst_scheme_translation_tbl = yaml.safe_load(translation_yaml)
-        for sample in self.sample_dict:
-            genus = self.sample_dict[sample]["genus"]
-            try:
-                self.sample_dict[sample][
-                    "cgmlst_scheme"
-                ] = self.cgmlst_scheme_translation_tbl[genus]
-            except KeyError:
-                self.sample_dict[sample]["cgmlst_scheme"] = ""
+        self.cgmlst_scheme_translation_tbl = load_pipeline_yaml(
+            "files/dictionary_correct_cgmlst_scheme.yaml"
+        )
+        # The scheme(s) are looked up once per genus instead of once per sample
+        samples_per_genus: dict[str, list[str]] = {}
+        for sample, sample_info in self.sample_dict.items():
+            samples_per_genus.setdefault(sample_info["genus"], []).append(sample)
+        for genus, samples in samples_per_genus.items():
+            schemes = self.cgmlst_scheme_translation_tbl.get(genus)
+            for sample in samples:
+                # Every sample gets its own list, which the scheme detection
+                # and overrides may change
+                self.sample_dict[sample]["cgmlst_scheme"] = (
+                    list(schemes) if schemes is not None else ""
+                )
+
+    def detect_schemes(self) -> None:
+        """Restrict the schemes of every sample to the ones found in its
+        assembly (--detect_scheme) and apply the scheme overrides"""
+        if not self.detect_scheme and self.scheme_override_file is None:
+            return
+        from bin import scheme_detection
+
+        overrides = {}
+        if self.scheme_override_file is not None:
+            overrides = {
+                sample: schemes
+                for sample, schemes in scheme_detection.read_overrides(
+                    self.scheme_override_file
+                ).items()
+                if sample in self.sample_dict
+            }
+        if not self.detect_scheme or self.dryrun:
+            if self.detect_scheme:
+                print("Dry run: the schemes of the samples are not detected.")
+            for sample, schemes in overrides.items():
+                self.sample_dict[sample]["cgmlst_scheme"] = schemes
+            return
+        parameters = self.pipeline_parameters["scheme_detection"]
+        signatures = scheme_detection.SchemeSignatures(
+            self.db_dir, parameters["kmer_size"], parameters["scaled"]
+        )
+        # Samples of a genus without scheme are compared to all the schemes
+        # that are available locally
+        known_schemes = sorted(
+            {
+                scheme
+                for schemes in self.cgmlst_scheme_translation_tbl.values()
+                for scheme in schemes
+            }
+        )
+        available_schemes = [
+            scheme for scheme in known_schemes if signatures.get(scheme) is not None
+        ]
+        detection = scheme_detection.SchemeDetection(
+            signatures,
+            min_containment=parameters["min_containment"],
+            unsure_containment=parameters["unsure_containment"],
+            overrides=overrides,
+            threads=self.snakemake_args["cores"],
+        )
+        results = detection.detect(
+            {
+                sample: sample_info["assembly"]
+                for sample, sample_info in self.sample_dict.items()
+            },
+            {
+                sample: list(sample_info["cgmlst_scheme"]) or available_schemes
+                for sample, sample_info in self.sample_dict.items()
+            },
+        )
+        for result in results:
+            self.sample_dict[result["sample"]]["cgmlst_scheme"] = result[
+                "cgmlst_scheme"
+            ]
+        scheme_detection.write_detection_report(
+            results, self.output_dir.joinpath("cgmlst", "scheme_detection.tsv")
+        )
+
+    @property
+    def schemes_in_use(self) -> set[str]:
+        return {
+            scheme
+            for sample in self.sample_dict
+            for scheme in self.sample_dict[sample]["cgmlst_scheme"]
+            if scheme
+        }
+
+    def select_scheme_versions(self) -> None:
+        """Check that the requested versions of the schemes exist and that
+        they contain a prepared scheme"""
+        from bin import scheme_versions
+
+        selected_versions = scheme_versions.parse_version_selector(
+            self.scheme_version_selector
+        )
+        store = scheme_versions.SchemeVersions(self.db_dir)
+        self.selected_scheme_versions: dict[str, str] = {}
+        for scheme in sorted(self.schemes_in_use):
+            version = selected_versions.get(scheme, selected_versions.get("*"))
+            if version is None:
+                continue
+            if not store.read_manifest(scheme, version)["prepared"]:
+                raise ValueError(
+                    f"Version {version} of the {scheme} scheme does not contain "
+                    "a prepared scheme and cannot be used for the allele calling."
+                )
+            self.selected_scheme_versions[scheme] = version
 
     def update_sample_dict_with_metadata(self) -> None:
         self.get_metadata_from_csv_file(
             filepath=self.metadata_file, expected_colnames=["sample", "genus"]
         )
         # Add metadata
-        for sample in self.sample_dict:
-            if self.genus is not None:
-                self.sample_dict[sample]["genus"] = self.genus
-            else:
+        if self.genus is not None:
+            for sample_info in self.sample_dict.values():
+                sample_info["genus"] = self.genus
+        else:
+            for sample, sample_info in self.sample_dict.items():
                 try:
-                    self.sample_dict[sample].update(self.juno_metadata[sample])
+                    sample_info.update(self.juno_metadata[sample])
                 except (KeyError, TypeError):
                     raise ValueError(
                         f"One of your samples is not in the metadata file "
@@ -121,25 +273,57 @@ class JunoCgmlst(Pipeline):
                         "samples are present in the metadata file or provide "
                         "a --genus argument."
                     )
-                self.sample_dict[sample]["genus"] = (
-                    self.sample_dict[sample]["genus"].strip().lower()
-                )
+                sample_info["genus"] = sample_info["genus"].strip().lower()
+        self.set_sample_priorities()
         self.set_scheme_in_sample_dict()
 
+    def set_sample_priorities(self) -> None:
+        """Priority tier of every sample from the optional 'priority' column
+        of the metadata (also when a --genus is given)"""
+        from bin.priority_batches import parse_priority
+
+        parameters = self.pipeline_parameters["priority"]
+        metadata = self.juno_metadata or {}
+        for sample, sample_info in self.sample_dict.items():
+            sample_info["priority"] = parse_priority(
+                metadata.get(sample, {}).get("priority"),
+                parameters["tiers"],
+                parameters["default_tier"],
+            )
+
     def setup(self) -> None:
         super().setup()
+        # Loaded once and used for the priorities, the scheme detection and
+        # the Snakemake config
+        self.pipeline_parameters = load_pipeline_yaml("config/pipeline_parameters.yaml")
         self.update_sample_dict_with_metadata()
+        self.detect_schemes()
+        self.select_scheme_versions()
+        self.write_compact_sample_sheet()
         self.user_parameters = {
             "input_dir": str(self.input_dir),
             "out": str(self.output_dir),
             "cgmlst_db": str(self.db_dir),
+            "scheme_versions": self.selected_scheme_versions,
+            "compact_sample_sheet": str(self.compact_sample_sheet or ""),
+            "triage_mode": self.triage,
         }
+        self.snakemake_config.update(self.pipeline_parameters)
 
-        with open(
-            Path(__file__).parent.joinpath("config/pipeline_parameters.yaml")
-        ) as f:
-            parameters_dict = yaml.safe_load(f)
-        self.snakemake_config.update(parameters_dict)
+    def write_compact_sample_sheet(self) -> None:
+        """Write the samples and their schemes as a compact (json) sample
+        sheet, which loads much faster in the Snakefile than the yaml sample
+        sheet for large numbers of samples. Not written on a dry run, which
+        then uses the yaml sample sheet"""
+        from bin.sample_sheet import SampleSheet
+
+        self.compact_sample_sheet: Optional[Path] = None
+        if self.dryrun:
+            return
+        self.compact_sample_sheet = self.output_dir.joinpath(
+            "cgmlst", "sample_sheet.json"
+        )
+        SampleSheet.from_sample_dict(self.sample_dict).write(self.compact_sample_sheet)
 
     def download_missing_schemes(self) -> None:
         all_needed_schemes: set[str] = set()
@@ -153,6 +337,8 @@ class JunoCgmlst(Pipeline):
                     "metadata to the samples?"
                 )
             for scheme in schemes:
+                if scheme in self.selected_scheme_versions:
+                    continue
                 if scheme is not None:
                     if not self.prepared_schemes_dir.joinpath(scheme).is_dir():
                         end_file_download = self.downloaded_schemes_dir.joinpath(
@@ -161,27 +347,85 @@ class JunoCgmlst(Pipeline):
                         if not end_file_download.is_file():
                             all_needed_schemes.add(scheme)
         if all_needed_schemes:
+            from bin import download_cgmlst_scheme
+
             download_cgmlst_scheme.cgMLSTSchemes(
                 threads=self.snakemake_args["cores"],
                 genus_list=all_needed_schemes,
                 download_loci=True,
                 output_dir=str(self.downloaded_schemes_dir),
+                metrics_stream=self.path_to_audit.joinpath("download_metrics.jsonl"),
+                mirror=self.scheme_mirror,
+                catalog_cache_dir=self.db_dir.joinpath("catalog_cache"),
             )
 
+    def record_scheme_versions(self) -> None:
+        """Write the version of every scheme with results next to them and in
+        the audit trail. Schemes used without --scheme_version are saved as a
+        new version if their current content was not saved yet"""
+        from bin import scheme_versions
+
+        store = scheme_versions.SchemeVersions(self.db_dir)
+        used_versions = {}
+        for scheme in sorted(self.schemes_in_use):
+            results_dir = self.output_dir.joinpath("cgmlst", scheme)
+            if not results_dir.is_dir():
+                continue
+            version = self.selected_scheme_versions.get(
+                scheme
+            ) or store.current_version(scheme)
+            if version is None:
+                version = store.snapshot(scheme)["version"]
+            manifest = store.read_manifest(scheme, version)
+            del manifest["files"]
+            used_versions[scheme] = manifest
+            with open(
+                results_dir.joinpath(scheme_versions.MANIFEST_FILE), "w"
+            ) as file_:
+                yaml.dump(manifest, file_, default_flow_style=False)
+        with open(self.path_to_audit.joinpath("scheme_versions.yaml"), "w") as file_:
+            yaml.dump(used_versions, file_, default_flow_style=False)
+
+    def write_run_report(self, timings: dict[str, float], succeeded: bool) -> None:
+        from bin import run_report
+
+        report_file = self.path_to_audit.joinpath("run_report.yaml")
+        run_report.RunReport(
+            output_dir=self.output_dir, extra_timings=timings, succeeded=succeeded
+        ).write(report_file)
+
+    def finalize_outputs(self) -> None:
+        """Remove the empty outputs and logs declared by the Snakefile
+        instead of walking the whole output directory"""
+        from bin import output_lifecycle
+
+        output_lifecycle.finalize_outputs(
+            self.output_dir,
+            self.path_to_audit.joinpath(output_lifecycle.DECLARED_OUTPUTS_FILE),
+        )
+
     def run_juno_cgmlst_pipeline(self) -> None:
         self.setup()
+        timings: dict[str, float] = {}
         if not self.dryrun or self.unlock:
             self.path_to_audit.mkdir(parents=True, exist_ok=True)
+            start = time.perf_counter()
             self.download_missing_schemes()
-        super().run()
+            timings["download_schemes"] = time.perf_counter() - start
+        start = time.perf_counter()
+        succeeded = False
+        try:
+            super().run()
+            succeeded = True
+        finally:
+            # Also written for failed runs, whose timings matter the most
+            timings["snakemake"] = time.perf_counter() - start
+            if not self.dryrun or self.unlock:
+                self.write_run_report(timings, succeeded)
+                # Failed runs leave empty outputs and logs behind as well
+                self.finalize_outputs()
         if not self.dryrun or self.unlock:
-            subprocess.run(
-                f"find {self.output_dir} -type f -empty -exec rm {{}} \;", shell=True
-            )
-            subprocess.run(
-                f"find {self.output_dir} -type d -empty -exec rm -rf {{}} \;",
-                shell=True,
-            )
+            self.record_scheme_versions()
 
 
 if __name__ == "__main__":
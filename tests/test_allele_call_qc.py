@@ -0,0 +1,82 @@
+import csv
+import os
+from pathlib import Path
+import sys
+import unittest
+
+sys.path.append(str(Path(__file__).parent.parent.absolute()))
+from bin import allele_call_qc
+
+
+def read_tsv(tsv_file: str) -> dict[str, dict[str, str]]:
+    with open(tsv_file) as file_:
+        reader = csv.DictReader(file_, delimiter="\t")
+        return {row[reader.fieldnames[0]]: row for row in reader}  # type: ignore
+
+
+class TestAlleleCallQC(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        os.system("mkdir -p test_allele_call_qc")
+        with open("test_allele_call_qc/results_alleles.tsv", "w") as file_:
+            file_.write(
+                "FILE\tlocus1.fasta\tlocus2.fasta\tlocus3.fasta\tlocus4.fasta\n"
+            )
+            file_.write("sample1\t1\t2\tINF-5\t3\n")
+            file_.write("sample2\t1\tLNF\tPLOT3\t3\n")
+            file_.write("sample3\t2\tASM\tNIPHEM\t4\n")
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        os.system("rm -rf test_allele_call_qc")
+
+    def run_qc(self, chunk_size: int) -> None:
+        allele_call_qc.AlleleCallQC(
+            results_table=Path("test_allele_call_qc/results_alleles.tsv"),
+            output_dir=Path(f"test_allele_call_qc/chunk{chunk_size}"),
+            max_missing_fraction_sample=0.25,
+            min_called_fraction_locus=0.6,
+            chunk_size=chunk_size,
+        ).run()
+
+    def test_counts_and_flags_per_sample(self) -> None:
+        """Exact and inferred alleles are called loci. The other classes
+        should be counted separately and samples with too many missing loci
+        should fail the QC
+        """
+        self.run_qc(chunk_size=2)
+        qc_per_sample = read_tsv("test_allele_call_qc/chunk2/qc_per_sample.tsv")
+        self.assertEqual(list(qc_per_sample), ["sample1", "sample2", "sample3"])
+        self.assertEqual(qc_per_sample["sample1"]["called"], "4")
+        self.assertEqual(qc_per_sample["sample1"]["qc"], "PASS")
+        self.assertEqual(qc_per_sample["sample2"]["LNF"], "1")
+        self.assertEqual(qc_per_sample["sample2"]["PLOT3"], "1")
+        self.assertEqual(qc_per_sample["sample2"]["called_fraction"], "0.5000")
+        self.assertEqual(qc_per_sample["sample2"]["qc"], "FAIL")
+        self.assertEqual(qc_per_sample["sample3"]["ASM"], "1")
+        self.assertEqual(qc_per_sample["sample3"]["NIPHEM"], "1")
+        self.assertEqual(qc_per_sample["sample3"]["NIPH"], "0")
+
+    def test_counts_and_flags_per_locus(self) -> None:
+        """Loci that are not called in enough samples should fail the QC"""
+        self.run_qc(chunk_size=2)
+        qc_per_locus = read_tsv("test_allele_call_qc/chunk2/qc_per_locus.tsv")
+        self.assertEqual(qc_per_locus["locus1.fasta"]["called"], "3")
+        self.assertEqual(qc_per_locus["locus1.fasta"]["qc"], "PASS")
+        self.assertEqual(qc_per_locus["locus2.fasta"]["LNF"], "1")
+        self.assertEqual(qc_per_locus["locus2.fasta"]["ASM"], "1")
+        self.assertEqual(qc_per_locus["locus2.fasta"]["qc"], "FAIL")
+        self.assertEqual(qc_per_locus["locus3.fasta"]["called_fraction"], "0.3333")
+
+    def test_result_does_not_depend_on_chunk_size(self) -> None:
+        self.run_qc(chunk_size=1)
+        self.run_qc(chunk_size=100)
+        for output_file in ["qc_per_sample.tsv", "qc_per_locus.tsv"]:
+            self.assertEqual(
+                Path(f"test_allele_call_qc/chunk1/{output_file}").read_text(),
+                Path(f"test_allele_call_qc/chunk100/{output_file}").read_text(),
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
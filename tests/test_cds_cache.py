@@ -0,0 +1,155 @@
+import os
+from pathlib import Path
+import sys
+import unittest
+
+sys.path.append(str(Path(__file__).parent.parent.absolute()))
+from bin import cds_cache
+
+
+class CountingCDSCache(cds_cache.CDSCache):
+    """CDSCache that writes the assembly as 'prediction' and counts how many
+    times a prediction was actually run"""
+
+    predictions = 0
+
+    def _predict(self, assembly: Path, output_file: Path) -> None:
+        CountingCDSCache.predictions += 1
+        output_file.write_text(assembly.read_text())
+
+
+class TestCDSCache(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        os.system("mkdir -p test_cds_cache")
+        with open("test_cds_cache/sample1.fasta", "w") as file_:
+            file_.write(">contig1\nATGAAACCCGGGTTTTAA\n")
+        with open("test_cds_cache/sample2.fasta", "w") as file_:
+            file_.write(">contig1\nATGCCCAAAGGGTTTTGA\n")
+        with open("test_cds_cache/escherichia.trn", "w") as file_:
+            file_.write("training_file_1")
+        with open("test_cds_cache/shigella.trn", "w") as file_:
+            file_.write("training_file_1")
+        with open("test_cds_cache/salmonella.trn", "w") as file_:
+            file_.write("training_file_2")
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        os.system("rm -rf test_cds_cache")
+
+    def setUp(self) -> None:
+        os.system("rm -rf test_cds_cache/cache test_cds_cache/links")
+        CountingCDSCache.predictions = 0
+
+    def test_cds_are_predicted_once_for_schemes_with_same_training_file(
+        self,
+    ) -> None:
+        """Two schemes whose training files have the same content should
+        share the cached CDSs so every assembly is predicted only once
+        """
+        assemblies = [
+            Path("test_cds_cache/sample1.fasta"),
+            Path("test_cds_cache/sample2.fasta"),
+        ]
+        for scheme in ["escherichia", "shigella"]:
+            cache = CountingCDSCache(
+                cache_dir=Path("test_cds_cache/cache"),
+                training_file=Path(f"test_cds_cache/{scheme}.trn"),
+            )
+            cache.link_cds_files(
+                assemblies, link_dir=Path(f"test_cds_cache/links/{scheme}")
+            )
+        self.assertEqual(CountingCDSCache.predictions, 2)
+
+    def test_cds_are_predicted_again_for_different_training_file(self) -> None:
+        """A different training file should result in a new prediction"""
+        assemblies = [Path("test_cds_cache/sample1.fasta")]
+        for scheme in ["escherichia", "salmonella"]:
+            cache = CountingCDSCache(
+                cache_dir=Path("test_cds_cache/cache"),
+                training_file=Path(f"test_cds_cache/{scheme}.trn"),
+            )
+            cache.link_cds_files(
+                assemblies, link_dir=Path(f"test_cds_cache/links/{scheme}")
+            )
+        self.assertEqual(CountingCDSCache.predictions, 2)
+
+    def test_links_keep_the_assembly_names(self) -> None:
+        """chewBBACA uses the file names as sample names so the links to the
+        cached files should have the same name than the assemblies
+        """
+        cache = CountingCDSCache(
+            cache_dir=Path("test_cds_cache/cache"),
+            training_file=Path("test_cds_cache/escherichia.trn"),
+        )
+        links = cache.link_cds_files(
+            [Path("test_cds_cache/sample1.fasta")],
+            link_dir=Path("test_cds_cache/links/escherichia"),
+        )
+        self.assertEqual([link.name for link in links], ["sample1.fasta"])
+        self.assertEqual(
+            links[0].read_text(), Path("test_cds_cache/sample1.fasta").read_text()
+        )
+
+    def test_links_are_named_after_the_samples(self) -> None:
+        """Assemblies with the same file name in different directories should
+        not overwrite each other's link"""
+        os.system("mkdir -p test_cds_cache/run1 test_cds_cache/run2")
+        Path("test_cds_cache/run1/contigs.fasta").write_text(">c1\nATGAAATAA\n")
+        Path("test_cds_cache/run2/contigs.fasta").write_text(">c1\nATGCCCTAA\n")
+        Path("test_cds_cache/input_files.txt").write_text(
+            "test_cds_cache/run1/contigs.fasta\tsample_a\n"
+            "test_cds_cache/run2/contigs.fasta\tsample_b\n"
+        )
+        assemblies, samples = cds_cache.read_input_files(
+            Path("test_cds_cache/input_files.txt")
+        )
+        self.assertEqual(samples, ["sample_a", "sample_b"])
+        cache = CountingCDSCache(
+            cache_dir=Path("test_cds_cache/cache"),
+            training_file=Path("test_cds_cache/escherichia.trn"),
+        )
+        links = cache.link_cds_files(
+            assemblies, link_dir=Path("test_cds_cache/links/run"), samples=samples
+        )
+        self.assertEqual(
+            [link.name for link in links], ["sample_a.fasta", "sample_b.fasta"]
+        )
+        self.assertEqual(
+            [link.read_text() for link in links],
+            [">c1\nATGAAATAA\n", ">c1\nATGCCCTAA\n"],
+        )
+
+    def test_missing_training_file(self) -> None:
+        """Schemes without a training file in the pipeline (e.g.
+        clostridioides) use the one of the prepared scheme or, if there is
+        none, the metagenomic mode"""
+        with self.assertRaises(FileNotFoundError):
+            CountingCDSCache(
+                cache_dir=Path("test_cds_cache/cache"),
+                training_file=Path("test_cds_cache/clostridioides.trn"),
+            )
+        os.system("mkdir -p test_cds_cache/prepared_scheme")
+        prepared_training_file = Path(
+            "test_cds_cache/prepared_scheme/clostridioides.trn"
+        )
+        prepared_training_file.write_text("training_file_3")
+        candidates = [
+            Path("test_cds_cache/clostridioides.trn"),
+            prepared_training_file,
+        ]
+        self.assertEqual(
+            cds_cache.find_training_file(candidates), prepared_training_file
+        )
+        self.assertIsNone(cds_cache.find_training_file(candidates[:1]))
+        cache = CountingCDSCache(cache_dir=Path("test_cds_cache/cache"))
+        links = cache.link_cds_files(
+            [Path("test_cds_cache/sample1.fasta")],
+            link_dir=Path("test_cds_cache/links/clostridioides"),
+        )
+        self.assertEqual(links[0].resolve().parent.name, "meta")
+        self.assertEqual(CountingCDSCache.predictions, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
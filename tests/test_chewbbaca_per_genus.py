@@ -7,7 +7,7 @@ main_script_path = str(
     pathlib.Path(pathlib.Path(__file__).parent.absolute()).parent.absolute()
 )
 path.insert(0, main_script_path)
-from bin import chewbbaca_input_files
+from bin import chewbbaca_input_files, novel_allele_registry
 
 
 class TestChewbbacaPerGenus(unittest.TestCase):
@@ -158,6 +158,29 @@ class TestChewbbacaPerGenus(unittest.TestCase):
         print(actual_output)
         self.assertDictEqual(expected_output, actual_output, actual_output)
 
+    def test_batch_without_samples(self) -> None:
+        """A batch in which no sample needs the allele calling (e.g. after
+        the triage) should still write all the outputs of the job"""
+        os.system("mkdir -p test_chewbbaca_per_genus/db")
+        open("test_chewbbaca_per_genus/empty_input.txt", "w").close()
+        output_dir = pathlib.Path("test_chewbbaca_per_genus/empty_batch")
+        exit_code = os.system(
+            "bash bin/chewbbaca_per_genus.sh test_chewbbaca_per_genus/empty_input.txt "
+            f"1 {output_dir} test_chewbbaca_per_genus/db salmonella "
+            "> /dev/null 2>&1"
+        )
+        self.assertEqual(exit_code, 0)
+        self.assertEqual(
+            output_dir.joinpath("results_alleles.tsv").read_text(), "FILE\n"
+        )
+        self.assertEqual(
+            output_dir.joinpath("results_alleles_hashed.tsv").read_text(), "FILE\n"
+        )
+        self.assertEqual(
+            output_dir.joinpath("novel_alleles.tsv").read_text(),
+            "\t".join(novel_allele_registry.RECORD_COLUMNS) + "\n",
+        )
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -1,6 +1,11 @@
+from functools import partial
+import gzip
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+import json
 import os
 from pathlib import Path
 import sys
+import threading
 import unittest
 
 # main_script_path = str(Path(Path(__file__).parent.absolute()).parent.absolute())
@@ -221,5 +226,117 @@ class TestDownloadcgMLSTSchemes(unittest.TestCase):
         self.assertEqual(len(fasta_files_in_downloaded_scheme), 7)
 
 
+class TestDownloadcgMLSTSchemesFromMirror(unittest.TestCase):
+    """Download schemes from a local stand-in of the sources (no internet)"""
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        os.system("mkdir -p test_mirror")
+        mirror_dir = Path("test_mirror/mirror")
+        # Enterobase-like directory listing with gzipped loci
+        enterobase_dir = mirror_dir.joinpath(
+            "enterobase.warwick.ac.uk", "schemes", "Yersinia.Achtman7GeneMLST"
+        )
+        enterobase_dir.mkdir(parents=True)
+        enterobase_dir.joinpath("index.html").write_text(
+            '<a href="../">../</a>\n'
+            '<a href="adk.fasta.gz">adk.fasta.gz</a>\n'
+            '<a href="gyrB.fasta.gz">gyrB.fasta.gz</a>\n'
+        )
+        for locus in ["adk", "gyrB"]:
+            with gzip.open(enterobase_dir.joinpath(locus + ".fasta.gz"), "wt") as file_:
+                file_.write(f">{locus}_1\nATGAAATAA\n")
+        # PubMLST-like scheme description and loci
+        pubmlst_db = mirror_dir.joinpath(
+            "rest.pubmlst.org", "db", "pubmlst_salmonella_seqdef"
+        )
+        pubmlst_db.joinpath("schemes").mkdir(parents=True)
+        loci_url = "https://rest.pubmlst.org/db/pubmlst_salmonella_seqdef/loci/"
+        pubmlst_db.joinpath("schemes", "2").write_text(
+            json.dumps(
+                {
+                    "description": "MLST",
+                    "locus_count": 2,
+                    "loci": [loci_url + "aroC", loci_url + "dnaN"],
+                }
+            )
+        )
+        for locus in ["aroC", "dnaN"]:
+            pubmlst_db.joinpath("loci", locus).mkdir(parents=True)
+            pubmlst_db.joinpath("loci", locus, "alleles_fasta").write_text(
+                f">{locus}_1\nATGAAATAA\n"
+            )
+        cls.server = ThreadingHTTPServer(
+            ("127.0.0.1", 0),
+            partial(SimpleHTTPRequestHandler, directory=str(mirror_dir.absolute())),
+        )
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        cls.server.shutdown()
+        os.system("rm -rf test_mirror")
+
+    def assert_loci_downloaded(
+        self, output_dir: str, genus: str, loci: list[str]
+    ) -> None:
+        files_in_downloaded_scheme = os.listdir(Path(output_dir, genus))
+        for locus in loci:
+            self.assertIn(locus + ".fasta", files_in_downloaded_scheme)
+        self.assertIn("downloaded_scheme.yaml", files_in_downloaded_scheme)
+        self.assertIn("download_metrics.yaml", files_in_downloaded_scheme)
+
+    def test_download_from_local_directory_mirror(self) -> None:
+        """The same schemes should be found when the mirror is a directory"""
+        result = download_cgmlst_scheme.cgMLSTSchemes(
+            ["test_enterobase", "test_pubmlst"],
+            output_dir="test_mirror/from_directory",
+            threads=1,
+            download_loci=True,
+            mirror="test_mirror/mirror",
+        )
+        self.assertEqual(result.schemes["test_enterobase"]["locus_count"], 2)
+        self.assertEqual(result.schemes["test_pubmlst"]["locus_count"], 2)
+        self.assert_loci_downloaded(
+            "test_mirror/from_directory", "test_enterobase", ["adk", "gyrB"]
+        )
+        self.assert_loci_downloaded(
+            "test_mirror/from_directory", "test_pubmlst", ["aroC", "dnaN"]
+        )
+
+    def test_download_from_http_mirror_with_catalog_cache(self) -> None:
+        """The mirror can be served over http and the catalog should be
+        reused from the cache the second time"""
+        mirror = f"http://127.0.0.1:{self.server.server_address[1]}"
+        for output_dir in ["test_mirror/from_http", "test_mirror/from_http_cached"]:
+            result = download_cgmlst_scheme.cgMLSTSchemes(
+                ["test_enterobase"],
+                output_dir=output_dir,
+                threads=1,
+                download_loci=True,
+                mirror=mirror,
+                catalog_cache_dir=Path("test_mirror/catalog_cache"),
+            )
+            self.assertEqual(result.schemes["test_enterobase"]["locus_count"], 2)
+            self.assert_loci_downloaded(output_dir, "test_enterobase", ["adk", "gyrB"])
+        self.assertEqual(len(os.listdir("test_mirror/catalog_cache")), 1)
+
+    def test_mirror_a_mirror(self) -> None:
+        """Mirroring keeps the layout of the source urls"""
+        download_cgmlst_scheme.cgMLSTSchemes(
+            ["test_pubmlst"],
+            output_dir="test_mirror/unused",
+            threads=1,
+            mirror="test_mirror/mirror",
+            mirror_to=Path("test_mirror/second_mirror"),
+        )
+        self.assertTrue(
+            Path(
+                "test_mirror/second_mirror/rest.pubmlst.org/db/"
+                "pubmlst_salmonella_seqdef/loci/aroC/alleles_fasta"
+            ).is_file()
+        )
+
+
 if __name__ == "__main__":
     unittest.main()
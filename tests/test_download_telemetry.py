@@ -0,0 +1,102 @@
+import json
+import os
+from pathlib import Path
+import sys
+import unittest
+
+sys.path.append(str(Path(__file__).parent.parent.absolute()))
+from bin import download_telemetry
+from bin.download_telemetry import RequestMetrics
+
+
+class TestDownloadTelemetry(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        os.system("mkdir -p test_download_telemetry")
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        os.system("rm -rf test_download_telemetry")
+
+    def setUp(self) -> None:
+        self.metrics = [
+            RequestMetrics(
+                url="https://rest.pubmlst.org/db/loci/A",
+                status=200,
+                bytes=2_000_000,
+                latency_s=1.0,
+                ok=True,
+            ),
+            RequestMetrics(
+                url="https://rest.pubmlst.org/db/loci/B",
+                status=200,
+                bytes=2_000_000,
+                latency_s=3.0,
+                retries=2,
+                backoff_s=3.0,
+                ok=True,
+            ),
+            RequestMetrics(
+                url="https://www.cgmlst.org/ncs/schema/1/locus/C.fasta",
+                status=404,
+                latency_s=0.05,
+                ok=False,
+                error="Not found",
+            ),
+        ]
+
+    def test_summary_per_host(self) -> None:
+        """The requests should be summarized per host with the bytes,
+        throughput, retries, failures and http status
+        """
+        summary = download_telemetry.summarize_metrics(self.metrics)
+        self.assertEqual(summary["requests"], 3)
+        self.assertEqual(summary["bytes"], 4_000_000)
+        pubmlst = summary["hosts"]["rest.pubmlst.org"]
+        self.assertEqual(pubmlst["requests"], 2)
+        self.assertEqual(pubmlst["retries"], 2)
+        # The backoff between retries is not part of the latency
+        self.assertEqual(pubmlst["backoff_s"], 3.0)
+        self.assertEqual(pubmlst["failed"], 0)
+        self.assertEqual(pubmlst["throughput_mb_per_s"], 1.0)
+        self.assertEqual(pubmlst["http_status"], {"200": 2})
+        cgmlst = summary["hosts"]["www.cgmlst.org"]
+        self.assertEqual(cgmlst["failed"], 1)
+        self.assertEqual(cgmlst["http_status"], {"404": 1})
+
+    def test_failed_requests(self) -> None:
+        self.assertEqual(
+            download_telemetry.failed_requests(self.metrics + [None]),
+            self.metrics[2:],
+        )
+
+    def test_latency_histogram_and_slowest_requests(self) -> None:
+        """Every request should fall in one bin of the latency histogram and
+        the slowest requests should be listed first
+        """
+        summary = download_telemetry.summarize_metrics(self.metrics, num_slowest=2)
+        histogram = summary["hosts"]["rest.pubmlst.org"]["latency_histogram"]
+        self.assertEqual(sum(histogram.values()), 2)
+        self.assertEqual(histogram["<=1.0s"], 1)
+        self.assertEqual(histogram["<=5.0s"], 1)
+        self.assertEqual(
+            [request["url"] for request in summary["slowest_requests"]],
+            [
+                "https://rest.pubmlst.org/db/loci/B",
+                "https://rest.pubmlst.org/db/loci/A",
+            ],
+        )
+
+    def test_metrics_stream_has_one_json_line_per_request(self) -> None:
+        stream_file = Path("test_download_telemetry/stream.jsonl")
+        for request in self.metrics:
+            download_telemetry.append_to_stream(stream_file, request)
+        with open(stream_file) as file_:
+            records = [json.loads(line) for line in file_]
+        self.assertEqual(len(records), 3)
+        self.assertEqual(records[2]["host"], "www.cgmlst.org")
+        self.assertEqual(records[2]["status"], 404)
+
+
+if __name__ == "__main__":
+    unittest.main()
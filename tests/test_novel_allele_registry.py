@@ -0,0 +1,134 @@
+from multiprocessing import Pool
+import os
+from pathlib import Path
+import sys
+import unittest
+
+sys.path.append(str(Path(__file__).parent.parent.absolute()))
+from bin import novel_allele_registry
+
+SCHEME_DIR = Path("test_novel_allele_registry/prepared_schemes/test_scheme")
+
+
+def register_job(job_number: int) -> dict[tuple[str, str], str]:
+    """Register 20 novel alleles of which 10 are shared by all jobs"""
+    novel_alleles = [
+        ("locus1", str(number), f"ATG{'C' * number}TAA") for number in range(1, 11)
+    ] + [
+        ("locus1", str(number), f"ATG{'G' * (job_number * 100 + number)}TAA")
+        for number in range(11, 21)
+    ]
+    registry = novel_allele_registry.NovelAlleleRegistry(SCHEME_DIR)
+    registry.register(novel_alleles)
+    return registry.registered
+
+
+class TestNovelAlleleRegistry(unittest.TestCase):
+    def setUp(self) -> None:
+        SCHEME_DIR.mkdir(parents=True, exist_ok=True)
+        SCHEME_DIR.joinpath("locus1.fasta").write_text(
+            ">locus1_1\nATGAAATAA\n>locus1_2\nATGAACTAA\n"
+        )
+        SCHEME_DIR.joinpath("locus2.fasta").write_text(">locus2_*5\nATGTTTTAA\n")
+        with open(SCHEME_DIR.joinpath("novel_alleles.fasta"), "w") as file_:
+            file_.write(">locus1_3\nATGCCCTAA\n>locus2_6\nATGGGGTAA\n")
+        with open(SCHEME_DIR.joinpath("results_alleles.tsv"), "w") as file_:
+            file_.write("FILE\tlocus1.fasta\tlocus2.fasta\n")
+            file_.write("sample1.fasta\tINF-3\t5\n")
+            file_.write("sample2.fasta\t1\tINF-*6\n")
+
+    def tearDown(self) -> None:
+        os.system("rm -rf test_novel_allele_registry")
+
+    def test_novel_alleles_get_next_free_id(self) -> None:
+        novel_alleles = list(
+            novel_allele_registry.read_novel_alleles(
+                SCHEME_DIR.joinpath("novel_alleles.fasta")
+            )
+        )
+        self.assertEqual(
+            novel_alleles,
+            [("locus1", "3", "ATGCCCTAA"), ("locus2", "6", "ATGGGGTAA")],
+        )
+        registry = novel_allele_registry.NovelAlleleRegistry(SCHEME_DIR)
+        self.assertEqual(registry.register(novel_alleles), {"known": 0, "added": 2})
+        self.assertEqual(
+            registry.registered,
+            {
+                ("locus1", novel_allele_registry.sequence_sha1("ATGCCCTAA")): "3",
+                ("locus2", novel_allele_registry.sequence_sha1("ATGGGGTAA")): "6",
+            },
+        )
+        # The registry is kept next to the scheme and the scheme is unchanged
+        self.assertTrue(
+            SCHEME_DIR.with_name(
+                f"test_scheme.{novel_allele_registry.REGISTRY_FILE}"
+            ).is_file()
+        )
+        self.assertEqual(SCHEME_DIR.joinpath("locus1.fasta").read_text().count(">"), 2)
+        self.assertEqual(SCHEME_DIR.joinpath("locus2.fasta").read_text().count(">"), 1)
+        registry.translate_results(
+            SCHEME_DIR.joinpath("results_alleles.tsv"), novel_alleles
+        )
+        self.assertEqual(
+            SCHEME_DIR.joinpath("results_alleles.tsv").read_text(),
+            "FILE\tlocus1.fasta\tlocus2.fasta\nsample1.fasta\t3\t5\nsample2.fasta\t1\t6\n",
+        )
+        records = SCHEME_DIR.joinpath("novel_alleles.tsv")
+        novel_allele_registry.write_records(novel_alleles, records, registry.registered)
+        self.assertEqual(
+            [line.split("\t")[:3] for line in records.read_text().splitlines()],
+            [
+                ["locus", "allele_id", "provisional_id"],
+                ["locus1", "3", "3"],
+                ["locus2", "6", "6"],
+            ],
+        )
+
+    def test_same_sequence_keeps_its_id(self) -> None:
+        """A novel allele found again by another job (with another
+        provisional id) gets the id it was registered with"""
+        registry = novel_allele_registry.NovelAlleleRegistry(SCHEME_DIR)
+        registry.register([("locus1", "3", "ATGCCCTAA")])
+        registry = novel_allele_registry.NovelAlleleRegistry(SCHEME_DIR)
+        counts = registry.register(
+            [("locus1", "7", "atgccctaa"), ("locus1", "8", "ATGCCGTAA")]
+        )
+        self.assertEqual(counts, {"known": 1, "added": 1})
+        self.assertEqual(
+            sorted(registry.registered.values()),
+            ["3", "4"],
+        )
+        self.assertEqual(SCHEME_DIR.joinpath("locus1.fasta").read_text().count(">"), 2)
+
+    def test_read_only_registry_does_not_change_the_scheme(self) -> None:
+        registry = novel_allele_registry.NovelAlleleRegistry(SCHEME_DIR, read_only=True)
+        self.assertEqual(
+            registry.register([("locus1", "3", "ATGCCCTAA")]), {"known": 0, "added": 0}
+        )
+        self.assertEqual(SCHEME_DIR.joinpath("locus1.fasta").read_text().count(">"), 2)
+        self.assertFalse(registry.registry_file.exists())
+        # Alleles that could not be registered keep their provisional id
+        records = SCHEME_DIR.joinpath("novel_alleles.tsv")
+        novel_allele_registry.write_records(
+            [("locus1", "3", "ATGCCCTAA")], records, registry.registered
+        )
+        self.assertEqual(records.read_text().splitlines()[1].split("\t")[1], "INF-3")
+
+    def test_parallel_jobs_do_not_conflict(self) -> None:
+        """Jobs registering at the same time should give the shared alleles
+        the same id and never give the same id to different alleles"""
+        with Pool(4) as pool:
+            registered_per_job = pool.map(register_job, range(8))
+        all_registered: dict[tuple[str, str], str] = {}
+        for registered in registered_per_job:
+            for key, allele_id in registered.items():
+                self.assertEqual(all_registered.setdefault(key, allele_id), allele_id)
+        allele_ids = list(all_registered.values())
+        self.assertEqual(len(allele_ids), 10 + 8 * 10)
+        self.assertEqual(len(set(allele_ids)), len(allele_ids))
+        self.assertEqual(sorted(map(int, allele_ids)), list(range(3, 3 + 90)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,108 @@
+import os
+from pathlib import Path
+import sys
+import tarfile
+import unittest
+
+sys.path.append(str(Path(__file__).parent.parent.absolute()))
+from bin import output_lifecycle
+
+
+class TestOutputLifecycle(unittest.TestCase):
+    def setUp(self) -> None:
+        os.system("mkdir -p test_output_lifecycle")
+        self.output_dir = Path("test_output_lifecycle/output").absolute()
+        self.job_dir = self.output_dir.joinpath("cgmlst", "salmonella")
+        self.work_dir = self.job_dir.joinpath(output_lifecycle.WORK_DIR)
+        results_dir = self.work_dir.joinpath("results_20220506T101500")
+        results_dir.mkdir(parents=True)
+        for file_name in ["results_alleles.tsv", "results_statistics.tsv"]:
+            results_dir.joinpath(file_name).write_text("FILE\tlocus1\n")
+        results_dir.joinpath("logging_info.txt").write_text("")
+        self.job_dir.joinpath("results_alleles.tsv").write_text("FILE\tlocus1\n")
+
+    def tearDown(self) -> None:
+        os.system("rm -rf test_output_lifecycle")
+
+    def test_archive_intermediates(self) -> None:
+        removed = output_lifecycle.retain_intermediates(self.work_dir, "archive")
+        self.assertEqual(removed, 3)
+        self.assertFalse(self.work_dir.exists())
+        archive_file = self.job_dir.joinpath(output_lifecycle.ARCHIVE_FILE)
+        with tarfile.open(archive_file) as archive:
+            self.assertIn(
+                "allele_call_work/results_20220506T101500/results_statistics.tsv",
+                archive.getnames(),
+            )
+        self.assertEqual(
+            sorted(path.name for path in self.job_dir.iterdir()),
+            [output_lifecycle.ARCHIVE_FILE, "results_alleles.tsv"],
+        )
+
+    def test_delete_and_keep_intermediates(self) -> None:
+        self.assertEqual(
+            output_lifecycle.retain_intermediates(self.work_dir, "keep"), 0
+        )
+        self.assertTrue(self.work_dir.is_dir())
+        self.assertEqual(
+            output_lifecycle.retain_intermediates(self.work_dir, "delete"), 3
+        )
+        self.assertEqual(
+            [path.name for path in self.job_dir.iterdir()], ["results_alleles.tsv"]
+        )
+        # Nothing left to do if the job is run again
+        self.assertEqual(
+            output_lifecycle.retain_intermediates(self.work_dir, "delete"), 0
+        )
+        with self.assertRaises(ValueError):
+            output_lifecycle.retain_intermediates(self.work_dir, "compress")
+
+    def test_remove_scratch(self) -> None:
+        link_dir = self.output_dir.joinpath("cgmlst", "cds_input", "salmonella")
+        link_dir.mkdir(parents=True)
+        link_dir.joinpath("sample1.fasta").symlink_to(
+            self.job_dir.joinpath("results_alleles.tsv")
+        )
+        output_lifecycle.remove_scratch([link_dir, self.output_dir.joinpath("none")])
+        self.assertFalse(link_dir.exists())
+        self.assertTrue(self.job_dir.joinpath("results_alleles.tsv").is_file())
+
+    def test_only_declared_empty_files_are_removed(self) -> None:
+        log_dir = self.output_dir.joinpath("log", "cgmlst")
+        log_dir.mkdir(parents=True)
+        empty_log = log_dir.joinpath("qc_salmonella.log")
+        empty_log.write_text("")
+        benchmark_dir = self.output_dir.joinpath("log", "benchmark", "qc_per_scheme")
+        benchmark_dir.mkdir(parents=True)
+        empty_benchmark = benchmark_dir.joinpath("salmonella.tsv")
+        empty_benchmark.write_text("")
+        undeclared = self.output_dir.joinpath("log", "undeclared.log")
+        undeclared.write_text("")
+        manifest_file = self.output_dir.joinpath(
+            "audit_trail", output_lifecycle.DECLARED_OUTPUTS_FILE
+        )
+        output_lifecycle.write_declared_outputs(
+            manifest_file,
+            [
+                str(empty_log),
+                str(empty_benchmark),
+                str(self.job_dir.joinpath("results_alleles.tsv")),
+                str(self.output_dir.joinpath("triage", "salmonella", "missing.tsv")),
+            ],
+        )
+        removed = output_lifecycle.finalize_outputs(self.output_dir, manifest_file)
+        self.assertEqual(sorted(removed), sorted([empty_log, empty_benchmark]))
+        self.assertFalse(log_dir.exists())
+        self.assertFalse(self.output_dir.joinpath("log", "benchmark").exists())
+        self.assertTrue(undeclared.is_file())
+        self.assertTrue(self.job_dir.joinpath("results_alleles.tsv").is_file())
+        # Empty intermediates that are not declared are left alone
+        self.assertTrue(
+            self.work_dir.joinpath(
+                "results_20220506T101500", "logging_info.txt"
+            ).is_file()
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
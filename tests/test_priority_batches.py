@@ -0,0 +1,144 @@
+import os
+from pathlib import Path
+import sys
+import unittest
+
+sys.path.append(str(Path(__file__).parent.parent.absolute()))
+from bin import priority_batches
+from bin.sample_sheet import SampleSheet
+
+BATCH_SIZES = {"high": 2, "normal": 0, "low": 0}
+
+
+def make_sample_sheet() -> SampleSheet:
+    priorities = ["low", None, "high", "HIGH", "normal", "high", "low"]
+    sample_dict = {
+        f"sample{i}": {
+            "assembly": f"sample{i}.fasta",
+            "genus": "salmonella",
+            "priority": priority,
+            "cgmlst_scheme": ["salmonella"] if i % 2 == 0 else ["salmonella", "other"],
+        }
+        for i, priority in enumerate(priorities)
+    }
+    return SampleSheet.from_sample_dict(sample_dict)
+
+
+class TestPriorityBatches(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        os.system("mkdir -p test_priority_batches")
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        os.system("rm -rf test_priority_batches")
+
+    def test_parse_priority(self) -> None:
+        tiers = list(BATCH_SIZES)
+        self.assertEqual(
+            priority_batches.parse_priority(" High ", tiers, "normal"), "high"
+        )
+        for empty in [None, "", "nan"]:
+            self.assertEqual(
+                priority_batches.parse_priority(empty, tiers, "normal"), "normal"
+            )
+        with self.assertRaisesRegex(ValueError, "Unknown priority urgent"):
+            priority_batches.parse_priority("urgent", tiers, "normal")
+
+    def test_batches_per_scheme(self) -> None:
+        batches = priority_batches.batches_per_scheme(
+            make_sample_sheet(), BATCH_SIZES, "normal"
+        )
+        # Most urgent tier first and split in batches of (at most) 2 samples
+        self.assertEqual(
+            batches["salmonella"],
+            {
+                "high_1": [2, 3],
+                "high_2": [5],
+                "normal_1": [1, 4],
+                "low_1": [0, 6],
+            },
+        )
+        self.assertEqual(batches["other"], {"high_1": [3, 5], "normal_1": [1]})
+
+    def test_write_batch_lists(self) -> None:
+        sample_sheet = make_sample_sheet()
+        batches = priority_batches.batches_per_scheme(
+            sample_sheet, BATCH_SIZES, "normal"
+        )
+        output_dir = Path("test_priority_batches/batches")
+        priority_batches.write_batch_lists(sample_sheet, batches, output_dir)
+        self.assertEqual(
+            output_dir.joinpath("salmonella", "high_1_samples.txt").read_text(),
+            "sample2.fasta\tsample2\nsample3.fasta\tsample3\n",
+        )
+        self.assertEqual(
+            sorted(path.name for path in output_dir.joinpath("other").iterdir()),
+            ["high_1_samples.txt", "normal_1_samples.txt"],
+        )
+
+    def test_merge_tables(self) -> None:
+        tables = []
+        for batch, rows in [
+            ("high_1", ["s1\t1", "s2\t2"]),
+            ("high_2", []),
+            ("low_1", ["s3\t3"]),
+        ]:
+            table = Path(f"test_priority_batches/{batch}.tsv")
+            table.write_text("\n".join(["FILE\tlocus1"] + rows) + "\n")
+            tables.append(table)
+        tables.append(Path("test_priority_batches/missing.tsv"))
+        output_table = Path("test_priority_batches/merged.tsv")
+        self.assertEqual(priority_batches.merge_tables(tables, output_table), 3)
+        self.assertEqual(
+            output_table.read_text(), "FILE\tlocus1\ns1\t1\ns2\t2\ns3\t3\n"
+        )
+
+        self.assertEqual(priority_batches.merge_tables(tables[1:2], output_table), 0)
+        self.assertEqual(output_table.read_text(), "FILE\n")
+
+        # In sample sheet order instead of batch order, unknown samples last
+        priority_batches.merge_tables(tables, output_table, sample_order=["s3", "s1"])
+        self.assertEqual(
+            output_table.read_text(), "FILE\tlocus1\ns3\t3\ns1\t1\ns2\t2\n"
+        )
+
+        # Batches are merged row by row, also when one is not in order
+        tables[1].write_text("FILE\tlocus1\ns5\t5\ns4\t4\n")
+        priority_batches.merge_tables(
+            tables, output_table, sample_order=["s4", "s1", "s5", "s2", "s3"]
+        )
+        self.assertEqual(
+            output_table.read_text(),
+            "FILE\tlocus1\ns4\t4\ns1\t1\ns5\t5\ns2\t2\ns3\t3\n",
+        )
+
+        other_table = Path("test_priority_batches/other.tsv")
+        other_table.write_text("FILE\tlocus2\ns4\t4\n")
+        with self.assertRaisesRegex(ValueError, "not the same as the columns"):
+            priority_batches.merge_tables([tables[0], other_table], output_table)
+
+    def test_merge_novel_alleles(self) -> None:
+        """Alleles found in several batches should be kept once, with their
+        registered id instead of the provisional ids of the batches"""
+        header = "locus\tallele_id\tprovisional_id\tsha1\tsequence\n"
+        high_1 = Path("test_priority_batches/high_1_novel.tsv")
+        high_1.write_text(header + "locus1\t3\t1\taaa\tATG\nlocus2\t7\t1\tbbb\tATC\n")
+        normal_1 = Path("test_priority_batches/normal_1_novel.tsv")
+        normal_1.write_text(header + "locus1\t4\t1\tccc\tATA\nlocus1\t3\t2\taaa\tATG\n")
+        output_table = Path("test_priority_batches/novel_alleles.tsv")
+        self.assertEqual(
+            priority_batches.merge_novel_alleles([high_1, normal_1], output_table), 3
+        )
+        rows = [line.split("\t") for line in output_table.read_text().splitlines()]
+        self.assertEqual(
+            [row[:2] for row in rows[1:]],
+            [["locus1", "3"], ["locus2", "7"], ["locus1", "4"]],
+        )
+
+        priority_batches.merge_novel_alleles([], output_table)
+        self.assertEqual(output_table.read_text(), header)
+
+
+if __name__ == "__main__":
+    unittest.main()
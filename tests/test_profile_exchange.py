@@ -0,0 +1,158 @@
+import hashlib
+import os
+from pathlib import Path
+import random
+import sqlite3
+import sys
+import unittest
+
+sys.path.append(str(Path(__file__).parent.parent.absolute()))
+from bin import profile_exchange
+
+
+def allele_hash(locus: int, allele: int) -> str:
+    return hashlib.sha1(f"locus{locus}_allele{allele}".encode()).hexdigest()
+
+
+def write_hashed_table(
+    table: Path, num_samples: int, num_loci: int, seed: int = 38
+) -> list[str]:
+    """Profiles of related isolates: most loci have the most common allele,
+    a few have another allele or were not called"""
+    rng = random.Random(seed)
+    lines = ["\t".join(["FILE"] + [f"locus{i}.fasta" for i in range(num_loci)])]
+    for sample in range(num_samples):
+        values = []
+        for locus in range(num_loci):
+            draw = rng.random()
+            if draw < 0.9:
+                values.append(allele_hash(locus, 1))
+            elif draw < 0.97:
+                values.append(allele_hash(locus, rng.randint(2, 6)))
+            else:
+                values.append(rng.choice(["LNF", "PLOT3", "ASM", "NIPHEM"]))
+        lines.append("\t".join([f"sample{sample}.fasta"] + values))
+    table.write_text("\n".join(lines) + "\n")
+    return lines
+
+
+class TestProfileExchange(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        os.system("mkdir -p test_profile_exchange")
+        cls.table = Path("test_profile_exchange/results_alleles_hashed.tsv")
+        cls.lines = write_hashed_table(cls.table, num_samples=300, num_loci=200)
+        Path("test_profile_exchange/scheme_version.yaml").write_text(
+            "scheme: salmonella\nversion: 20220506-101500\n"
+        )
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        os.system("rm -rf test_profile_exchange")
+
+    def test_varint(self) -> None:
+        for value in [0, 1, 127, 128, 300, 2**35]:
+            encoded = profile_exchange.encode_varint(value)
+            self.assertEqual(
+                profile_exchange.decode_varint(encoded, 0), (value, len(encoded))
+            )
+
+    def test_export_and_import_round_trip(self) -> None:
+        for delta in profile_exchange.DELTA_MODES:
+            with self.subTest(delta=delta):
+                exchange_file = Path(f"test_profile_exchange/profiles_{delta}.jcp")
+                num_profiles = profile_exchange.export_profiles(
+                    self.table, exchange_file, "salmonella", delta=delta
+                )
+                self.assertEqual(num_profiles, 300)
+                # Much smaller than the table (and than the gzipped table)
+                self.assertLess(
+                    exchange_file.stat().st_size, self.table.stat().st_size / 20
+                )
+                header = profile_exchange.read_exchange_header(exchange_file)
+                self.assertEqual(header["scheme"], "salmonella")
+                self.assertEqual(header["scheme_version"], "20220506-101500")
+                self.assertEqual(len(header["loci"]), 200)
+                output_table = Path(f"test_profile_exchange/imported_{delta}.tsv")
+                profile_exchange.import_to_table(exchange_file, output_table)
+                self.assertEqual(output_table.read_text(), "\n".join(self.lines) + "\n")
+
+    def test_shared_reference_profile(self) -> None:
+        reference = Path("test_profile_exchange/reference.tsv")
+        reference.write_text("\n".join(self.lines[:2]) + "\n")
+        exchange_file = Path("test_profile_exchange/profiles_shared.jcp")
+        profile_exchange.export_profiles(
+            self.table, exchange_file, "salmonella", reference_file=reference
+        )
+        with self.assertRaisesRegex(ValueError, "shared reference profile"):
+            profile_exchange.import_to_table(
+                exchange_file, Path("test_profile_exchange/no_reference.tsv")
+            )
+        other_reference = Path("test_profile_exchange/other_reference.tsv")
+        other_reference.write_text("\n".join([self.lines[0], self.lines[5]]) + "\n")
+        with self.assertRaisesRegex(ValueError, "is not the one used"):
+            profile_exchange.import_to_table(
+                exchange_file,
+                Path("test_profile_exchange/wrong_reference.tsv"),
+                reference_file=other_reference,
+            )
+        output_table = Path("test_profile_exchange/imported_shared.tsv")
+        profile_exchange.import_to_table(
+            exchange_file, output_table, reference_file=reference
+        )
+        self.assertEqual(output_table.read_text(), "\n".join(self.lines) + "\n")
+
+    def test_import_appends_to_existing_table(self) -> None:
+        exchange_file = Path("test_profile_exchange/profiles_append.jcp")
+        profile_exchange.export_profiles(self.table, exchange_file, "salmonella")
+        output_table = Path("test_profile_exchange/appended.tsv")
+        profile_exchange.import_to_table(exchange_file, output_table)
+        profile_exchange.import_to_table(exchange_file, output_table, append=True)
+        self.assertEqual(
+            output_table.read_text(),
+            "\n".join(self.lines + self.lines[1:]) + "\n",
+        )
+
+    def test_corrupted_file_is_not_imported(self) -> None:
+        exchange_file = Path("test_profile_exchange/profiles.jcp")
+        profile_exchange.export_profiles(self.table, exchange_file, "salmonella")
+        content = exchange_file.read_bytes()
+        truncated = Path("test_profile_exchange/truncated.jcp")
+        truncated.write_bytes(content[: len(content) // 2])
+        output_table = Path("test_profile_exchange/imported_truncated.tsv")
+        with self.assertRaises(ValueError):
+            profile_exchange.import_to_table(truncated, output_table)
+        self.assertFalse(output_table.exists())
+        with self.assertRaises(ValueError):
+            profile_exchange.import_to_table(
+                Path("test_profile_exchange/scheme_version.yaml"), output_table
+            )
+
+    def test_import_to_database(self) -> None:
+        exchange_file = Path("test_profile_exchange/profiles_database.jcp")
+        profile_exchange.export_profiles(self.table, exchange_file, "salmonella")
+        database = Path("test_profile_exchange/profiles.sqlite")
+        self.assertEqual(
+            profile_exchange.import_to_database(exchange_file, database), 300
+        )
+        # Importing the same profiles again replaces them
+        profile_exchange.import_to_database(exchange_file, database)
+        connection = sqlite3.connect(database)
+        rows = connection.execute(
+            "SELECT sample, scheme_version, profile FROM profiles ORDER BY rowid"
+        ).fetchall()
+        connection.close()
+        self.assertEqual(len(rows), 300)
+        self.assertEqual(rows[0][1], "20220506-101500")
+        self.assertEqual("\t".join([rows[0][0], rows[0][2]]), self.lines[1])
+
+        other_table = Path("test_profile_exchange/other_scheme.tsv")
+        write_hashed_table(other_table, num_samples=5, num_loci=10)
+        other_file = Path("test_profile_exchange/other_scheme.jcp")
+        profile_exchange.export_profiles(other_table, other_file, "salmonella")
+        with self.assertRaisesRegex(ValueError, "do not match"):
+            profile_exchange.import_to_database(other_file, database)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,183 @@
+import io
+import os
+from pathlib import Path
+import sys
+import unittest
+import yaml
+
+sys.path.append(str(Path(__file__).parent.parent.absolute()))
+from bin import run_report
+
+BENCHMARK_HEADER = (
+    "s\th:m:s\tmax_rss\tmax_vms\tmax_uss\tmax_pss\tio_in\tio_out\tmean_load\tcpu_time\n"
+)
+
+
+class TestRunReport(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        os.system("mkdir -p test_run_report/log/benchmark/cgmlst_per_batch")
+        os.system("mkdir -p test_run_report/log/cgmlst")
+        os.system("mkdir -p test_run_report/cgmlst/salmonella/batches/normal_1")
+        with open(
+            "test_run_report/log/benchmark/cgmlst_per_batch/salmonella.normal_1.tsv",
+            "w",
+        ) as file_:
+            file_.write(BENCHMARK_HEADER)
+            file_.write("10.0\t0:00:10\t512.5\t600\t500\t505\t20.1\t3.2\t95.0\t9.5\n")
+        with open(
+            "test_run_report/log/cgmlst/chewbbaca_salmonella.normal_1.log", "w"
+        ) as file_:
+            file_.write("+ log_timing allele_call start\n")
+            file_.write("JUNO_TIMING\tallele_call\tstart\t100\n")
+            file_.write("JUNO_TIMING\tchewbbaca:CDS prediction\tstart\t101\n")
+            file_.write("JUNO_TIMING\tchewbbaca:CDS prediction\tend\t104\n")
+            file_.write("JUNO_TIMING\tallele_call\tend\t110\n")
+        os.system(
+            "cp tests/example_output/example_result_chewbbaca.tsv "
+            "test_run_report/cgmlst/salmonella/batches/normal_1/results_alleles.tsv"
+        )
+        os.system("mkdir -p test_run_report/cgmlst/salmonella/batches/high_1")
+        with open(
+            "test_run_report/log/benchmark/cgmlst_per_batch/salmonella.high_1.tsv",
+            "w",
+        ) as file_:
+            file_.write(BENCHMARK_HEADER)
+            file_.write("10.0\t0:00:10\t700.0\t800\t650\t655\t10.0\t1.0\t90.0\t8.5\n")
+        os.system(
+            "cp tests/example_output/example_result_chewbbaca.tsv "
+            "test_run_report/cgmlst/salmonella/batches/high_1/results_alleles.tsv"
+        )
+        os.system("mkdir -p test_run_report/log/benchmark/triage_per_batch")
+        os.system("mkdir -p test_run_report/log/triage")
+        os.system("mkdir -p test_run_report/triage/salmonella/batches/high_1")
+        with open(
+            "test_run_report/log/benchmark/triage_per_batch/salmonella.high_1.tsv",
+            "w",
+        ) as file_:
+            file_.write(BENCHMARK_HEADER)
+            file_.write("4.0\t0:00:04\t300.0\t400\t250\t255\t5.0\t1.0\t80.0\t3.5\n")
+        with open(
+            "test_run_report/log/triage/chewbbaca_salmonella.high_1.log", "w"
+        ) as file_:
+            file_.write("JUNO_TIMING\tchewbbaca:BLASTp\tstart\t200\n")
+            file_.write("JUNO_TIMING\tchewbbaca:BLASTp\tend\t202\n")
+        os.system(
+            "cp tests/example_output/example_result_chewbbaca.tsv "
+            "test_run_report/triage/salmonella/batches/high_1/results_alleles.tsv"
+        )
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        os.system("rm -rf test_run_report")
+
+    def test_chewbbaca_sections_get_timing_markers(self) -> None:
+        """Every section header in the chewBBACA output should start a new
+        stage (and end the previous one) without changing the output itself
+        """
+        chewbbaca_output = "Started\n== CDS prediction ==\nfoo\n== BLASTp ==\nbar\n"
+        output = io.StringIO()
+        run_report.mark_stages(io.StringIO(chewbbaca_output), output)
+        lines = output.getvalue().splitlines()
+        markers = [line.split("\t")[1:3] for line in lines if "JUNO_TIMING" in line]
+        self.assertEqual(
+            markers,
+            [
+                ["chewbbaca:CDS prediction", "start"],
+                ["chewbbaca:CDS prediction", "end"],
+                ["chewbbaca:BLASTp", "start"],
+                ["chewbbaca:BLASTp", "end"],
+            ],
+        )
+        other_lines = [line for line in lines if "JUNO_TIMING" not in line]
+        self.assertEqual(other_lines, chewbbaca_output.splitlines())
+
+    def test_report_combines_benchmark_logs_and_results(self) -> None:
+        """The report per batch should contain the benchmark measurements,
+        the duration of the stages and the throughput
+        """
+        report = run_report.RunReport(
+            output_dir=Path("test_run_report"), extra_timings={"download": 1.234}
+        ).collect()
+        salmonella = report["rules"]["cgmlst_per_batch"]["salmonella.normal_1"]
+        self.assertEqual(salmonella["wall_time_s"], 10.0)
+        self.assertEqual(salmonella["max_rss_mb"], 512.5)
+        self.assertEqual(salmonella["cpu_time_s"], 9.5)
+        self.assertEqual(
+            salmonella["stages_s"], {"allele_call": 10, "chewbbaca:CDS prediction": 3}
+        )
+        self.assertEqual(salmonella["samples"], 2)
+        self.assertEqual(salmonella["loci"], 5)
+        self.assertEqual(salmonella["samples_per_s"], 0.2)
+        self.assertEqual(salmonella["loci_per_s"], 1.0)
+        self.assertEqual(report["timings_s"], {"download": 1.23})
+        self.assertNotIn("status", report)
+
+    def test_report_sums_batches_per_scheme(self) -> None:
+        """The report per scheme should add up the batches of the scheme and
+        keep the highest peak memory
+        """
+        report = run_report.RunReport(output_dir=Path("test_run_report")).collect()
+        salmonella = report["rules"]["cgmlst_per_scheme"]["salmonella"]
+        self.assertEqual(salmonella["batches"], 2)
+        self.assertEqual(salmonella["wall_time_s"], 20.0)
+        self.assertEqual(salmonella["cpu_time_s"], 18.0)
+        self.assertEqual(salmonella["max_rss_mb"], 700.0)
+        self.assertEqual(salmonella["samples"], 4)
+        self.assertEqual(salmonella["loci"], 5)
+        self.assertEqual(salmonella["samples_per_s"], 0.2)
+        self.assertEqual(
+            salmonella["stages_s"], {"allele_call": 10, "chewbbaca:CDS prediction": 3}
+        )
+
+    def test_report_includes_triage(self) -> None:
+        """The triage batches should get the same stage timings and
+        throughput as the allele calling
+        """
+        report = run_report.RunReport(output_dir=Path("test_run_report")).collect()
+        triage = report["rules"]["triage_per_batch"]["salmonella.high_1"]
+        self.assertEqual(triage["stages_s"], {"chewbbaca:BLASTp": 2})
+        self.assertEqual(triage["samples_per_s"], 0.5)
+        self.assertEqual(
+            report["rules"]["triage_per_scheme"]["salmonella"]["wall_time_s"], 4.0
+        )
+
+    def test_report_of_failed_run(self) -> None:
+        """Failed runs also get a report, marked as failed"""
+        report = run_report.RunReport(
+            output_dir=Path("test_run_report"), succeeded=False
+        ).collect()
+        self.assertEqual(report["status"], "failed")
+        self.assertIn("salmonella.normal_1", report["rules"]["cgmlst_per_batch"])
+
+    def test_compare_reports(self) -> None:
+        """The comparison should show the relative change between runs"""
+        for run, wall_time in [("run1", 10.0), ("run2", 15.0)]:
+            with open(f"test_run_report/{run}.yaml", "w") as file_:
+                yaml.dump(
+                    {
+                        "rules": {
+                            "cgmlst_per_batch": {
+                                "salmonella.normal_1": {"wall_time_s": wall_time}
+                            }
+                        }
+                    },
+                    file_,
+                )
+        table = run_report.compare_reports(
+            [Path("test_run_report/run1.yaml"), Path("test_run_report/run2.yaml")]
+        )
+        self.assertEqual(
+            table[1],
+            [
+                "cgmlst_per_batch",
+                "salmonella.normal_1",
+                "10.0",
+                "15.0",
+                "+50.0%",
+            ],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
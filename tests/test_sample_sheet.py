@@ -0,0 +1,72 @@
+import os
+from pathlib import Path
+import sys
+import unittest
+
+sys.path.append(str(Path(__file__).parent.parent.absolute()))
+from bin import sample_sheet
+
+
+class TestSampleSheet(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        os.system("mkdir -p test_sample_sheet")
+        with open("test_sample_sheet/sample_sheet.yaml", "w") as file_:
+            file_.write(
+                "sample1:\n  assembly: sample1.fasta\n  genus: salmonella\n"
+                "  cgmlst_scheme:\n  - salmonella\n"
+                "sample2:\n  assembly: sample2.fasta\n  genus: listeria\n"
+                "  cgmlst_scheme:\n  - listeria\n  - listeria_optional\n"
+                "sample3:\n  assembly: sample3.fasta\n  genus: unknown\n"
+                "  cgmlst_scheme: ''\n"
+                "sample4:\n  assembly: sample4.fasta\n  genus: listeria\n"
+                "  cgmlst_scheme:\n  - listeria\n  - listeria_optional\n"
+            )
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        os.system("rm -rf test_sample_sheet")
+
+    def test_yaml_sample_sheet_is_read_per_column(self) -> None:
+        samples = sample_sheet.load_sample_sheet(
+            Path("test_sample_sheet/sample_sheet.yaml")
+        )
+        self.assertEqual(samples.samples, ["sample1", "sample2", "sample3", "sample4"])
+        self.assertEqual(samples.genera[1], "listeria")
+        self.assertEqual(
+            samples.rows_per_scheme,
+            {"salmonella": [0], "listeria": [1, 3], "listeria_optional": [1, 3]},
+        )
+
+    def test_compact_sample_sheet_has_the_same_content(self) -> None:
+        samples = sample_sheet.load_sample_sheet(
+            Path("test_sample_sheet/sample_sheet.yaml")
+        )
+        samples.write(Path("test_sample_sheet/sample_sheet.json"))
+        compact_samples = sample_sheet.load_sample_sheet(
+            Path("test_sample_sheet/sample_sheet.json")
+        )
+        self.assertEqual(samples, compact_samples)
+
+    def test_other_json_files_are_not_accepted(self) -> None:
+        with open("test_sample_sheet/other.json", "w") as file_:
+            file_.write('{"sample1": {"assembly": "sample1.fasta"}}')
+        with self.assertRaises(ValueError):
+            sample_sheet.load_sample_sheet(Path("test_sample_sheet/other.json"))
+
+    def test_samples_per_scheme(self) -> None:
+        samples = sample_sheet.load_sample_sheet(
+            Path("test_sample_sheet/sample_sheet.yaml")
+        )
+        counts = samples.write_samples_per_scheme(Path("test_sample_sheet"))
+        self.assertEqual(
+            counts, {"salmonella": 1, "listeria": 2, "listeria_optional": 2}
+        )
+        self.assertEqual(
+            Path("test_sample_sheet/listeria_optional_samples.txt").read_text(),
+            "sample2.fasta\nsample4.fasta\n",
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
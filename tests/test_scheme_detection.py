@@ -0,0 +1,188 @@
+import os
+from pathlib import Path
+import random
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).parent.parent.absolute()))
+from bin import scheme_detection
+
+
+def random_sequence(rng: random.Random, length: int) -> str:
+    return "".join(rng.choice("ACGT") for _ in range(length))
+
+
+def reverse_complement(sequence: str) -> str:
+    return sequence.translate(str.maketrans("ACGT", "TGCA"))[::-1]
+
+
+class TestSchemeDetection(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        os.system("mkdir -p test_scheme_detection")
+        rng = random.Random(37)
+        cls.db_dir = Path("test_scheme_detection/db")
+        genomes = {}
+        for scheme in ["listeria", "salmonella"]:
+            loci = [random_sequence(rng, 600) for _ in range(20)]
+            scheme_dir = cls.db_dir.joinpath("prepared_schemes", scheme)
+            scheme_dir.mkdir(parents=True, exist_ok=True)
+            for number, locus in enumerate(loci, start=1):
+                # A second allele with a SNP, which should not be part of the
+                # signature
+                allele2 = (
+                    locus[:300] + ("A" if locus[300] != "A" else "C") + locus[301:]
+                )
+                scheme_dir.joinpath(f"{scheme}_{number}.fasta").write_text(
+                    f">{scheme}_{number}_1\n{locus}\n>{scheme}_{number}_2\n{allele2}\n"
+                )
+            genomes[scheme] = "".join(
+                random_sequence(rng, 200) + locus for locus in loci
+            )
+        # The loci of the listeria isolate are on two contigs, one of them
+        # reverse complemented
+        half = len(genomes["listeria"]) // 2
+        Path("test_scheme_detection/listeria_isolate.fasta").write_text(
+            f">contig1\n{genomes['listeria'][:half]}\n"
+            f">contig2\n{reverse_complement(genomes['listeria'][half:])}\n"
+        )
+        Path("test_scheme_detection/salmonella_isolate.fasta").write_text(
+            f">contig1\n{genomes['salmonella']}\n"
+        )
+        # Isolate with only a quarter of the salmonella loci
+        Path("test_scheme_detection/partial_isolate.fasta").write_text(
+            f">contig1\n{genomes['salmonella'][: len(genomes['salmonella']) // 4]}\n"
+        )
+        cls.assemblies = {
+            sample: Path(f"test_scheme_detection/{sample}_isolate.fasta")
+            for sample in ["listeria", "salmonella", "partial"]
+        }
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        os.system("rm -rf test_scheme_detection")
+
+    def test_sketch_is_strand_independent_and_skips_ambiguous_kmers(self) -> None:
+        rng = random.Random(1)
+        sequence = random_sequence(rng, 5000)
+        sketch = scheme_detection.sketch_sequences([sequence], kmer_size=21, scaled=1)
+        self.assertEqual(len(sketch), 5000 - 21 + 1)
+        self.assertTrue(
+            np.array_equal(
+                sketch,
+                scheme_detection.sketch_sequences(
+                    [reverse_complement(sequence)], kmer_size=21, scaled=1
+                ),
+            )
+        )
+        with_n = sequence[:2500] + "N" + sequence[2501:]
+        self.assertEqual(
+            len(scheme_detection.sketch_sequences([with_n], kmer_size=21, scaled=1)),
+            5000 - 21 + 1 - 21,
+        )
+        self.assertLess(
+            len(scheme_detection.sketch_sequences([sequence], kmer_size=21, scaled=10)),
+            len(sketch) / 5,
+        )
+
+    def test_signature_is_saved_and_reused(self) -> None:
+        signatures = scheme_detection.SchemeSignatures(self.db_dir, scaled=2)
+        signature = signatures.get("listeria")
+        self.assertIsNotNone(signature)
+        self.assertTrue(
+            self.db_dir.joinpath("scheme_signatures", "listeria.npz").is_file()
+        )
+        self.assertIsNone(signatures.get("campylobacter"))
+        reloaded = scheme_detection.SchemeSignatures(self.db_dir, scaled=2)
+        self.assertTrue(np.array_equal(reloaded.get("listeria"), signature))
+
+    def test_signature_is_rebuilt_when_scheme_changed(self) -> None:
+        scheme_dir = self.db_dir.joinpath("prepared_schemes", "salmonella")
+        signature = scheme_detection.SchemeSignatures(self.db_dir, scaled=2).get(
+            "salmonella"
+        )
+        # Scheme downloaded (and prepared) again with another first locus
+        first_locus = scheme_dir.joinpath("salmonella_1.fasta")
+        original = first_locus.read_text()
+        rng = random.Random(2)
+        first_locus.write_text(f">salmonella_1_1\n{random_sequence(rng, 1000)}\n")
+        try:
+            rebuilt = scheme_detection.SchemeSignatures(self.db_dir, scaled=2).get(
+                "salmonella"
+            )
+            self.assertFalse(np.array_equal(rebuilt, signature))
+        finally:
+            first_locus.write_text(original)
+        restored = scheme_detection.SchemeSignatures(self.db_dir, scaled=2).get(
+            "salmonella"
+        )
+        self.assertTrue(np.array_equal(restored, signature))
+
+    def test_every_sample_gets_the_schemes_found_in_its_assembly(self) -> None:
+        signatures = scheme_detection.SchemeSignatures(self.db_dir, scaled=2)
+        detection = scheme_detection.SchemeDetection(
+            signatures,
+            min_containment=0.5,
+            unsure_containment=0.1,
+            overrides={"override": ["salmonella"]},
+            threads=2,
+        )
+        assemblies = dict(self.assemblies, override=self.assemblies["listeria"])
+        candidates = {
+            "listeria": ["listeria", "salmonella"],
+            "salmonella": ["listeria", "salmonella", "campylobacter"],
+            "partial": ["salmonella"],
+            "override": ["listeria"],
+        }
+        results = {
+            result["sample"]: result
+            for result in detection.detect(assemblies, candidates)
+        }
+        self.assertEqual(results["listeria"]["status"], "detected")
+        self.assertEqual(results["listeria"]["cgmlst_scheme"], ["listeria"])
+        self.assertGreater(results["listeria"]["containment"]["listeria"], 0.95)
+        self.assertLess(results["listeria"]["containment"]["salmonella"], 0.05)
+        # The campylobacter scheme is not available, so it cannot be ruled out
+        self.assertEqual(results["salmonella"]["status"], "unsure")
+        self.assertEqual(
+            results["salmonella"]["cgmlst_scheme"], ["salmonella", "campylobacter"]
+        )
+        self.assertEqual(results["partial"]["status"], "unsure")
+        self.assertEqual(results["partial"]["cgmlst_scheme"], ["salmonella"])
+        self.assertEqual(results["override"]["status"], "override")
+        self.assertEqual(results["override"]["cgmlst_scheme"], ["salmonella"])
+
+        report = Path("test_scheme_detection/scheme_detection.tsv")
+        scheme_detection.write_detection_report(list(results.values()), report)
+        lines = report.read_text().splitlines()
+        self.assertEqual(lines[0], "sample\tstatus\tcgmlst_scheme\tcontainment")
+        self.assertEqual(len(lines), 5)
+
+    def test_not_detected(self) -> None:
+        signatures = scheme_detection.SchemeSignatures(self.db_dir, scaled=2)
+        detection = scheme_detection.SchemeDetection(signatures)
+        result = detection.detect(
+            {"listeria": self.assemblies["listeria"]}, {"listeria": ["salmonella"]}
+        )[0]
+        self.assertEqual(result["status"], "not_detected")
+        self.assertEqual(result["cgmlst_scheme"], [])
+
+    def test_read_overrides(self) -> None:
+        override_file = Path("test_scheme_detection/overrides.tsv")
+        override_file.write_text(
+            "# sample\tschemes\nsample1\tSalmonella\nsample2\tescherichia, shigella\nsample3\n"
+        )
+        self.assertEqual(
+            scheme_detection.read_overrides(override_file),
+            {
+                "sample1": ["salmonella"],
+                "sample2": ["escherichia", "shigella"],
+                "sample3": [],
+            },
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
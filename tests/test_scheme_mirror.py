@@ -0,0 +1,72 @@
+import os
+from pathlib import Path
+import sys
+import time
+import unittest
+
+sys.path.append(str(Path(__file__).parent.parent.absolute()))
+from bin import scheme_mirror
+
+
+class TestSchemeMirror(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        os.system("mkdir -p test_scheme_mirror")
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        os.system("rm -rf test_scheme_mirror")
+
+    def test_mirror_url_keeps_host_and_path(self) -> None:
+        """The urls in the mirror should keep the host and path of the source
+        and accept local directories, file:// and http:// mirrors
+        """
+        url = "https://rest.pubmlst.org/db/pubmlst_campylobacter_seqdef/schemes/4"
+        self.assertEqual(
+            scheme_mirror.mirror_url(url, "http://gateway:8000/"),
+            "http://gateway:8000/rest.pubmlst.org/db/pubmlst_campylobacter_seqdef/schemes/4",
+        )
+        self.assertEqual(
+            scheme_mirror.mirror_url(url, "/mnt/mirror"),
+            "file:///mnt/mirror/rest.pubmlst.org/db/pubmlst_campylobacter_seqdef/schemes/4",
+        )
+
+    def test_directory_listings_are_saved_as_index_html(self) -> None:
+        mirror_dir = Path("test_scheme_mirror/mirror")
+        listing_url = "http://enterobase.warwick.ac.uk/schemes/Salmonella.cgMLSTv2/"
+        self.assertEqual(
+            scheme_mirror.mirror_path(listing_url, mirror_dir),
+            mirror_dir.joinpath(
+                "enterobase.warwick.ac.uk",
+                "schemes",
+                "Salmonella.cgMLSTv2",
+                "index.html",
+            ),
+        )
+        listing_file = scheme_mirror.mirror_path(listing_url, mirror_dir)
+        listing_file.parent.mkdir(parents=True)
+        listing_file.write_text("<a>locus.fasta.gz</a>")
+        self.assertEqual(
+            scheme_mirror.local_file_from_url(
+                scheme_mirror.mirror_url(listing_url, str(mirror_dir))
+            ),
+            listing_file.absolute(),
+        )
+
+    def test_catalog_cache_expires_after_ttl(self) -> None:
+        """A cached catalog should be returned until its time to live is over"""
+        url = "http://enterobase.warwick.ac.uk/schemes/Salmonella.cgMLSTv2/"
+        catalog = [url + "locus1.fasta.gz", url + "locus2.fasta.gz"]
+        cache = scheme_mirror.CatalogCache(
+            Path("test_scheme_mirror/cache"), ttl_seconds=1
+        )
+        self.assertIsNone(cache.get(url))
+        cache.put(url, catalog)
+        self.assertEqual(cache.get(url), catalog)
+        self.assertIsNone(cache.get(url + "other"))
+        time.sleep(1.1)
+        self.assertIsNone(cache.get(url))
+
+
+if __name__ == "__main__":
+    unittest.main()
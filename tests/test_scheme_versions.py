@@ -0,0 +1,156 @@
+from datetime import datetime
+import os
+from pathlib import Path
+import sys
+import unittest
+
+sys.path.append(str(Path(__file__).parent.parent.absolute()))
+from bin import scheme_versions
+
+DB_DIR = Path("test_scheme_versions")
+
+
+def write_file(file_path: Path, content: str) -> None:
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+    file_path.write_text(content)
+
+
+class TestSchemeVersions(unittest.TestCase):
+    def setUp(self) -> None:
+        downloaded_dir = DB_DIR.joinpath("downloaded_schemes", "salmonella")
+        write_file(downloaded_dir.joinpath("locus1.fasta"), ">locus1_1\nATGTAA\n")
+        write_file(downloaded_dir.joinpath("locus2.fasta"), ">locus2_1\nATGCCCTAA\n")
+        write_file(
+            downloaded_dir.joinpath("downloaded_scheme.yaml"),
+            "genus: salmonella\ntimestamp: 06-05-2022 10:15:00\n",
+        )
+        prepared_dir = DB_DIR.joinpath("prepared_schemes", "salmonella")
+        write_file(prepared_dir.joinpath("locus1.fasta"), ">1\nATGTAA\n")
+        write_file(prepared_dir.joinpath("short", "locus1_short.fasta"), ">1\nATGTAA\n")
+        self.store = scheme_versions.SchemeVersions(DB_DIR)
+
+    def tearDown(self) -> None:
+        os.system(f"chmod -R u+w {DB_DIR} 2> /dev/null; rm -rf {DB_DIR}")
+
+    def test_version_is_named_after_download_time(self) -> None:
+        manifest = self.store.snapshot("salmonella")
+        self.assertEqual(manifest["version"], "20220506-101500")
+        self.assertTrue(manifest["prepared"])
+        self.assertEqual(manifest["download"]["genus"], "salmonella")
+        self.assertEqual(self.store.list_versions("salmonella"), ["20220506-101500"])
+        self.assertEqual(self.store.current_version("salmonella"), "20220506-101500")
+        version_dir = self.store.version_dir("salmonella", "20220506-101500")
+        self.assertEqual(
+            version_dir.joinpath("prepared", "short", "locus1_short.fasta").read_text(),
+            ">1\nATGTAA\n",
+        )
+
+    def test_unchanged_files_are_shared_between_versions(self) -> None:
+        """Only the loci that changed should take space in a new version. The
+        other files are hard links to the same stored file"""
+        self.store.snapshot("salmonella", "v1")
+        DB_DIR.joinpath("downloaded_schemes", "salmonella", "locus2.fasta").write_text(
+            ">locus2_1\nATGCCCTAA\n>locus2_2\nATGCCGTAA\n"
+        )
+        manifest = self.store.snapshot("salmonella", "v2")
+        v1_dir = self.store.version_dir("salmonella", "v1")
+        v2_dir = self.store.version_dir("salmonella", "v2")
+        self.assertEqual(
+            v1_dir.joinpath("downloaded", "locus1.fasta").stat().st_ino,
+            v2_dir.joinpath("downloaded", "locus1.fasta").stat().st_ino,
+        )
+        self.assertNotEqual(
+            v1_dir.joinpath("downloaded", "locus2.fasta").stat().st_ino,
+            v2_dir.joinpath("downloaded", "locus2.fasta").stat().st_ino,
+        )
+        self.assertEqual(manifest["new_mb"], 0.0)
+        self.assertIn(
+            "locus2_2", v2_dir.joinpath("downloaded", "locus2.fasta").read_text()
+        )
+        self.assertNotIn(
+            "locus2_2", v1_dir.joinpath("downloaded", "locus2.fasta").read_text()
+        )
+        # locus1.fasta in the downloaded and prepared schemes differ but the
+        # prepared locus1.fasta and its short version are stored only once
+        stored_files = [
+            path
+            for path in DB_DIR.joinpath("scheme_store").rglob("*")
+            if path.is_file()
+        ]
+        self.assertEqual(len(stored_files), 5)
+        for stored_file in stored_files:
+            self.assertEqual(stored_file.stat().st_mode & 0o222, 0)
+
+    def test_prepared_scheme_is_shared(self) -> None:
+        """The prepared scheme is stored once and shared by all versions, so
+        an unchanged version takes no extra space"""
+        self.store.snapshot("salmonella", "v1")
+        manifest = self.store.snapshot("salmonella", "v2")
+        v1_file = self.store.version_dir("salmonella", "v1").joinpath(
+            "prepared", "locus1.fasta"
+        )
+        v2_file = self.store.version_dir("salmonella", "v2").joinpath(
+            "prepared", "locus1.fasta"
+        )
+        self.assertEqual(v1_file.stat().st_ino, v2_file.stat().st_ino)
+        self.assertEqual(manifest["new_mb"], 0)
+        self.assertEqual(v1_file.stat().st_mode & 0o222, 0)
+
+    def test_database_with_only_a_prepared_scheme(self) -> None:
+        """Without downloaded_scheme.yaml the version is named after the
+        oldest file of the prepared scheme"""
+        os.system(f"rm -rf {DB_DIR.joinpath('downloaded_schemes')}")
+        prepared_dir = DB_DIR.joinpath("prepared_schemes", "salmonella")
+        os.utime(prepared_dir.joinpath("locus1.fasta"), (1651824900, 1651824900))
+        expected_name = datetime.fromtimestamp(1651824900).strftime("%Y%m%d-%H%M%S")
+        self.assertIsNone(self.store.current_version("salmonella"))
+        manifest = self.store.snapshot("salmonella")
+        self.assertEqual(manifest["version"], expected_name)
+        self.assertNotIn("download", manifest)
+        self.assertEqual(self.store.current_version("salmonella"), expected_name)
+        # Adding a file to the prepared scheme does not change the name
+        prepared_dir.joinpath("locus2.fasta").write_text(">1\nATGCCCTAA\n")
+        self.assertEqual(self.store.default_version_name("salmonella"), expected_name)
+        self.assertIsNone(self.store.current_version("salmonella"))
+        with self.assertRaises(FileNotFoundError):
+            self.store.default_version_name("listeria")
+
+    def test_versions_cannot_be_modified(self) -> None:
+        self.store.snapshot("salmonella", "v1")
+        # Saving the same content again is allowed
+        self.store.snapshot("salmonella", "v1")
+        DB_DIR.joinpath("downloaded_schemes", "salmonella", "locus3.fasta").write_text(
+            ">locus3_1\nATGTGA\n"
+        )
+        with self.assertRaises(ValueError):
+            self.store.snapshot("salmonella", "v1")
+        self.assertIsNone(self.store.current_version("salmonella"))
+
+    def test_changed_scheme_gets_numbered_version(self) -> None:
+        """If a scheme is prepared after its download was already saved, the
+        new content is saved with a numbered version name"""
+        DB_DIR.joinpath("prepared_schemes", "salmonella", "salmonella.trn").write_text(
+            "training"
+        )
+        self.store.snapshot("salmonella")
+        DB_DIR.joinpath("prepared_schemes", "salmonella", "locus2.fasta").write_text(
+            ">1\nATGCCCTAA\n"
+        )
+        manifest = self.store.snapshot("salmonella")
+        self.assertEqual(manifest["version"], "20220506-101500.2")
+        self.assertEqual(self.store.current_version("salmonella"), "20220506-101500.2")
+
+    def test_missing_version(self) -> None:
+        with self.assertRaises(ValueError):
+            self.store.read_manifest("salmonella", "v1")
+
+    def test_version_selector(self) -> None:
+        self.assertEqual(
+            scheme_versions.parse_version_selector(["v1", "Listeria=v2"]),
+            {"*": "v1", "listeria": "v2"},
+        )
+        self.assertEqual(scheme_versions.parse_version_selector(None), {})
+
+
+if __name__ == "__main__":
+    unittest.main()
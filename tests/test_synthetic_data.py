@@ -0,0 +1,68 @@
+import os
+from pathlib import Path
+import sys
+import unittest
+
+sys.path.append(str(Path(__file__).parent.parent.absolute()))
+from benchmarks import synthetic_data
+
+
+class TestSyntheticData(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        os.system("mkdir -p test_synthetic_data")
+        cls.scheme = synthetic_data.make_scheme(
+            Path("test_synthetic_data/scheme"),
+            num_loci=5,
+            num_alleles=4,
+            locus_length=90,
+        )
+        cls.truth_file = synthetic_data.make_assemblies(
+            Path("test_synthetic_data/assemblies"),
+            cls.scheme,
+            num_samples=3,
+            missing_fraction=0.2,
+        )
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        os.system("rm -rf test_synthetic_data")
+
+    def test_alleles_are_unique_coding_sequences(self) -> None:
+        """Every allele should start with a start codon, end with a stop codon
+        and not contain internal stop codons so that chewBBACA can use them
+        """
+        for locus, alleles in self.scheme.items():
+            self.assertEqual(len(set(alleles)), 4, locus)
+            for allele in alleles:
+                codons = [allele[i : i + 3] for i in range(0, len(allele), 3)]
+                self.assertEqual(codons[0], "ATG")
+                self.assertIn(codons[-1], synthetic_data.STOP_CODONS)
+                for codon in codons[1:-1]:
+                    self.assertNotIn(codon, synthetic_data.STOP_CODONS)
+        with open("test_synthetic_data/scheme/locus1.fasta") as file_:
+            self.assertEqual(file_.readline(), ">locus1_1\n")
+
+    def test_assemblies_contain_the_alleles_of_the_truth_table(self) -> None:
+        """The alleles in the truth table should be present in the assembly
+        of every sample (and missing loci should be marked as LNF)
+        """
+        with open(self.truth_file) as file_:
+            header = file_.readline().rstrip("\n").split("\t")
+            rows = [line.rstrip("\n").split("\t") for line in file_]
+        self.assertEqual(header[1:], [f"locus{i}.fasta" for i in range(1, 6)])
+        self.assertEqual([row[0] for row in rows], ["sample1", "sample2", "sample3"])
+        for row in rows:
+            with open(f"test_synthetic_data/assemblies/{row[0]}.fasta") as file_:
+                assembly = "".join(
+                    line.strip() for line in file_ if not line.startswith(">")
+                )
+            for locus_file, allele in zip(header[1:], row[1:]):
+                if allele == synthetic_data.MISSING_LABEL:
+                    continue
+                locus = locus_file.replace(".fasta", "")
+                self.assertIn(self.scheme[locus][int(allele) - 1], assembly)
+
+
+if __name__ == "__main__":
+    unittest.main()
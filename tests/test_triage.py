@@ -0,0 +1,147 @@
+from collections import Counter
+import os
+from pathlib import Path
+import sys
+import unittest
+
+sys.path.append(str(Path(__file__).parent.parent.absolute()))
+from bin import triage
+
+HISTORY = (
+    "FILE\tconstant.fasta\tlocus1.fasta\tlocus2.fasta\tlocus3.fasta\tmissing.fasta\n"
+    "hist1.fasta\t1\t1\t1\t1\tLNF\n"
+    "hist2.fasta\t1\t1\t1\t2\tLNF\n"
+    "hist3.fasta\t1\t5\t6\t7\tLNF\n"
+    "hist4.fasta\t1\t5\t6\tINF-8\t3\n"
+)
+
+
+class TestTriage(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        os.system("mkdir -p test_triage")
+        Path("test_triage/history.tsv").write_text(HISTORY)
+        Path("test_triage/clusters.tsv").write_text(
+            "hist1\tCT1\nhist2\tCT1\nhist3\tCT2\nhist4\tCT2\n"
+        )
+        Path("test_triage/triage_results.tsv").write_text(
+            "FILE\tlocus1.fasta\tlocus2.fasta\tlocus3.fasta\n"
+            "new1.fasta\t1\t1\t1\n"
+            "new2.fasta\t9\t9\t9\n"
+            "new3.fasta\tLNF\tLNF\t1\n"
+            "new5.fasta\t1\t6\t9\n"
+        )
+        Path("test_triage/input_files.txt").write_text(
+            "/cds/new1.fasta\n/cds/new2.fasta\n/cds/new3.fasta\n/cds/new4.fasta\n"
+            "/cds/new5.fasta\n"
+        )
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        os.system("rm -rf test_triage")
+
+    def test_simpson_diversity(self) -> None:
+        self.assertEqual(triage.simpson_diversity(Counter({"1": 4})), 0.0)
+        self.assertEqual(triage.simpson_diversity(Counter({"1": 1, "2": 1})), 1.0)
+        self.assertAlmostEqual(
+            triage.simpson_diversity(Counter({"1": 2, "2": 2})), 2 / 3
+        )
+
+    def test_panel_has_most_discriminatory_loci(self) -> None:
+        """Loci that are often missing or do not discriminate should not be
+        in the panel"""
+        panel = triage.build_panel(
+            [Path("test_triage/history.tsv")], panel_size=2, min_called_fraction=0.9
+        )
+        self.assertEqual(panel, ["locus3", "locus1"])
+
+    def test_nearest_cluster_and_full_call(self) -> None:
+        panel = ["locus1", "locus2", "locus3"]
+        num_references = triage.write_panel(
+            Path("test_triage/panel"),
+            panel,
+            [Path("test_triage/history.tsv")],
+            triage.read_clusters(Path("test_triage/clusters.tsv")),
+        )
+        self.assertEqual(num_references, 4)
+        report = triage.TriagePanel(Path("test_triage/panel")).classify(
+            Path("test_triage/triage_results.tsv"),
+            close_distance=2,
+            ambiguity_margin=0.5,
+            max_missing_fraction=0.4,
+        )
+        report_per_sample = {row["sample"]: row for row in report}
+        self.assertEqual(report_per_sample["new1"]["nearest_cluster"], "CT1")
+        self.assertEqual(report_per_sample["new1"]["nearest_reference"], "hist1")
+        self.assertEqual(report_per_sample["new1"]["distance"], 0.0)
+        self.assertEqual(report_per_sample["new1"]["second_cluster"], "CT2")
+        self.assertEqual(report_per_sample["new1"]["status"], "close")
+        # Different from all references at all loci: at the same distance
+        # of both clusters, but far from both
+        self.assertEqual(report_per_sample["new2"]["distance"], 3.0)
+        self.assertEqual(report_per_sample["new2"]["second_distance"], 3.0)
+        self.assertEqual(report_per_sample["new2"]["status"], "distant")
+        # Close to both clusters at the same distance
+        self.assertEqual(report_per_sample["new5"]["distance"], 2.0)
+        self.assertEqual(report_per_sample["new5"]["second_distance"], 2.0)
+        self.assertEqual(report_per_sample["new5"]["status"], "ambiguous")
+        self.assertEqual(report_per_sample["new3"]["called_panel_loci"], 1)
+        self.assertEqual(report_per_sample["new3"]["status"], "incomplete")
+
+        triage.write_report(report, Path("test_triage/triage_report.tsv"))
+        num_full_call = triage.write_full_call_list(
+            report,
+            Path("test_triage/input_files.txt"),
+            Path("test_triage/full_call.txt"),
+        )
+        self.assertEqual(num_full_call, 4)
+
+    def test_sample_names_with_dots(self) -> None:
+        """Only the fasta extension is removed from the file names"""
+        self.assertEqual(triage.sample_name("/cds/2023.001.fasta"), "2023.001")
+        self.assertEqual(triage.sample_name("2023.002.fa"), "2023.002")
+        self.assertEqual(triage.sample_name("2023.003"), "2023.003")
+        Path("test_triage/dotted_input_files.txt").write_text(
+            "/cds/2023.001.fasta\n/cds/2023.002.fasta\n"
+        )
+        report = [
+            {"sample": "2023.001", "full_call": "no"},
+            {"sample": "2023.002", "full_call": "yes"},
+        ]
+        triage.write_full_call_list(
+            report,
+            Path("test_triage/dotted_input_files.txt"),
+            Path("test_triage/dotted_full_call.txt"),
+        )
+        self.assertEqual(
+            Path("test_triage/dotted_full_call.txt").read_text(),
+            "/cds/2023.002.fasta\n",
+        )
+
+    def test_distant_isolates_are_not_fully_typed(self) -> None:
+        triage.write_panel(
+            Path("test_triage/panel"),
+            ["locus1", "locus2", "locus3"],
+            [Path("test_triage/history.tsv")],
+            triage.read_clusters(Path("test_triage/clusters.tsv")),
+        )
+        report = triage.TriagePanel(Path("test_triage/panel")).classify(
+            Path("test_triage/triage_results.tsv"),
+            close_distance=0,
+            ambiguity_margin=-1,
+            max_missing_fraction=1,
+        )
+        report_per_sample = {row["sample"]: row for row in report}
+        self.assertEqual(report_per_sample["new2"]["status"], "distant")
+        self.assertEqual(report_per_sample["new2"]["full_call"], "no")
+        triage.write_full_call_list(
+            report,
+            Path("test_triage/input_files.txt"),
+            Path("test_triage/full_call.txt"),
+        )
+        self.assertNotIn("new2.fasta", Path("test_triage/full_call.txt").read_text())
+        self.assertIn("new4.fasta", Path("test_triage/full_call.txt").read_text())
+
+
+if __name__ == "__main__":
+    unittest.main()